@@ -56,6 +56,7 @@ interface SmartWalletChecker:
 storageUInt256: HashMap[bytes32, uint256]
 storageAddress: HashMap[bytes32, address]
 storageBool: HashMap[bytes32, bool]
+packed_settings: uint256  # see the *_FLAG, *_SHIFT and *_SIZE constants
 
 
 DEPOSIT_FOR_TYPE: constant(int128) = 0
@@ -91,6 +92,13 @@ EPOCH_SECONDS: constant(uint256) = 24 * 3600  # all future times are rounded by
 # EPOCH_SECONDS: constant(uint256) = 600
 MAXTIME: constant(uint256) = 4 * 365 * 86400  # 4 years
 MULTIPLIER: constant(uint256) = 10 ** 18
+# the supply area of an epoch is ~1e30 for a normal pool, the reward rate keeps
+# 36 decimals so that 6 decimal rewards do not round down to 0
+REWARD_MULTIPLIER: constant(uint256) = 10 ** 36
+MAX_CLAIM_TOKENS: constant(uint256) = 10  # tokens in claim_rewards_many
+MAX_CLAIM_USERS: constant(uint256) = 20  # users in claim_rewards_for
+MAX_VIEW_USERS: constant(uint256) = 256  # users in users_token_claimable_rewards
+CURSOR_SHIFT: constant(uint256) = 2 ** 128  # see user_token_claim_cursor
 
 @external
 @view
@@ -104,6 +112,7 @@ def MAXTIME() -> uint256:
     return MAXTIME
 
 settings: public(address)
+settings_selectors: HashMap[bytes4, bool]  # functions of VotingEscrowSettings run by __default__
 
 ADMIN_HASH: constant(bytes32) = keccak256("admin")
 @external
@@ -118,44 +127,33 @@ def _admin() -> address:
 
 
 last_manual_checkpoint_timestamp: public(uint256)
-MIN_DELAY_BETWEEN_MANUAL_CHECKPOINT_HASH: constant(bytes32) = keccak256("min_delay_between_manual_checkpoint")
-
-@external
-@view
-def min_delay_between_manual_checkpoint() -> uint256:
-    return self._min_delay_between_manual_checkpoint()
-
-@internal
-@view
-def _min_delay_between_manual_checkpoint() -> uint256:
-    return self.storageUInt256[MIN_DELAY_BETWEEN_MANUAL_CHECKPOINT_HASH]
 
 event MinDelayBetweenManualCheckpointSet:
     value: uint256
 
-@external
-def set_min_delay_between_manual_checkpoint(_value: uint256):
-    raw_call(
-        self.settings,
-        _abi_encode(_value, method_id=method_id("set_min_delay_between_manual_checkpoint(uint256)")),
-        is_delegate_call=True
-    )
-
 token: public(address)
 supply: public(uint256)
 
-locked: public(HashMap[address, LockedBalance])
+# Points and locked balances are stored packed, two 128 bit halves per slot:
+# Point as [bias | slope, ts | blk] and LockedBalance as amount | end,
+# see the locked, point_history and user_point_history getters
+PACK: constant(uint256) = 2 ** 128
+packed_locked: HashMap[address, uint256]
+
+# A point is packed into [bias * PACK + slope, ts * TS_SHIFT + blk * BLK_SHIFT + area]
+# where area is twice the area under the total supply (the user balance) before ts
+TS_SHIFT: constant(uint256) = 2 ** 216
+BLK_SHIFT: constant(uint256) = 2 ** 168
+BLK_SIZE: constant(uint256) = 2 ** 48
 
 epoch: public(uint256)
-point_history: public(Point[100000000000000000000000000000])  # epoch -> unsigned point
-user_point_history: public(HashMap[address, Point[1000000000]])  # user -> Point[user_epoch]
+packed_point_history: HashMap[uint256, uint256[2]]  # epoch -> unsigned point
+rewarded_epoch: public(uint256)  # last epoch which received rewards in any token, its end is always recorded
+packed_user_point_history: HashMap[address, HashMap[uint256, uint256[2]]]  # user -> user_epoch -> point
 user_point_epoch: public(HashMap[address, uint256])
 slope_changes: public(HashMap[uint256, int128])  # time -> signed slope change
-slope_changes_keys: public(uint256[100000])  # todo remove
-slope_changes_keys_next_index: public(uint256)
+slope_changes_bitmap: public(HashMap[uint256, uint256])  # day / 256 -> bit (day % 256) is set if slope_changes != 0
 pool_members: public(uint256)  # how many participants are already in the pool
-max_pool_members: public(uint256)  # maximum number of the pool participants
-min_stake_amount: public(uint256)  # min amount to stake (or increase)
 
 # Aragon's view methods for compatibility
 controller: public(address)  # todo remove never used
@@ -166,134 +164,111 @@ symbol: public(String[32])
 version: public(String[32])
 decimals: public(uint256)
 
-# Checker for whitelisted (smart contract) wallets which are allowed to deposit
-# The goal is to prevent tokenizing the escrow
-smart_wallet_checker: public(address)
-
-increase_amount_disabled: public(bool)
-increase_unlock_time_disabled: public(bool)
-create_lock_disabled: public(bool)
-withdraw_disabled: public(bool)
-emergency: public(bool)  # warning: cannot be reverted!
-
-event IncreaseAmountDisabledSet:
-    value: bool
-
-event IncreaseUnlockTimeDisabledSet:
-    value: bool
-
-event CreateLockDisabledSet:
-    value: bool
-
-event WithdrawDisabledSet:
-    value: bool
-
-event MinStakeAmountSet:
-    value: uint256
-
-event MaxPoolMembersSet:
-    value: uint256
-
-event Emergency:
-    pass
-
+# Settings below are changed by the admin functions of VotingEscrowSettings,
+# they are kept in packed_settings and the storage* mappings so that both contracts
+# agree on the layout. The ones read by the user entry points share one slot:
+# a field of `size` values at `shift` of packed_settings
+SMART_WALLET_CHECKER_HASH: constant(bytes32) = keccak256("smart_wallet_checker")
+INCREASE_AMOUNT_DISABLED_FLAG: constant(uint256) = 1
+INCREASE_UNLOCK_TIME_DISABLED_FLAG: constant(uint256) = 2
+CREATE_LOCK_DISABLED_FLAG: constant(uint256) = 4
+WITHDRAW_DISABLED_FLAG: constant(uint256) = 8
+EMERGENCY_FLAG: constant(uint256) = 16
+VERSION_SHIFT: constant(uint256) = 2 ** 8
+VERSION_SIZE: constant(uint256) = 2 ** 24
+MAX_POOL_MEMBERS_SHIFT: constant(uint256) = 2 ** 32
+MAX_POOL_MEMBERS_SIZE: constant(uint256) = 2 ** 32
+MIN_DELAY_SHIFT: constant(uint256) = 2 ** 64
+MIN_DELAY_SIZE: constant(uint256) = 2 ** 64
+MIN_STAKE_AMOUNT_SHIFT: constant(uint256) = 2 ** 128
 
 @external
-def enable_emergency():
-    assert msg.sender == self._admin()
-    assert not self.emergency
-    self.emergency = True
-    log Emergency()
-
+@view
+def settings_version() -> uint256:
+    """
+    @notice Counter of the packed settings changes
+    @dev Lets off-chain readers cache the settings, wraps around at 2 ** 24
+    """
+    return self.packed_settings / VERSION_SHIFT % VERSION_SIZE
 
 @external
-def set_max_pool_members(_value: uint256):
-    assert msg.sender == self._admin()
-    assert self.max_pool_members != _value
-    self.max_pool_members = _value
-    log MaxPoolMembersSet(_value)
-
+@view
+def max_pool_members() -> uint256:
+    """
+    @notice Maximum number of the pool participants
+    """
+    return self.packed_settings / MAX_POOL_MEMBERS_SHIFT % MAX_POOL_MEMBERS_SIZE
 
 @external
-def set_min_stake_amount(_value: uint256):
-    assert msg.sender == self._admin()
-    assert self.min_stake_amount != _value
-    self.min_stake_amount = _value
-    log MinStakeAmountSet(_value)
-
+@view
+def min_stake_amount() -> uint256:
+    """
+    @notice Min amount to stake (or increase)
+    """
+    return self.packed_settings / MIN_STAKE_AMOUNT_SHIFT
 
 @external
-def set_withdraw_disabled(_value: bool):
-    assert msg.sender == self._admin()
-    assert self.withdraw_disabled != _value
-    self.withdraw_disabled = _value
-    log WithdrawDisabledSet(_value)
-
+@view
+def min_delay_between_manual_checkpoint() -> uint256:
+    return self.packed_settings / MIN_DELAY_SHIFT % MIN_DELAY_SIZE
 
 @external
-def set_create_lock_disabled(_value: bool):
-    assert msg.sender == self._admin()
-    assert self.create_lock_disabled != _value
-    self.create_lock_disabled = _value
-    log CreateLockDisabledSet(_value)
-
+@view
+def smart_wallet_checker() -> address:
+    """
+    @notice Checker for whitelisted (smart contract) wallets which are allowed to deposit
+    @dev The goal is to prevent tokenizing the escrow
+    """
+    return self.storageAddress[SMART_WALLET_CHECKER_HASH]
 
 @external
-def set_increase_amount_disabled(_value: bool):
-    assert msg.sender == self._admin()
-    assert self.increase_amount_disabled != _value
-    self.increase_amount_disabled = _value
-    log IncreaseAmountDisabledSet(_value)
-
+@view
+def increase_amount_disabled() -> bool:
+    return self.packed_settings & INCREASE_AMOUNT_DISABLED_FLAG != 0
 
 @external
-def set_increase_unlock_time_disabled(_value: bool):
-    assert msg.sender == self._admin()
-    assert self.increase_unlock_time_disabled != _value
-    self.increase_unlock_time_disabled = _value
-    log IncreaseUnlockTimeDisabledSet(_value)
-
+@view
+def increase_unlock_time_disabled() -> bool:
+    return self.packed_settings & INCREASE_UNLOCK_TIME_DISABLED_FLAG != 0
 
 @external
-def pause():
-    assert msg.sender == self._admin()
-
-    if not self.withdraw_disabled:
-        self.withdraw_disabled = True
-        log WithdrawDisabledSet(True)
+@view
+def create_lock_disabled() -> bool:
+    return self.packed_settings & CREATE_LOCK_DISABLED_FLAG != 0
 
-    if not self.create_lock_disabled:
-        self.create_lock_disabled = True
-        log CreateLockDisabledSet(True)
+@external
+@view
+def withdraw_disabled() -> bool:
+    return self.packed_settings & WITHDRAW_DISABLED_FLAG != 0
 
-    if not self.increase_amount_disabled:
-        self.increase_amount_disabled = True
-        log IncreaseAmountDisabledSet(True)
+@external
+@view
+def emergency() -> bool:
+    """
+    @dev Warning: cannot be reverted!
+    """
+    return self.packed_settings & EMERGENCY_FLAG != 0
 
-    if not self.increase_unlock_time_disabled:
-        self.increase_unlock_time_disabled = True
-        log IncreaseUnlockTimeDisabledSet(True)
+event IncreaseAmountDisabledSet:
+    value: bool
 
+event IncreaseUnlockTimeDisabledSet:
+    value: bool
 
-@external
-def unpause():
-    assert msg.sender == self._admin()
+event CreateLockDisabledSet:
+    value: bool
 
-    if self.withdraw_disabled:
-        self.withdraw_disabled = False
-        log WithdrawDisabledSet(False)
+event WithdrawDisabledSet:
+    value: bool
 
-    if self.create_lock_disabled:
-        self.create_lock_disabled = False
-        log CreateLockDisabledSet(False)
+event MinStakeAmountSet:
+    value: uint256
 
-    if self.increase_amount_disabled:
-        self.increase_amount_disabled = False
-        log IncreaseAmountDisabledSet(False)
+event MaxPoolMembersSet:
+    value: uint256
 
-    if self.increase_unlock_time_disabled:
-        self.increase_unlock_time_disabled = False
-        log IncreaseUnlockTimeDisabledSet(False)
+event Emergency:
+    pass
 
 
 @external
@@ -315,10 +290,27 @@ def __init__(
     @param _version Contract version - required for Aragon compatibility
     """
     self.settings = settings_addr
+    for selector in [
+        method_id("transfer_ownership(address)", output_type=bytes4),
+        method_id("set_smart_wallet_checker(address)", output_type=bytes4),
+        method_id("set_min_delay_between_manual_checkpoint(uint256)", output_type=bytes4),
+        method_id("set_max_pool_members(uint256)", output_type=bytes4),
+        method_id("set_min_stake_amount(uint256)", output_type=bytes4),
+        method_id("set_withdraw_disabled(bool)", output_type=bytes4),
+        method_id("set_create_lock_disabled(bool)", output_type=bytes4),
+        method_id("set_increase_amount_disabled(bool)", output_type=bytes4),
+        method_id("set_increase_unlock_time_disabled(bool)", output_type=bytes4),
+        method_id("set_settings(uint256,uint256,uint256,bool,bool,bool,bool)", output_type=bytes4),
+        method_id("pause()", output_type=bytes4),
+        method_id("unpause()", output_type=bytes4),
+        method_id("enable_emergency()", output_type=bytes4),
+        method_id("emergency_withdraw(address,uint256,address)", output_type=bytes4),
+        method_id("emergency_withdraw_many(address[30],uint256[30],address[30])", output_type=bytes4),
+    ]:
+        self.settings_selectors[selector] = True
     self.storageAddress[ADMIN_HASH] = msg.sender
     self.token = token_addr
-    self.point_history[0].blk = block.number
-    self.point_history[0].ts = block.timestamp
+    self.packed_point_history[0][1] = block.timestamp * TS_SHIFT + block.number * BLK_SHIFT
     self.controller = msg.sender
     self.transfersEnabled = True
 
@@ -330,32 +322,103 @@ def __init__(
     self.symbol = _symbol
     self.version = _version
 
-    self.slope_changes_keys_next_index = 0  # todo remove
+    assert _max_pool_members < MAX_POOL_MEMBERS_SIZE and _min_stake_amount < 2 ** 128, "out of range"
+    self.packed_settings = _max_pool_members * MAX_POOL_MEMBERS_SHIFT + _min_stake_amount * MIN_STAKE_AMOUNT_SHIFT
+
+
+@internal
+@pure
+def _pack_point(p: Point, area: uint256) -> uint256[2]:
+    assert area < BLK_SHIFT  # dev: area overflow
+    return [convert(p.bias, uint256) * PACK + convert(p.slope, uint256), p.ts * TS_SHIFT + p.blk * BLK_SHIFT + area]
+
+
+@internal
+@pure
+def _unpack_point(w: uint256[2]) -> Point:
+    return Point({bias: convert(w[0] / PACK, int128), slope: convert(w[0] % PACK, int128), ts: w[1] / TS_SHIFT, blk: w[1] / BLK_SHIFT % BLK_SIZE})
+
 
-    self.max_pool_members = _max_pool_members
-    self.min_stake_amount = _min_stake_amount
+@internal
+@pure
+def _assert_stake_amount(_value: uint256, settings: uint256):
+    assert _value > 0, "zero stake not allowed"
+    assert _value >= settings / MIN_STAKE_AMOUNT_SHIFT, "too small stake amount"
+
+
+@internal
+@view
+def _locked(addr: address) -> LockedBalance:
+    w: uint256 = self.packed_locked[addr]
+    return LockedBalance({amount: convert(w / PACK, int128), end: w % PACK})
+
+
+@internal
+@view
+def _point_ts(_epoch: uint256) -> uint256:
+    return self.packed_point_history[_epoch][1] / TS_SHIFT
+
+
+@internal
+@view
+def _user_point_ts(addr: address, _idx: uint256) -> uint256:
+    return self.packed_user_point_history[addr][_idx][1] / TS_SHIFT
 
 
 @external
-def transfer_ownership(addr: address):
+@view
+def locked(addr: address) -> LockedBalance:
+    return self._locked(addr)
+
+
+@external
+@view
+def point_history(_epoch: uint256) -> Point:
+    return self._unpack_point(self.packed_point_history[_epoch])
+
+
+@external
+@view
+def supply_area_cumulative(_epoch: uint256) -> uint256:
     """
-    @notice Transfer ownership of VotingEscrow contract to `addr`
-    @param addr Address to have ownership transferred to
+    @notice Twice the area under the total supply from the first point till point_history(_epoch)
+    @dev As a cumulative price: the area over any interval is a difference of two of them
+         plus the linear pieces at the ends, see VotingEscrowLens.average_total_supply
     """
-    raw_call(
-        self.settings,
-        _abi_encode(addr, method_id=method_id("transfer_ownership(address)")),
-        is_delegate_call=True
-    )
+    return self.packed_point_history[_epoch][1] % BLK_SHIFT
+
+
+@internal
+@view
+def _epoch_supply_area(_epoch: uint256) -> uint256:
+    if _epoch >= self.epoch:
+        return 0  # still open
+    return self.packed_point_history[_epoch + 1][1] % BLK_SHIFT - self.packed_point_history[_epoch][1] % BLK_SHIFT
 
 
 @external
-def set_smart_wallet_checker(addr: address):
+@view
+def epoch_supply_area(_epoch: uint256) -> uint256:
     """
-    @notice Apply setting external contract to check approved smart contract wallets
+    @notice Twice the area under the total supply over a closed epoch, 0 for the current one
     """
-    assert msg.sender == self._admin(), "not admin"
-    self.smart_wallet_checker = addr
+    return self._epoch_supply_area(_epoch)
+
+
+@external
+@view
+def user_point_history(addr: address, _idx: uint256) -> Point:
+    return self._unpack_point(self.packed_user_point_history[addr][_idx])
+
+
+@external
+@view
+def user_area_cumulative(addr: address, _idx: uint256) -> uint256:
+    """
+    @notice Twice the area under the balance of `addr` from its first point till user_point_history(addr, _idx)
+    @dev As supply_area_cumulative, see VotingEscrowLens.average_balance
+    """
+    return self.packed_user_point_history[addr][_idx][1] % BLK_SHIFT
 
 
 @internal
@@ -365,7 +428,7 @@ def assert_not_contract(addr: address):
     @param addr Address to be checked
     """
     if addr != tx.origin:
-        checker: address = self.smart_wallet_checker
+        checker: address = self.storageAddress[SMART_WALLET_CHECKER_HASH]
         if checker != ZERO_ADDRESS:
             if SmartWalletChecker(checker).check(addr):
                 return
@@ -381,7 +444,7 @@ def get_last_user_slope(addr: address) -> int128:
     @return Value of the slope
     """
     uepoch: uint256 = self.user_point_epoch[addr]
-    return self.user_point_history[addr][uepoch].slope
+    return convert(self.packed_user_point_history[addr][uepoch][0] % PACK, int128)
 
 
 @external
@@ -393,7 +456,7 @@ def user_point_history__ts(_addr: address, _idx: uint256) -> uint256:
     @param _idx User epoch number
     @return Epoch time of the checkpoint
     """
-    return self.user_point_history[_addr][_idx].ts
+    return self._user_point_ts(_addr, _idx)
 
 
 @external
@@ -404,46 +467,84 @@ def locked__end(_addr: address) -> uint256:
     @param _addr User wallet
     @return Epoch time of the lock end
     """
-    return self.locked[_addr].end
+    return self.packed_locked[_addr] % PACK
 
 
 @internal
-def _checkpoint(addr: address, old_locked: LockedBalance, new_locked: LockedBalance):
+def _set_slope_change(_t: uint256, _value: int128):
     """
-    @notice Record global and per-user data to checkpoint
-    @param addr User's wallet address. No user checkpoint if 0x0
-    @param old_locked Pevious locked amount / end lock time for the user
-    @param new_locked New locked amount / end lock time for the user
+    @notice Schedule the slope change at `_t` and keep slope_changes_bitmap in sync
+    @dev The bitmap word is only written when the key appears or disappears
     """
-    u_old: Point = empty(Point)
-    u_new: Point = empty(Point)
-    old_dslope: int128 = 0
-    new_dslope: int128 = 0
-    _epoch: uint256 = self.epoch
+    self.slope_changes[_t] = _value
+    day: uint256 = _t / EPOCH_SECONDS
+    bit: uint256 = 2 ** (day % 256)
+    word: uint256 = self.slope_changes_bitmap[day / 256]
+    if _value != 0:
+        if word & bit == 0:
+            self.slope_changes_bitmap[day / 256] = word | bit
+    elif word & bit != 0:
+        self.slope_changes_bitmap[day / 256] = word - bit
 
-    if addr != ZERO_ADDRESS:
-        # Calculate slopes and biases
-        # Kept at zero when they have to
-        if old_locked.end > block.timestamp and old_locked.amount > 0:
-            u_old.slope = old_locked.amount / convert(MAXTIME, int128)  # todo why??
-            u_old.bias = u_old.slope * convert(old_locked.end - block.timestamp, int128)
-        if new_locked.end > block.timestamp and new_locked.amount > 0:
-            u_new.slope = new_locked.amount / convert(MAXTIME, int128)
-            u_new.bias = u_new.slope * convert(new_locked.end - block.timestamp, int128)
 
-        # Read values of scheduled changes in the slope
-        # old_locked.end can be in the past and in the future
-        # new_locked.end can ONLY by in the FUTURE unless everything expired: than zeros
-        old_dslope = self.slope_changes[old_locked.end]
-        if new_locked.end != 0:
-            if new_locked.end == old_locked.end:
-                new_dslope = old_dslope
-            else:
-                new_dslope = self.slope_changes[new_locked.end]
+@internal
+@view
+def _next_slope_change(_t: uint256) -> uint256:
+    """
+    @notice First time after `_t` with a scheduled slope change
+    @dev Every lock ends by block.timestamp + MAXTIME, so the bitmap is scanned till then,
+         a word per 256 days and at most 256 words (~179 years) after `_t`
+    @return 0 if there is none
+    """
+    day: uint256 = _t / EPOCH_SECONDS + 1
+    last_word: uint256 = (block.timestamp + MAXTIME) / EPOCH_SECONDS / 256
+    for i in range(256):
+        if day / 256 > last_word:
+            break
+        word: uint256 = self.slope_changes_bitmap[day / 256] / 2 ** (day % 256)
+        if word != 0:
+            # the lowest set bit
+            for s in [128, 64, 32, 16, 8, 4, 2, 1]:
+                if word % 2 ** s == 0:
+                    word /= 2 ** s
+                    day += s
+            return day * EPOCH_SECONDS
+        day = (day / 256 + 1) * 256
+    return 0
+
 
+@external
+@view
+def next_slope_change(_t: uint256 = block.timestamp) -> uint256:
+    """
+    @notice Get the first time after `_t` when the total slope changes (a lock ends)
+    @dev Iterate the schedule by calling it again with the returned time. The bitmap is
+         scanned till block.timestamp + MAXTIME, so years without a slope change don't end
+         the iteration early (at most 256 words, ~179 years, after `_t`)
+    @param _t Epoch time to search from
+    @return Epoch time of the next slope change, 0 if there is none
+    """
+    return self._next_slope_change(_t)
+
+
+@internal
+def _fill_history(_t: uint256) -> (Point, uint256):
+    """
+    @notice Record the global points of the days before `_t` and close their epochs
+    @dev Only the days with a slope change and the end of the rewarded epoch are recorded:
+         the supply is linear in between, so an epoch may span many empty days.
+         The point at `_t` is returned but not recorded: it becomes point_history[self.epoch]
+         once the caller applies its own changes
+    @param _t Time to fill the history until, not earlier than the last point
+    @return Global point at `_t` and twice the area under the total supply before `_t`
+    """
+    _epoch: uint256 = self.epoch
     last_point: Point = Point({bias: 0, slope: 0, ts: block.timestamp, blk: block.number})
+    cumulative: uint256 = 0
     if _epoch > 0:
-        last_point = self.point_history[_epoch]
+        w: uint256[2] = self.packed_point_history[_epoch]
+        last_point = self._unpack_point(w)
+        cumulative = w[1] % BLK_SHIFT
     last_checkpoint: uint256 = last_point.ts
     # initial_last_point is used for extrapolation to calculate block number
     # (approximately, for *At methods) and save them
@@ -454,19 +555,33 @@ def _checkpoint(addr: address, old_locked: LockedBalance, new_locked: LockedBala
         block_slope = MULTIPLIER * (block.number - last_point.blk) / (block.timestamp - last_point.ts)
     # If last point is already recorded in this block, slope=0
     # But that's ok b/c we know the block in such case
+    rewarded_ts: uint256 = self._point_ts(self.rewarded_epoch)
 
-    # Go over weeks to fill history and calculate what the current point is
-    t_i: uint256 = (last_checkpoint / EPOCH_SECONDS) * EPOCH_SECONDS
+    # Go over the recorded days to fill history and calculate what the current point is
     for i in range(255):
         # Hopefully it won't happen that this won't get used in 5 years!
         # If it does, users will be able to withdraw but vote weight will be broken
-        t_i += EPOCH_SECONDS
+        # Rewards are spread over the day they are received in, so its end is recorded
+        t_i: uint256 = (last_checkpoint / EPOCH_SECONDS + 1) * EPOCH_SECONDS
+        if last_checkpoint != rewarded_ts:
+            t_i = self._next_slope_change(last_checkpoint)
+            if t_i == 0:
+                t_i = MAX_UINT256  # no locks left
         d_slope: int128 = 0
-        if t_i > block.timestamp:
-            t_i = block.timestamp
+        if t_i > _t:
+            t_i = _t
         else:
             d_slope = self.slope_changes[t_i]
-        last_point.bias -= last_point.slope * convert(t_i - last_checkpoint, int128)
+        end_bias: int128 = last_point.bias - last_point.slope * convert(t_i - last_checkpoint, int128)
+        # Twice the area under the total supply over the epoch being closed
+        area: uint256 = 0
+        if end_bias < 0:
+            # triangle: the supply reaches zero inside the epoch
+            area = convert(last_point.bias, uint256) * convert(last_point.bias / last_point.slope, uint256)
+        else:
+            area = (t_i - last_checkpoint) * convert(last_point.bias + end_bias, uint256)
+        cumulative += area
+        last_point.bias = end_bias
         last_point.slope += d_slope
         if last_point.bias < 0:  # This can happen
             last_point.bias = 0
@@ -476,13 +591,93 @@ def _checkpoint(addr: address, old_locked: LockedBalance, new_locked: LockedBala
         last_point.ts = t_i
         last_point.blk = initial_last_point.blk + block_slope * (t_i - initial_last_point.ts) / MULTIPLIER
         _epoch += 1
-        if t_i == block.timestamp:
-            last_point.blk = block.number
+        if t_i == _t:
+            if t_i == block.timestamp:
+                last_point.blk = block.number
             break
         else:
-            self.point_history[_epoch] = last_point
+            self.packed_point_history[_epoch] = self._pack_point(last_point, cumulative)
 
     self.epoch = _epoch
+    return last_point, cumulative
+
+
+@internal
+def _checkpoint_until(_t: uint256):
+    _epoch: uint256 = self.epoch
+    last_ts: uint256 = self._point_ts(_epoch)
+    # at most 255 days per call, so that _fill_history always gets to t
+    t: uint256 = min(min(_t, block.timestamp), (last_ts / EPOCH_SECONDS + 255) * EPOCH_SECONDS)
+    t = (t / EPOCH_SECONDS) * EPOCH_SECONDS
+    if _epoch == 0 or t <= last_ts:
+        return  # nothing locked yet or already filled
+    last_point: Point = empty(Point)
+    cumulative: uint256 = 0
+    last_point, cumulative = self._fill_history(t)
+    self.packed_point_history[self.epoch] = self._pack_point(last_point, cumulative)
+
+
+@external
+def checkpoint_until(_t: uint256):
+    """
+    @notice Record the global history until `_t` (rounded down to days, at most now),
+            so that the next transactions don't pay for the days before it
+    @dev Lets a keeper backfill a long idle period in chunks, at most 255 days per call.
+         Not limited by min_delay_between_manual_checkpoint: it never records a point
+         at now, only day boundaries after the last point, so it opens at most one
+         epoch a day (as the daily history did) and a repeated call does nothing
+    @param _t Time to fill the history until
+    """
+    self._checkpoint_until(_t)
+
+
+@external
+def checkpoint_up_to(_max_days: uint256):
+    """
+    @notice Record the global history for at most `_max_days` days after the last point,
+            see checkpoint_until
+    @param _max_days Number of days to fill
+    """
+    self._checkpoint_until((self._point_ts(self.epoch) / EPOCH_SECONDS + min(_max_days, 255)) * EPOCH_SECONDS)
+
+
+@internal
+def _checkpoint(addr: address, old_locked: LockedBalance, new_locked: LockedBalance):
+    """
+    @notice Record global and per-user data to checkpoint
+    @param addr User's wallet address. No user checkpoint if 0x0
+    @param old_locked Pevious locked amount / end lock time for the user
+    @param new_locked New locked amount / end lock time for the user
+    """
+    u_old: Point = empty(Point)
+    u_new: Point = empty(Point)
+    old_dslope: int128 = 0
+    new_dslope: int128 = 0
+
+    if addr != ZERO_ADDRESS:
+        # Calculate slopes and biases
+        # Kept at zero when they have to
+        if old_locked.end > block.timestamp and old_locked.amount > 0:
+            u_old.slope = old_locked.amount / convert(MAXTIME, int128)  # todo why??
+            u_old.bias = u_old.slope * convert(old_locked.end - block.timestamp, int128)
+        if new_locked.end > block.timestamp and new_locked.amount > 0:
+            u_new.slope = new_locked.amount / convert(MAXTIME, int128)
+            u_new.bias = u_new.slope * convert(new_locked.end - block.timestamp, int128)
+
+        # Read values of scheduled changes in the slope
+        # old_locked.end can be in the past and in the future
+        # new_locked.end can ONLY by in the FUTURE unless everything expired: than zeros
+        old_dslope = self.slope_changes[old_locked.end]
+        if new_locked.end != 0:
+            if new_locked.end == old_locked.end:
+                new_dslope = old_dslope
+            else:
+                new_dslope = self.slope_changes[new_locked.end]
+
+    last_point: Point = empty(Point)
+    cumulative: uint256 = 0
+    last_point, cumulative = self._fill_history(block.timestamp)
+    _epoch: uint256 = self.epoch
     # Now point_history is filled until t=now
 
     if addr != ZERO_ADDRESS:
@@ -496,7 +691,7 @@ def _checkpoint(addr: address, old_locked: LockedBalance, new_locked: LockedBala
             last_point.bias = 0
 
     # Record the changed point into history
-    self.point_history[_epoch] = last_point
+    self.packed_point_history[_epoch] = self._pack_point(last_point, cumulative)
 
     if addr != ZERO_ADDRESS:
         # Schedule the slope changes (slope is going down)
@@ -507,26 +702,30 @@ def _checkpoint(addr: address, old_locked: LockedBalance, new_locked: LockedBala
             old_dslope += u_old.slope
             if new_locked.end == old_locked.end:
                 old_dslope -= u_new.slope  # It was a new deposit, not extension
-            self.slope_changes[old_locked.end] = old_dslope
-            self.slope_changes_keys[self.slope_changes_keys_next_index] = old_locked.end  # todo remove
-            self.slope_changes_keys_next_index += 1
+            self._set_slope_change(old_locked.end, old_dslope)
 
         if new_locked.end > block.timestamp:
             if new_locked.end > old_locked.end:
                 new_dslope -= u_new.slope  # old slope disappeared at this point
-                self.slope_changes[new_locked.end] = new_dslope
-                self.slope_changes_keys[self.slope_changes_keys_next_index] = new_locked.end  # todo remove
-                self.slope_changes_keys_next_index += 1
+                self._set_slope_change(new_locked.end, new_dslope)
 
             # else: we recorded it already in old_dslope
 
         # Now handle user history
         user_epoch: uint256 = self.user_point_epoch[addr] + 1
+        # Twice the area under the balance since the previous user point, which
+        # stops at the lock end as in _userRewards
+        w: uint256[2] = self.packed_user_point_history[addr][user_epoch - 1]
+        u_prev: Point = self._unpack_point(w)
+        dt: uint256 = block.timestamp - u_prev.ts
+        if u_prev.slope > 0:
+            dt = min(dt, convert(u_prev.bias / u_prev.slope, uint256))
+        user_area: uint256 = dt * convert(2 * u_prev.bias - u_prev.slope * convert(dt, int128), uint256)
 
         self.user_point_epoch[addr] = user_epoch
         u_new.ts = block.timestamp
         u_new.blk = block.number
-        self.user_point_history[addr][user_epoch] = u_new
+        self.packed_user_point_history[addr][user_epoch] = self._pack_point(u_new, w[1] % BLK_SHIFT + user_area)
 
 
 @internal
@@ -553,7 +752,7 @@ def _deposit_for(
     _locked.amount += convert(_value, int128)
     if unlock_time != 0:
         _locked.end = unlock_time
-    self.locked[_addr] = _locked
+    self.packed_locked[_addr] = convert(_locked.amount, uint256) * PACK + _locked.end
 
     # Possibilities:
     # Both old_locked.end could be current or expired (>/< block.timestamp)
@@ -574,7 +773,7 @@ def checkpoint():
     @notice Record global data to checkpoint
     """
     delay: uint256 = block.timestamp - self.last_manual_checkpoint_timestamp
-    assert delay >= self._min_delay_between_manual_checkpoint(), "min delay failed"
+    assert delay >= self.packed_settings / MIN_DELAY_SHIFT % MIN_DELAY_SIZE, "min delay failed"
     self.last_manual_checkpoint_timestamp = block.timestamp
     self._checkpoint(ZERO_ADDRESS, empty(LockedBalance), empty(LockedBalance))
 
@@ -589,18 +788,18 @@ def deposit_for(_addr: address, _value: uint256):
     @param _addr User's wallet address
     @param _value Amount to add to user's lock
     """
-    assert not self.increase_amount_disabled, "increase amount disabled"
-    assert not self.emergency, "not allowed in emergency"
+    settings: uint256 = self.packed_settings
+    assert settings & INCREASE_AMOUNT_DISABLED_FLAG == 0, "increase amount disabled"
+    assert settings & EMERGENCY_FLAG == 0, "not allowed in emergency"
 
-    _locked: LockedBalance = self.locked[_addr]
+    _locked: LockedBalance = self._locked(_addr)
 
-    assert _value > 0, "zero stake not allowed"
-    assert _value >= self.min_stake_amount, "too small stake amount"
+    self._assert_stake_amount(_value, settings)
 
     assert _locked.amount > 0, "No existing lock found"
     assert _locked.end > block.timestamp, "Cannot add to expired lock. Withdraw"
 
-    self._deposit_for(_addr, _value, 0, self.locked[_addr], DEPOSIT_FOR_TYPE)
+    self._deposit_for(_addr, _value, 0, _locked, DEPOSIT_FOR_TYPE)
 
 
 @external
@@ -611,18 +810,18 @@ def create_lock(_value: uint256, _unlock_time: uint256):
     @param _value Amount to deposit
     @param _unlock_time Epoch time when tokens unlock, rounded down to whole weeks
     """
-    assert not self.create_lock_disabled, "create lock disabled"
-    assert not self.emergency, "not allowed in emergency"
+    settings: uint256 = self.packed_settings
+    assert settings & CREATE_LOCK_DISABLED_FLAG == 0, "create lock disabled"
+    assert settings & EMERGENCY_FLAG == 0, "not allowed in emergency"
 
     self.assert_not_contract(msg.sender)
     unlock_time: uint256 = (_unlock_time / EPOCH_SECONDS) * EPOCH_SECONDS  # Locktime is rounded down to weeks
-    _locked: LockedBalance = self.locked[msg.sender]
+    _locked: LockedBalance = self._locked(msg.sender)
 
     self.pool_members += 1
-    assert self.pool_members <= self.max_pool_members, "max_pool_members exceed"
+    assert self.pool_members <= settings / MAX_POOL_MEMBERS_SHIFT % MAX_POOL_MEMBERS_SIZE, "max_pool_members exceed"
 
-    assert _value > 0, "zero stake not allowed"
-    assert _value >= self.min_stake_amount, "too small stake amount"
+    self._assert_stake_amount(_value, settings)
 
     assert _locked.amount == 0, "Withdraw old tokens first"
     assert unlock_time > block.timestamp, "Can only lock until time in the future"
@@ -639,14 +838,14 @@ def increase_amount(_value: uint256):
             without modifying the unlock time
     @param _value Amount of tokens to deposit and add to the lock
     """
-    assert not self.increase_amount_disabled, "increase amount disabled"
-    assert not self.emergency, "not allowed in emergency"
+    settings: uint256 = self.packed_settings
+    assert settings & INCREASE_AMOUNT_DISABLED_FLAG == 0, "increase amount disabled"
+    assert settings & EMERGENCY_FLAG == 0, "not allowed in emergency"
 
     self.assert_not_contract(msg.sender)
-    _locked: LockedBalance = self.locked[msg.sender]
+    _locked: LockedBalance = self._locked(msg.sender)
 
-    assert _value > 0, "zero stake not allowed"
-    assert _value >= self.min_stake_amount, "too small stake amount"
+    self._assert_stake_amount(_value, settings)
 
     assert _locked.amount > 0, "No existing lock found"
     assert _locked.end > block.timestamp, "Cannot add to expired lock. Withdraw"
@@ -661,11 +860,12 @@ def increase_unlock_time(_unlock_time: uint256):
     @notice Extend the unlock time for `msg.sender` to `_unlock_time`
     @param _unlock_time New epoch time for unlocking
     """
-    assert not self.increase_unlock_time_disabled, "increase unlock time disabled"
-    assert not self.emergency, "not allowed in emergency"
+    settings: uint256 = self.packed_settings
+    assert settings & INCREASE_UNLOCK_TIME_DISABLED_FLAG == 0, "increase unlock time disabled"
+    assert settings & EMERGENCY_FLAG == 0, "not allowed in emergency"
 
     self.assert_not_contract(msg.sender)
-    _locked: LockedBalance = self.locked[msg.sender]
+    _locked: LockedBalance = self._locked(msg.sender)
     unlock_time: uint256 = (_unlock_time / EPOCH_SECONDS) * EPOCH_SECONDS  # Locktime is rounded down to weeks
 
     assert _locked.end > block.timestamp, "Lock expired"
@@ -683,17 +883,18 @@ def withdraw():
     @notice Withdraw all tokens for `msg.sender`
     @dev Only possible if the lock has expired
     """
-    assert not self.withdraw_disabled, "withdraw disabled"
-    assert not self.emergency, "not allowed in emergency"
+    settings: uint256 = self.packed_settings
+    assert settings & WITHDRAW_DISABLED_FLAG == 0, "withdraw disabled"
+    assert settings & EMERGENCY_FLAG == 0, "not allowed in emergency"
 
-    _locked: LockedBalance = self.locked[msg.sender]
+    _locked: LockedBalance = self._locked(msg.sender)
     assert block.timestamp >= _locked.end, "The lock didn't expire"
     value: uint256 = convert(_locked.amount, uint256)
 
     old_locked: LockedBalance = _locked
     _locked.end = 0
     _locked.amount = 0
-    self.locked[msg.sender] = _locked
+    self.packed_locked[msg.sender] = 0
     supply_before: uint256 = self.supply
     self.supply = supply_before - value
 
@@ -716,12 +917,13 @@ def withdraw():
 
 @internal
 @view
-def find_block_epoch(_block: uint256, max_epoch: uint256) -> uint256:
+def find_block_epoch(_block: uint256, max_epoch: uint256, _shift: uint256) -> uint256:
     """
     @notice Binary search to estimate timestamp for block number
     @param _block Block to find
     @param max_epoch Don't go beyond this epoch
-    @return Approximate timestamp for block
+    @param _shift BLK_SHIFT, or TS_SHIFT to search for a timestamp in place of a block
+    @return Last epoch at or before the block
     """
     # Binary search
     _min: uint256 = 0
@@ -730,7 +932,7 @@ def find_block_epoch(_block: uint256, max_epoch: uint256) -> uint256:
         if _min >= _max:
             break
         _mid: uint256 = (_min + _max + 1) / 2
-        if self.point_history[_mid].blk <= _block:
+        if self.packed_point_history[_mid][1] / _shift % BLK_SIZE <= _block:
             _min = _mid
         else:
             _max = _mid - 1
@@ -751,48 +953,28 @@ def balanceOf(addr: address, _t: uint256 = block.timestamp) -> uint256:
     if _epoch == 0:
         return 0
     else:
-        last_point: Point = self.user_point_history[addr][_epoch]
+        last_point: Point = self._unpack_point(self.packed_user_point_history[addr][_epoch])
         last_point.bias -= last_point.slope * convert(_t - last_point.ts, int128)
         if last_point.bias < 0:
             last_point.bias = 0
         return convert(last_point.bias, uint256)
 
 
-@external
+@internal
 @view
-def balanceOfAt(addr: address, _block: uint256) -> uint256:
+def _block_time(_block: uint256) -> (Point, uint256):
     """
-    @notice Measure voting power of `addr` at block height `_block`
-    @dev Adheres to MiniMe `balanceOfAt` interface: https://github.com/Giveth/minime
-    @param addr User's wallet address
-    @param _block Block to calculate the voting power at
-    @return Voting power
+    @notice Last global point at or before block `_block` and the time of the block
+            interpolated from it, shared by balanceOfAt and totalSupplyAt
     """
-    # Copying and pasting totalSupply code because Vyper cannot pass by
-    # reference yet
     assert _block <= block.number
-
-    # Binary search
-    _min: uint256 = 0
-    _max: uint256 = self.user_point_epoch[addr]
-    for i in range(128):  # Will be always enough for 128-bit numbers
-        if _min >= _max:
-            break
-        _mid: uint256 = (_min + _max + 1) / 2
-        if self.user_point_history[addr][_mid].blk <= _block:
-            _min = _mid
-        else:
-            _max = _mid - 1
-
-    upoint: Point = self.user_point_history[addr][_min]
-
     max_epoch: uint256 = self.epoch
-    _epoch: uint256 = self.find_block_epoch(_block, max_epoch)
-    point_0: Point = self.point_history[_epoch]
+    _epoch: uint256 = self.find_block_epoch(_block, max_epoch, BLK_SHIFT)
+    point_0: Point = self._unpack_point(self.packed_point_history[_epoch])
     d_block: uint256 = 0
     d_t: uint256 = 0
     if _epoch < max_epoch:
-        point_1: Point = self.point_history[_epoch + 1]
+        point_1: Point = self._unpack_point(self.packed_point_history[_epoch + 1])
         d_block = point_1.blk - point_0.blk
         d_t = point_1.ts - point_0.ts
     else:
@@ -801,6 +983,24 @@ def balanceOfAt(addr: address, _block: uint256) -> uint256:
     block_time: uint256 = point_0.ts
     if d_block != 0:
         block_time += d_t * (_block - point_0.blk) / d_block
+    return point_0, block_time
+
+
+@external
+@view
+def balanceOfAt(addr: address, _block: uint256) -> uint256:
+    """
+    @notice Measure voting power of `addr` at block height `_block`
+    @dev Adheres to MiniMe `balanceOfAt` interface: https://github.com/Giveth/minime
+         The time of `_block` is interpolated as in totalSupplyAt
+    @param addr User's wallet address
+    @param _block Block to calculate the voting power at
+    @return Voting power
+    """
+    upoint: Point = self._unpack_point(self.packed_user_point_history[addr][self._searchForUserEpoch(addr, _block, BLK_SHIFT)])
+    point_0: Point = empty(Point)
+    block_time: uint256 = 0
+    point_0, block_time = self._block_time(_block)
 
     upoint.bias -= upoint.slope * convert(block_time - upoint.ts, int128)
     if upoint.bias >= 0:
@@ -819,18 +1019,15 @@ def supply_at(point: Point, t: uint256) -> uint256:
     @return Total voting power at that time
     """
     last_point: Point = point
-    t_i: uint256 = (last_point.ts / EPOCH_SECONDS) * EPOCH_SECONDS
     for i in range(255):
-        t_i += EPOCH_SECONDS
-        d_slope: int128 = 0
-        if t_i > t:
+        # the supply is linear until the next slope change
+        t_i: uint256 = self._next_slope_change(last_point.ts)
+        if t_i == 0 or t_i > t:
             t_i = t
-        else:
-            d_slope = self.slope_changes[t_i]
         last_point.bias -= last_point.slope * convert(t_i - last_point.ts, int128)
         if t_i == t:
             break
-        last_point.slope += d_slope
+        last_point.slope += self.slope_changes[t_i]
         last_point.ts = t_i
 
     if last_point.bias < 0:
@@ -847,7 +1044,7 @@ def totalSupply(t: uint256 = block.timestamp) -> uint256:
     @return Total voting power
     """
     _epoch: uint256 = self.epoch
-    last_point: Point = self.point_history[_epoch]
+    last_point: Point = self._unpack_point(self.packed_point_history[_epoch])
     return self.supply_at(last_point, t)
 
 
@@ -856,25 +1053,16 @@ def totalSupply(t: uint256 = block.timestamp) -> uint256:
 def totalSupplyAt(_block: uint256) -> uint256:
     """
     @notice Calculate total voting power at some point in the past
+    @dev The time of `_block` is interpolated between the recorded points, so over
+         the days which are not recorded it is one linear estimate and may differ by
+         a few seconds from a history which recorded the block of every day
     @param _block Block to calculate the total voting power at
     @return Total voting power at `_block`
     """
-    assert _block <= block.number
-    _epoch: uint256 = self.epoch
-    target_epoch: uint256 = self.find_block_epoch(_block, _epoch)
-
-    point: Point = self.point_history[target_epoch]
-    dt: uint256 = 0
-    if target_epoch < _epoch:
-        point_next: Point = self.point_history[target_epoch + 1]
-        if point.blk != point_next.blk:
-            dt = (_block - point.blk) * (point_next.ts - point.ts) / (point_next.blk - point.blk)
-    else:
-        if point.blk != block.number:
-            dt = (_block - point.blk) * (block.timestamp - point.ts) / (block.number - point.blk)
-    # Now dt contains info on how far are we beyond point
-
-    return self.supply_at(point, point.ts + dt)
+    point: Point = empty(Point)
+    block_time: uint256 = 0
+    point, block_time = self._block_time(_block)
+    return self.supply_at(point, block_time)
 
 
 # Dummy methods for compatibility with Aragon
@@ -889,173 +1077,263 @@ def changeController(_newController: address):
 
 
 # Rewards
-
-user_token_claimed_epoch: public(HashMap[address, HashMap[address, uint256]])  # user -> token -> lastClaimedEpoch
+#
+# Rewards received during an epoch are spread over the area under the total
+# supply polyline of that epoch. The epochs recorded by checkpoints at the
+# same time as the rewarded one have zero length, so the rewards go on to be
+# received into the latter until some time passes and are shared over the time
+# till the next recorded one. Once the epoch is closed this is a constant
+# rate (reward per unit of voting power per second) which is accumulated per
+# token in `token_reward_history`. Claims integrate the user's own polyline
+# against the accumulated rate, so they cost O(user checkpoints) instead of
+# O(epochs) since the last claim.
+#
+# Rewards may also be streamed: a deposit sets a rate till the stream finish.
+# The part released in the current epoch is added to its rewards when the token
+# is checkpointed, the part released in the epochs closed since then is spread
+# over the area under the total supply of these epochs together with the rewards
+# of the last rewarded one, so neither the split nor the amount depends on when
+# the stream is poked.
+
+struct RewardPoint:
+    epoch: uint256  # rewarded epoch
+    ts0: uint256  # epoch start
+    ts1: uint256  # next recorded time, or a later epoch start for the stream released since, see above
+    rate: uint256  # reward * REWARD_MULTIPLIER / (2 * area under the total supply)
+    acc: uint256  # sum(rate * dt) before ts0
+    acc_t: uint256  # sum(rate * d(t ** 2)) before ts0
+
+struct RewardStream:
+    rate: uint256  # amount * MULTIPLIER per second
+    finish: uint256
+    updated: uint256  # released till
+
+# user -> token -> lastClaimedEpoch + CURSOR_SHIFT * user epoch where the next claim starts,
+# packed into one slot so that the cursor costs nothing to keep (as FeeDistributor.user_epoch_of)
+user_token_claim_cursor: HashMap[address, HashMap[address, uint256]]
 epoch_token_rewards: public(HashMap[uint256, HashMap[address, uint256]])  # epoch -> token -> totalRewardsAmount
+token_last_rewarded_epoch: public(HashMap[address, uint256])  # token -> last epoch which received rewards
+token_reward_history: public(HashMap[address, RewardPoint[1000000000]])  # token -> RewardPoint[token_reward_epoch]
+token_reward_epoch: public(HashMap[address, uint256])  # token -> number of finalized rewarded epochs
+token_reward_stream: public(HashMap[address, RewardStream])
 
-# inspired by balanceOfAt
 @internal
 @view
-def _searchForUserEpochByTimestamp(addr: address, ts: uint256) -> uint256:
-    # Binary search - as in balanceOfAt BUT OVER ts
+def _searchForUserEpoch(addr: address, _value: uint256, _shift: uint256) -> uint256:
+    """
+    @notice Binary search - as in find_block_epoch BUT OVER the user history
+    @param _shift BLK_SHIFT to search for a block, TS_SHIFT for a timestamp
+    @return Last user epoch at or before `_value`
+    """
     _min: uint256 = 0
     _max: uint256 = self.user_point_epoch[addr]
-
-    if self.user_point_history[addr][_min].ts > ts:
-        return MAX_UINT256
-    if self.user_point_history[addr][_max].ts < ts:
-        return _max   #xx ???
-
     for i in range(128):  # Will be always enough for 128-bit numbers
         if _min >= _max:
             break
         _mid: uint256 = (_min + _max + 1) / 2
-        if self.user_point_history[addr][_mid].ts <= ts:
+        if self.packed_user_point_history[addr][_mid][1] / _shift % BLK_SIZE <= _value:
             _min = _mid
         else:
             _max = _mid - 1
     return _min
 
-event _averageUserBlanaceOverEpochDebug:
-    user_epoch_start: uint256
-    user_epoch_end: uint256
 
-event _averageUserBlanaceOverEpochDebugS:
-    user_epoch: uint256
-    bias: int128
-    slope: int128
-    _ts0: uint256
-    _ts1: uint256
-    _ts: uint256
-    trapezoidArea: uint256
+@internal
+@view
+def _rewardPointEnd(rp: RewardPoint) -> (uint256, uint256):
+    """
+    @notice Accumulated (acc, acc_t) at the end of `rp`
+    """
+    return rp.acc + rp.rate * (rp.ts1 - rp.ts0), rp.acc_t + rp.rate * (rp.ts1 * rp.ts1 - rp.ts0 * rp.ts0)
 
 
 @internal
 @view
-def _averageUserBlanaceOverEpoch(addr: address, _epoch: uint256) -> uint256:
-    assert _epoch < self.epoch, "unfnalized epoch"  # typo
-    ts_start: uint256 = self.point_history[_epoch].ts
-    ts_end: uint256 = self.point_history[_epoch+1].ts
-
-    user_epoch_start: uint256 = self._searchForUserEpochByTimestamp(addr, ts_start)
-    if user_epoch_start == MAX_UINT256:
-        raise "failed user_epoch_start searchForUserEpochByTimestamp"
-    user_epoch_end: uint256 = self._searchForUserEpochByTimestamp(addr, ts_end)
-    if user_epoch_end == MAX_UINT256:
-        raise "failed user_epoch_end searchForUserEpochByTimestamp"
-
-    # todo: check it
-    areaUnderPolyline: uint256 = 0
-    user_epoch: uint256 = user_epoch_start
-    for d_user_epoch in range(256):  # todo be careful here DoS attack!, we may use additional aggregation
-        if user_epoch > user_epoch_end:  # note: we use > because we want to process the end epoch as well
-            break
-        bias: int128 = self.user_point_history[addr][user_epoch].bias
-        slope: int128 = self.user_point_history[addr][user_epoch].slope
-        _ts_begin: uint256 = self.user_point_history[addr][user_epoch].ts
-        _ts0: uint256 = _ts_begin
-        _ts1: uint256 = self.user_point_history[addr][user_epoch+1].ts
-
-        if _ts1 == 0:
-            _ts1 = ts_end
-
-        #xx ??
-        if _ts1 > ts_end:
-            _ts1 = ts_end
-        if _ts0 < ts_start:
-            _ts0 = ts_start
-
-        _ts: uint256 = _ts1 - _ts0
-        start_bias: int128 = bias - slope * convert(_ts0 - _ts_begin, int128)
-        end_bias: int128 = bias - slope * convert(_ts1 - _ts_begin, int128)
-
-        trapezoidArea: uint256 = 0
-        if start_bias < 0:
-            trapezoidArea = 0
-        elif end_bias < 0:
-            end_ts: uint256 = _ts0 + convert(bias / slope, uint256)
-            trapezoidArea = convert(start_bias, uint256) * (end_ts - _ts0) / 2  # triangle
-        else:
-            trapezoidArea = _ts * convert(start_bias + end_bias, uint256) / 2
-
-        areaUnderPolyline += trapezoidArea
-
-        if ts_end == ts_start:  #xx todo discuss
-            assert user_epoch_start == user_epoch_end
-            log _averageUserBlanaceOverEpochDebugS(
-                user_epoch,
-                bias,
-                slope,
-                _ts0,
-                _ts1,
-                _ts,
-                0
-            )
-            log _averageUserBlanaceOverEpochDebug(user_epoch_start, user_epoch_end)
-            return convert(start_bias, uint256)
-
-
-        log _averageUserBlanaceOverEpochDebugS(
-            user_epoch,
-            bias,
-            slope,
-            _ts0,
-            _ts1,
-            _ts,
-            trapezoidArea
-        )
-
-        # next iteration
-        user_epoch += 1
+def _pendingRewardPoint(_token: address) -> RewardPoint:
+    """
+    @notice RewardPoint of the last rewarded epoch of `_token` if that epoch
+            is already closed but not yet written to `token_reward_history`
+    @return Empty RewardPoint (ts1 == 0) if there is nothing to finalize
+    """
+    _epoch: uint256 = self.token_last_rewarded_epoch[_token]
+    ts0: uint256 = self._point_ts(_epoch)
+    if ts0 == self._point_ts(self.epoch):
+        return empty(RewardPoint)  # still open
+
+    n: uint256 = self.token_reward_epoch[_token]
+    last: RewardPoint = self.token_reward_history[_token][n]
+    if n > 0 and last.epoch == _epoch:
+        return empty(RewardPoint)  # already finalized
+
+    amount: uint256 = self.epoch_token_rewards[_epoch][_token]
+    end_epoch: uint256 = self.find_block_epoch(ts0, self.epoch, TS_SHIFT) + 1  # the next recorded time
+    t: uint256 = min(self.token_reward_stream[_token].finish, self._point_ts(self.epoch))
+    stream_updated: uint256 = self.token_reward_stream[_token].updated
+    if t > stream_updated:
+        # the stream released after the epoch is spread over all the epochs closed since then
+        amount += (t - stream_updated) * self.token_reward_stream[_token].rate / MULTIPLIER
+        if t > self._point_ts(end_epoch):
+            end_epoch = self.epoch
+    if amount == 0:
+        return empty(RewardPoint)
+
+    rp: RewardPoint = empty(RewardPoint)
+    rp.epoch = _epoch
+    rp.ts0 = ts0
+    rp.ts1 = self._point_ts(end_epoch)
+    rp.acc, rp.acc_t = self._rewardPointEnd(last)
+
+    area: uint256 = self.packed_point_history[end_epoch][1] % BLK_SHIFT - self.packed_point_history[_epoch][1] % BLK_SHIFT
+    if area != 0:  # nobody to share with: rewards stay in the contract
+        rp.rate = amount * REWARD_MULTIPLIER / area
+    return rp
 
-    log _averageUserBlanaceOverEpochDebug(user_epoch_start, user_epoch_end)
 
-    avgBalance: uint256 = areaUnderPolyline / (ts_end - ts_start)
-    return avgBalance
+@internal
+def _finalizeTokenRewards(_token: address):
+    rp: RewardPoint = self._pendingRewardPoint(_token)
+    if rp.ts1 != 0:
+        n: uint256 = self.token_reward_epoch[_token] + 1
+        self.token_reward_epoch[_token] = n
+        self.token_reward_history[_token][n] = rp
+        t: uint256 = min(self.token_reward_stream[_token].finish, self._point_ts(self.epoch))
+        if t > self.token_reward_stream[_token].updated:
+            # the stream goes on in the current epoch
+            self.token_reward_stream[_token].updated = t
+            self.token_last_rewarded_epoch[_token] = self.epoch
 
 
-event _averageTotalSupplyOverEpoch:
-    _epoch: uint256
-    _ts0: uint256
-    _ts1: uint256
-    bias: int128
-    bias_end: int128
-    slope: int128
-    result: uint256
+@internal
+@view
+def _rewardIntegrals(_token: address, t: uint256, pending: RewardPoint) -> (uint256, uint256):
+    """
+    @notice Accumulated (sum(rate * dt), sum(rate * d(t ** 2))) of `_token` up to `t`
+    @param pending Not yet finalized RewardPoint, taken into account if ts1 != 0
+    """
+    rp: RewardPoint = pending
+    if pending.ts1 == 0 or pending.ts0 > t:
+        # Binary search - as in find_block_epoch BUT OVER ts0
+        _min: uint256 = 0
+        _max: uint256 = self.token_reward_epoch[_token]
+        for i in range(128):  # Will be always enough for 128-bit numbers
+            if _min >= _max:
+                break
+            _mid: uint256 = (_min + _max + 1) / 2
+            if self.token_reward_history[_token][_mid].ts0 <= t:
+                _min = _mid
+            else:
+                _max = _mid - 1
+        rp = self.token_reward_history[_token][_min]
+
+    if t >= rp.ts1:
+        return self._rewardPointEnd(rp)
+    return rp.acc + rp.rate * (t - rp.ts0), rp.acc_t + rp.rate * (t * t - rp.ts0 * rp.ts0)
 
 
 @internal
 @view
-def _averageTotalSupplyOverEpoch(_epoch: uint256) -> uint256:
-    assert _epoch < self.epoch, "incorrect epoch"
-    _ts0: uint256 = self.point_history[_epoch].ts
-    _ts1: uint256 = self.point_history[_epoch+1].ts
-    bias: int128 = self.point_history[_epoch].bias
-    slope: int128 = self.point_history[_epoch].slope
-
-    if _ts0 == _ts1:
-        return convert(bias, uint256)
-
-    _ts: uint256 = _ts1 - _ts0
-    end_bias: int128 = bias - slope * convert(_ts, int128)
-    trapezoidArea: uint256 = 0
-    if end_bias < 0:
-        end_ts: uint256 = _ts0 + convert(bias / slope, uint256)
-        trapezoidArea = convert(bias, uint256) * (end_ts - _ts0) / 2  # triangle
-    else:
-        trapezoidArea = _ts * convert(bias + end_bias, uint256) / 2
-
-    result: uint256 = trapezoidArea / _ts
-    # log _averageTotalSupplyOverEpoch(
-    #     _epoch,
-    #     _ts0,
-    #     _ts1,
-    #     bias,
-    #     end_bias,
-    #     slope,
-    #     result
-    # )
-    return result
+def _userRewards(
+        addr: address,
+        _tokens: DynArray[address, MAX_CLAIM_TOKENS],
+        from_epochs: DynArray[uint256, MAX_CLAIM_TOKENS],
+        to_epoch: uint256,
+        pending: RewardPoint,
+        start_user_epoch: uint256
+) -> (DynArray[uint256, MAX_CLAIM_TOKENS], uint256, uint256):
+    """
+    @notice Rewards of `addr` in every `_tokens[k]` for the epochs [from_epochs[k], to_epoch)
+    @dev On every piece of the user polyline the balance is linear:
+         b(t) = b0 - slope * (t - t0), so
+         2 * sum(rate * integral(b(t) dt)) = 2 * b0 * d_acc - slope * (d_acc_t - 2 * t0 * d_acc)
+         which is exact in integers. The user history is walked once for all the tokens
+    @param pending Not yet finalized RewardPoint of the only token, see _rewardIntegrals
+    @param start_user_epoch User epoch to start the walk from, found by binary search if 0
+    @return Rewards per token, the last user epoch at or before the window end and
+            the window end, before `to_epoch` if the walk stopped at its limit
+    """
+    n: uint256 = len(_tokens)
+    ts_to: uint256 = self._point_ts(to_epoch)
+    ts_from: uint256[MAX_CLAIM_TOKENS] = empty(uint256[MAX_CLAIM_TOKENS])
+    ts_min: uint256 = MAX_UINT256
+    for k in range(MAX_CLAIM_TOKENS):
+        if k >= n:
+            break
+        ts_from[k] = self._point_ts(from_epochs[k])
+        if from_epochs[k] < to_epoch:
+            ts_min = min(ts_min, ts_from[k])
+
+    rewardsAmounts: DynArray[uint256, MAX_CLAIM_TOKENS] = []
+    for k in range(MAX_CLAIM_TOKENS):
+        if k >= n:
+            break
+        rewardsAmounts.append(0)
+    if ts_min == MAX_UINT256:
+        return rewardsAmounts, 0, to_epoch  # nothing to claim
+
+    max_user_epoch: uint256 = self.user_point_epoch[addr]
+    user_epoch: uint256 = start_user_epoch
+    if user_epoch == 0:
+        user_epoch = self._searchForUserEpoch(addr, ts_min, TS_SHIFT)
+    t_prev: uint256[MAX_CLAIM_TOKENS] = empty(uint256[MAX_CLAIM_TOKENS])
+    acc_prev: uint256[MAX_CLAIM_TOKENS] = empty(uint256[MAX_CLAIM_TOKENS])
+    acc_t_prev: uint256[MAX_CLAIM_TOKENS] = empty(uint256[MAX_CLAIM_TOKENS])
+    for i in range(256):
+        if user_epoch > max_user_epoch:
+            break
+        if user_epoch < max_user_epoch:
+            ts: uint256 = self._user_point_ts(addr, user_epoch)
+            if self._user_point_ts(addr, user_epoch + 1) == ts:
+                # only the last of the points at the same time has a piece of nonzero length,
+                # so that checkpoints in one block can't use up the walk
+                user_epoch = self._searchForUserEpoch(addr, ts, TS_SHIFT)
+        upoint: Point = self._unpack_point(self.packed_user_point_history[addr][user_epoch])
+        if upoint.ts > ts_to:
+            break
+        user_epoch += 1
+        if upoint.bias <= 0:
+            continue
+
+        # the piece of the polyline is [t0, t1]
+        t1: uint256 = ts_to
+        if user_epoch <= max_user_epoch:
+            t1 = min(t1, self._user_point_ts(addr, user_epoch))
+        if upoint.slope > 0:
+            t1 = min(t1, upoint.ts + convert(upoint.bias / upoint.slope, uint256))  # lock end
+        slope: uint256 = convert(upoint.slope, uint256)
+
+        for k in range(MAX_CLAIM_TOKENS):
+            if k >= n:
+                break
+            if from_epochs[k] >= to_epoch:
+                continue
+            t0: uint256 = max(upoint.ts, ts_from[k])
+            if t1 <= t0:
+                continue
+
+            acc0: uint256 = acc_prev[k]
+            acc_t0: uint256 = acc_t_prev[k]
+            if t0 != t_prev[k]:
+                acc0, acc_t0 = self._rewardIntegrals(_tokens[k], t0, pending)
+            acc1: uint256 = 0
+            acc_t1: uint256 = 0
+            acc1, acc_t1 = self._rewardIntegrals(_tokens[k], t1, pending)
+            t_prev[k] = t1
+            acc_prev[k] = acc1
+            acc_t_prev[k] = acc_t1
+
+            bias0: uint256 = convert(upoint.bias - upoint.slope * convert(t0 - upoint.ts, int128), uint256)
+            d_acc: uint256 = acc1 - acc0
+            rewardsAmounts[k] += (2 * bias0 * d_acc - slope * (acc_t1 - acc_t0 - 2 * t0 * d_acc)) / REWARD_MULTIPLIER
+
+    window_end: uint256 = to_epoch
+    if user_epoch <= max_user_epoch:
+        ts_stop: uint256 = self._user_point_ts(addr, user_epoch)
+        if ts_stop <= ts_to:
+            # the walk limit: the pieces are summed up to the user point, so the window
+            # ends at the first epoch at its time and the next call goes on from there
+            window_end = self.find_block_epoch(ts_stop - 1, to_epoch, TS_SHIFT) + 1
+    return rewardsAmounts, user_epoch - 1, window_end
+
 
 # from https://ethereum.stackexchange.com/questions/84775/is-there-a-vyper-equivalent-to-openzeppelins-safeerc20-safetransfer
 @internal
@@ -1089,145 +1367,274 @@ def safe_transfer_from(_token: address, _from: address, _to: address, _value: ui
         assert convert(_response, bool), "Transfer failed!"
 
 
+@internal
+def _receive(_token: address, amount: uint256) -> uint256:
+    """
+    @return Amount actually received, less than `amount` for fee on transfer tokens
+    """
+    balance_before: uint256 = ERC20(_token).balanceOf(self)
+    self.safe_transfer_from(_token, msg.sender, self, amount)
+    return ERC20(_token).balanceOf(self) - balance_before
+
+
 event RewardReceived:
     token: indexed(address)
     amount: uint256
     actual_amount: uint256
 
+event RewardStreamReceived:
+    token: indexed(address)
+    amount: uint256
+    actual_amount: uint256
+    rate: uint256
+    finish: uint256
+
+
+@internal
+def _checkpointRewards(_token: address) -> uint256:
+    """
+    @notice Checkpoint the current epoch and finalize the previously rewarded
+            epoch of `_token` before new rewards are added to the current one
+    @dev Adds the part of the `_token` stream released in the current epoch
+         since the last call to it
+    @return Epoch to add the `_token` rewards to, the rewarded one stays while
+            the current epoch has the same start
+    """
+    _epoch: uint256 = self.epoch
+    if block.timestamp >= self._point_ts(_epoch) + EPOCH_SECONDS:
+        self._checkpoint(ZERO_ADDRESS, empty(LockedBalance), empty(LockedBalance))
+        _epoch = self.epoch
+    if self._point_ts(self.token_last_rewarded_epoch[_token]) != self._point_ts(_epoch):
+        self._finalizeTokenRewards(_token)
+        self.token_last_rewarded_epoch[_token] = _epoch
+        self.rewarded_epoch = _epoch
+    _epoch = self.token_last_rewarded_epoch[_token]
+
+    stream: RewardStream = self.token_reward_stream[_token]
+    t: uint256 = min(block.timestamp, stream.finish)
+    if t > stream.updated:
+        self.token_reward_stream[_token].updated = t
+        self.epoch_token_rewards[_epoch][_token] += (t - stream.updated) * stream.rate / MULTIPLIER
+    return _epoch
+
 
 @external
 @payable
 def receiveNativeReward():
-    if (not (
-               (self.point_history[self.epoch].ts <= block.timestamp) and
-               (block.timestamp < self.point_history[self.epoch].ts + EPOCH_SECONDS)
-    )):
-        self._checkpoint(ZERO_ADDRESS, empty(LockedBalance), empty(LockedBalance))
-    self.epoch_token_rewards[self.epoch][ZERO_ADDRESS] += msg.value
+    self.epoch_token_rewards[self._checkpointRewards(ZERO_ADDRESS)][ZERO_ADDRESS] += msg.value
     log RewardReceived(ZERO_ADDRESS, msg.value, msg.value)
 
 
 @external
 def receiveReward(_token: address, amount: uint256):
-    if (not (
-               (self.point_history[self.epoch].ts <= block.timestamp) and
-               (block.timestamp < self.point_history[self.epoch].ts + EPOCH_SECONDS)
-    )):
-        self._checkpoint(ZERO_ADDRESS, empty(LockedBalance), empty(LockedBalance))
-    balance_before: uint256 = ERC20(_token).balanceOf(self)
-    self.safe_transfer_from(_token, msg.sender, self, amount)
-    actual_amount: uint256 = ERC20(_token).balanceOf(self) - balance_before
-    self.epoch_token_rewards[self.epoch][_token] += actual_amount
+    _epoch: uint256 = self._checkpointRewards(_token)
+    actual_amount: uint256 = self._receive(_token, amount)
+    self.epoch_token_rewards[_epoch][_token] += actual_amount
     log RewardReceived(_token, amount, actual_amount)
 
 
+@external
+def receiveRewardStream(_token: address, amount: uint256, _duration: uint256):
+    """
+    @notice Stream `amount` of `_token` to the lockers over `_duration` seconds
+    @dev The released part is shared by balance over time since it was released,
+         see the Rewards section. A top up of an active stream spreads the leftover
+         and `amount` till max(finish, now + _duration) and must not decrease the rate
+    @param _duration Stream duration in seconds
+    """
+    assert _duration > 0, "zero duration"
+    self._checkpointRewards(_token)
+    actual_amount: uint256 = self._receive(_token, amount)
+
+    stream: RewardStream = self.token_reward_stream[_token]
+    finish: uint256 = max(stream.finish, block.timestamp + _duration)
+    leftover: uint256 = 0
+    if stream.finish > block.timestamp:
+        leftover = (stream.finish - block.timestamp) * stream.rate
+    rate: uint256 = (actual_amount * MULTIPLIER + leftover) / (finish - block.timestamp)
+    if stream.finish > block.timestamp:
+        assert rate >= stream.rate, "stream rate decrease"
+    self.token_reward_stream[_token] = RewardStream({rate: rate, finish: finish, updated: block.timestamp})
+    log RewardStreamReceived(_token, amount, actual_amount, rate, finish)
+
+
+@external
+def checkpoint_reward_stream(_token: address):
+    """
+    @notice Add the released part of the `_token` stream to the current epoch rewards
+    @dev Optional, the part released in the closed epochs is claimable anyway
+    """
+    self._checkpointRewards(_token)
+
+
 event UserRewardsClaimed:
     user_claimed_epoch: indexed(uint256)
     token: indexed(address)
     amount: uint256
 
-
-event UserRewardsClaimedDebug:
-    _epoch: uint256
-    _avgUserBlanace: uint256
-    _avgTotalSupply: uint256
-    _epochReward: uint256
-    _userEpochReward: uint256
+# UserRewardsClaimed with the user, who may differ from the sender in claim_rewards_for
+event RewardsClaimed:
+    user: indexed(address)
+    token: indexed(address)
+    user_claimed_epoch: uint256
+    amount: uint256
 
 
-event Log0Args:
-    message: String[256]
+@external
+@view
+def user_token_claimed_epoch(user: address, _token: address) -> uint256:
+    """
+    @notice Last epoch for which `user` claimed `_token` rewards
+    """
+    return self.user_token_claim_cursor[user][_token] % CURSOR_SHIFT
 
 
-event Log1Args:
-    message: String[256]
-    value1: uint256
+@external
+@view
+def user_token_epoch_cursor(user: address, _token: address) -> uint256:
+    """
+    @notice User epoch from which the next claim of `_token` walks the `user` history
+    @dev 0 if never claimed: the walk starts with a binary search
+    """
+    return self.user_token_claim_cursor[user][_token] / CURSOR_SHIFT
 
 
-event Log2Args:
-    message: String[256]
-    value1: uint256
+@internal
+@view
+def _claimableRewards(_users: DynArray[address, MAX_VIEW_USERS], _token: address) -> DynArray[uint256, MAX_VIEW_USERS]:
+    pending: RewardPoint = self._pendingRewardPoint(_token)
+    currentEpoch: uint256 = self.epoch  # note: currentEpoch is not finalized
+    result: DynArray[uint256, MAX_VIEW_USERS] = []
+    for user in _users:
+        cursor: uint256 = self.user_token_claim_cursor[user][_token]
+        rewardsAmounts: DynArray[uint256, MAX_CLAIM_TOKENS] = []
+        user_epoch: uint256 = 0
+        window_end: uint256 = 0
+        rewardsAmounts, user_epoch, window_end = self._userRewards(user, [_token], [cursor % CURSOR_SHIFT + 1], currentEpoch, pending, cursor / CURSOR_SHIFT)
+        result.append(rewardsAmounts[0])
+    return result
 
 
 @external
 @view
 def user_token_claimable_rewards(user: address, _token: address) -> uint256:
-    rewardsAmount: uint256 = 0
-    _user_claimed_epoch: uint256 = self.user_token_claimed_epoch[user][_token]
-    currentEpoch: uint256 = self.epoch  # load to memory once
-    _epoch: uint256 = _user_claimed_epoch
-    for d_epoch in range(255):  #xx 255?
-        _epoch += 1  # move to process the next unprocessed epoch
-        if _epoch >= currentEpoch:  # note: we use >= because currentEpoch is not finalized
+    return self._claimableRewards([user], _token)[0]
+
+
+@external
+@view
+def users_token_claimable_rewards(_users: DynArray[address, MAX_VIEW_USERS], _token: address) -> DynArray[uint256, MAX_VIEW_USERS]:
+    """
+    @notice user_token_claimable_rewards of every user in `_users`
+    @dev The not yet finalized RewardPoint of `_token` is computed once for all the users
+    """
+    return self._claimableRewards(_users, _token)
+
+
+@external
+@view
+def user_token_outstanding_epochs(user: address, _token: address) -> uint256:
+    """
+    @notice Number of closed epochs not yet claimed by `user` in `_token`
+    @dev Use it to split a long backlog into claim_rewards(_token, _max_epochs) chunks
+    """
+    _from_epoch: uint256 = self.user_token_claim_cursor[user][_token] % CURSOR_SHIFT + 1
+    currentEpoch: uint256 = self.epoch
+    if _from_epoch >= currentEpoch:
+        return 0
+    return currentEpoch - _from_epoch
+
+
+@internal
+def _claimRewards(addr: address, _tokens: DynArray[address, MAX_CLAIM_TOKENS], _max_epochs: uint256):
+    """
+    @notice Claim rewards of `addr` for the closed epochs, at most `_max_epochs` of them for every token
+    @dev Rewards are always sent to `addr`
+    """
+    to_epoch: uint256 = self.epoch  # note: the current epoch is not finalized
+    from_epochs: DynArray[uint256, MAX_CLAIM_TOKENS] = []
+    start_user_epoch: uint256 = MAX_UINT256
+    for k in range(MAX_CLAIM_TOKENS):
+        if k >= len(_tokens):
             break
-        _epochReward: uint256 = self.epoch_token_rewards[_epoch][_token]
-        if _epochReward == 0:
-            log Log1Args("skip _epoch {0} because _epochReward=0", _epoch)
-            continue
-        _avgUserBlanace: uint256 = self._averageUserBlanaceOverEpoch(user, _epoch)
-        if _avgUserBlanace == 0:
-            log Log1Args("skip _epoch {0} because _avgUserBlanace=0", _epoch)
-            continue
-        _avgTotalSupply: uint256 = self._averageTotalSupplyOverEpoch(_epoch)
-        if _avgTotalSupply == 0:
-            log Log1Args("skip _epoch {0} because _avgTotalSupply=0", _epoch)
-            continue
-        rewardsAmount += _epochReward * _avgUserBlanace / _avgTotalSupply
-        log UserRewardsClaimedDebug(_epoch, _avgUserBlanace, _avgTotalSupply, _epochReward, _epochReward * _avgUserBlanace / _avgTotalSupply)
-    log UserRewardsClaimed(_epoch - 1, _token, rewardsAmount)
-    return rewardsAmount
+        _token: address = _tokens[k]
+        for j in range(MAX_CLAIM_TOKENS):
+            if j >= k:
+                break
+            assert _tokens[j] != _token, "duplicate token"
+        self._finalizeTokenRewards(_token)
+        cursor: uint256 = self.user_token_claim_cursor[addr][_token]
+        from_epochs.append(cursor % CURSOR_SHIFT + 1)
+        if from_epochs[k] < to_epoch and to_epoch - from_epochs[k] > _max_epochs:
+            to_epoch = from_epochs[k] + _max_epochs  # the same window end for all the tokens
+        # 0 (never claimed) wins and makes the walk start with a binary search
+        start_user_epoch = min(start_user_epoch, cursor / CURSOR_SHIFT)
+
+    rewardsAmounts: DynArray[uint256, MAX_CLAIM_TOKENS] = []
+    user_epoch: uint256 = 0
+    rewardsAmounts, user_epoch, to_epoch = self._userRewards(addr, _tokens, from_epochs, to_epoch, empty(RewardPoint), start_user_epoch)
+
+    for k in range(MAX_CLAIM_TOKENS):
+        if k >= len(_tokens):
+            break
+        if from_epochs[k] < to_epoch:
+            self.user_token_claim_cursor[addr][_tokens[k]] = to_epoch - 1 + CURSOR_SHIFT * user_epoch
+
+    for k in range(MAX_CLAIM_TOKENS):
+        if k >= len(_tokens):
+            break
+        _token: address = _tokens[k]
+        if _token == ZERO_ADDRESS:
+            send(addr, rewardsAmounts[k])
+        else:
+            self.safe_transfer(_token, addr, rewardsAmounts[k])
+        claimed_epoch: uint256 = self.user_token_claim_cursor[addr][_token] % CURSOR_SHIFT
+        log UserRewardsClaimed(claimed_epoch, _token, rewardsAmounts[k])
+        log RewardsClaimed(addr, _token, claimed_epoch, rewardsAmounts[k])
 
 
 #xx todo what if rewards but no locker?
 @external
-def claim_rewards(_token: address):
-    rewardsAmount: uint256 = 0
-    _user_claimed_epoch: uint256 = self.user_token_claimed_epoch[msg.sender][_token]
-    currentEpoch: uint256 = self.epoch  # load to memory once
-    _epoch: uint256 = _user_claimed_epoch
-    for d_epoch in range(255):  #xx 255?
-        _epoch += 1  # move to process the next unprocessed epoch
-        if _epoch >= currentEpoch:  # note: we use >= because curerntEpoch is not finalized
-            break
-        _epochReward: uint256 = self.epoch_token_rewards[_epoch][_token]
-        if _epochReward == 0:
-            log Log1Args("skip _epoch {0} because _epochReward=0", _epoch)
-            continue
-        _avgUserBlanace: uint256 = self._averageUserBlanaceOverEpoch(msg.sender, _epoch)
-        if _avgUserBlanace == 0:
-            log Log1Args("skip _epoch {0} because _avgUserBlanace=0", _epoch)
-            continue
-        _avgTotalSupply: uint256 = self._averageTotalSupplyOverEpoch(_epoch)
-        if _avgTotalSupply == 0:
-            log Log1Args("skip _epoch {0} because _avgTotalSupply=0", _epoch)
-            continue
-        rewardsAmount += _epochReward * _avgUserBlanace / _avgTotalSupply
-        log UserRewardsClaimedDebug(_epoch, _avgUserBlanace, _avgTotalSupply, _epochReward, _epochReward * _avgUserBlanace / _avgTotalSupply)
-    self.user_token_claimed_epoch[msg.sender][_token] = _epoch - 1
+def claim_rewards(_token: address, _max_epochs: uint256 = MAX_UINT256):
+    """
+    @notice Claim `_token` rewards
+    @dev A claim walks at most 256 distinct times of user checkpoints and stops at the
+         next one, the rest is left for the next calls as with `_max_epochs`
+    @param _max_epochs Claim at most this many epochs, the rest is left for the next calls
+    """
+    self._claimRewards(msg.sender, [_token], _max_epochs)
 
-    if _token == ZERO_ADDRESS:
-        send(msg.sender, rewardsAmount)
-    else:
-        self.safe_transfer(_token, msg.sender, rewardsAmount)
 
-    log UserRewardsClaimed(_epoch - 1, _token, rewardsAmount)
+@external
+def claim_rewards_many(_tokens: DynArray[address, MAX_CLAIM_TOKENS]):
+    """
+    @notice Claim rewards in several tokens at once
+    @dev Cheaper than separate claims: the user history is walked only once
+    @param _tokens Reward tokens, ZERO_ADDRESS for the native coin
+    """
+    self._claimRewards(msg.sender, _tokens, MAX_UINT256)
+
 
 @external
-def emergency_withdraw(_token: address, _amount: uint256, to: address):
-    assert msg.sender == self._admin()
-    if _token == ZERO_ADDRESS:
-        send(to, _amount)
-    else:
-        self.safe_transfer(_token, to, _amount)
+def claim_rewards_for(_users: DynArray[address, MAX_CLAIM_USERS], _token: address, _max_epochs: uint256 = MAX_UINT256):
+    """
+    @notice Claim `_token` rewards for several users at once
+    @dev As FeeDistributor.claim_many: anyone may call it, rewards are sent to the users
+    @param _users Users to claim for
+    @param _max_epochs Claim at most this many epochs for every user, see claim_rewards,
+           so that a user with a long backlog can't make the batch run out of gas
+    """
+    for _user in _users:
+        self._claimRewards(_user, [_token], _max_epochs)
+
 
 @external
-def emergency_withdraw_many(_tokens: address[30], _amounts: uint256[30], tos: address[30]):
-    assert msg.sender == self._admin()
-    for i in range(30):
-        _token: address = _tokens[i]
-        _amount: uint256 = _amounts[i]
-        to: address = tos[i]
-        if _token == ZERO_ADDRESS:
-            send(to, _amount)
-        else:
-            self.safe_transfer(_token, to, _amount)
+def __default__():
+    """
+    @notice Admin functions (transfer_ownership, set_*, pause, unpause, enable_emergency,
+            emergency_withdraw*) are implemented by VotingEscrowSettings
+    @dev Runs them in this storage, use interfaces/VotingEscrowAdmin.vy (or the
+         VotingEscrowSettings ABI) at this address. Any other call reverts
+    """
+    assert self.settings_selectors[convert(slice(msg.data, 0, 4), bytes4)]  # dev: unknown function
+    raw_call(self.settings, msg.data, is_delegate_call=True)
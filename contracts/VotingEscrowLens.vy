@@ -0,0 +1,409 @@
+# @version 0.3.7
+"""
+@title Voting Escrow Lens
+@license MIT
+@notice Read-only diagnostics and bulk views of VotingEscrow
+@dev Deployed separately to keep VotingEscrow under the contract size limit,
+     everything is read through the VotingEscrow getters. Not meant to be
+     called on-chain: the views make one external call per point or user,
+     but one eth_call replaces hundreds of them.
+"""
+
+struct Point:
+    bias: int128
+    slope: int128  # - dweight / dt
+    ts: uint256
+    blk: uint256  # block
+
+struct SlopeChange:
+    ts: uint256
+    slope: int128  # signed slope change, as VotingEscrow.slope_changes
+
+struct LockedBalance:
+    amount: int128
+    end: uint256
+
+struct UserLock:
+    amount: int128
+    end: uint256
+    user_point_epoch: uint256
+
+struct ClaimEpoch:
+    epoch: uint256
+    ts0: uint256  # epoch start
+    ts1: uint256  # epoch end
+    rewards: uint256  # received in the epoch
+    supply_area: uint256  # 2 * area under the total supply
+    user_area: uint256  # 2 * area under the user balance
+    amount: uint256  # user share of the rewards
+
+
+interface VotingEscrow:
+    def epoch() -> uint256: view
+    def point_history(_epoch: uint256) -> Point: view
+    def epoch_supply_area(_epoch: uint256) -> uint256: view
+    def supply_area_cumulative(_epoch: uint256) -> uint256: view
+    def epoch_token_rewards(_epoch: uint256, _token: address) -> uint256: view
+    def user_point_epoch(addr: address) -> uint256: view
+    def user_point_history(addr: address, _idx: uint256) -> Point: view
+    def user_point_history__ts(_addr: address, _idx: uint256) -> uint256: view
+    def user_area_cumulative(addr: address, _idx: uint256) -> uint256: view
+    def slope_changes(_t: uint256) -> int128: view
+    def next_slope_change(_t: uint256) -> uint256: view
+    def locked(addr: address) -> LockedBalance: view
+    def balanceOf(addr: address, _t: uint256) -> uint256: view
+    def balanceOfAt(addr: address, _block: uint256) -> uint256: view
+    def user_token_claimable_rewards(user: address, _token: address) -> uint256: view
+    def users_token_claimable_rewards(_users: DynArray[address, MAX_USERS], _token: address) -> DynArray[uint256, MAX_USERS]: view
+
+
+REWARD_MULTIPLIER: constant(uint256) = 10 ** 36  # as VotingEscrow.REWARD_MULTIPLIER
+MAX_EXPLAIN_EPOCHS: constant(uint256) = 256  # epochs in explain_claim
+MAX_USERS: constant(uint256) = 256  # users in the bulk views, as VotingEscrow.MAX_VIEW_USERS
+MAX_TOKENS: constant(uint256) = 10  # tokens in claimable_many, as VotingEscrow.MAX_CLAIM_TOKENS
+MAX_RANGE: constant(uint256) = 512  # points or slope changes in the range views
+
+voting_escrow: public(address)
+
+
+@external
+def __init__(_voting_escrow: address):
+    self.voting_escrow = _voting_escrow
+
+
+@internal
+@view
+def _user_area_until(addr: address, _t: uint256) -> (uint256, uint256):
+    """
+    @notice Twice the area under the balance of `addr` from its first point till `_t` and the balance at `_t`
+    @dev The cumulative area of the last user point before `_t` plus the piece after it,
+         which stops at the lock end as in VotingEscrow._userRewards
+    """
+    ve: address = self.voting_escrow
+
+    # Binary search - as in VotingEscrow._searchForUserEpoch
+    _min: uint256 = 0
+    _max: uint256 = VotingEscrow(ve).user_point_epoch(addr)
+    for i in range(128):  # Will be always enough for 128-bit numbers
+        if _min >= _max:
+            break
+        _mid: uint256 = (_min + _max + 1) / 2
+        if VotingEscrow(ve).user_point_history__ts(addr, _mid) <= _t:
+            _min = _mid
+        else:
+            _max = _mid - 1
+
+    upoint: Point = VotingEscrow(ve).user_point_history(addr, _min)
+    dt: uint256 = _t - upoint.ts
+    if upoint.slope > 0:
+        dt = min(dt, convert(upoint.bias / upoint.slope, uint256))  # lock end
+    bal: uint256 = 0
+    if dt == _t - upoint.ts:
+        bal = convert(upoint.bias - upoint.slope * convert(dt, int128), uint256)
+    area: uint256 = VotingEscrow(ve).user_area_cumulative(addr, _min) + dt * convert(2 * upoint.bias - upoint.slope * convert(dt, int128), uint256)
+    return area, bal
+
+
+@internal
+@view
+def _find_epoch(_t: uint256) -> uint256:
+    """
+    @notice Last global epoch at or before the time `_t`
+    """
+    ve: address = self.voting_escrow
+    # Binary search - as in VotingEscrow.find_block_epoch BUT OVER ts
+    _min: uint256 = 0
+    _max: uint256 = VotingEscrow(ve).epoch()
+    for i in range(128):  # Will be always enough for 128-bit numbers
+        if _min >= _max:
+            break
+        _mid: uint256 = (_min + _max + 1) / 2
+        if VotingEscrow(ve).point_history(_mid).ts <= _t:
+            _min = _mid
+        else:
+            _max = _mid - 1
+    return _min
+
+
+@internal
+@view
+def _user_area(addr: address, t0: uint256, t1: uint256) -> uint256:
+    """
+    @notice Twice the area under the balance of `addr` over [t0, t1]
+    """
+    area0: uint256 = 0
+    balance0: uint256 = 0
+    area0, balance0 = self._user_area_until(addr, t0)
+    area1: uint256 = 0
+    balance1: uint256 = 0
+    area1, balance1 = self._user_area_until(addr, t1)
+    return area1 - area0
+
+
+@external
+@view
+def explain_claim(
+        _user: address, _token: address, _from_epoch: uint256, _to_epoch: uint256
+) -> DynArray[ClaimEpoch, MAX_EXPLAIN_EPOCHS]:
+    """
+    @notice Per epoch breakdown of the `_token` rewards of `_user`
+    @dev The epochs [_from_epoch, _to_epoch), only the closed ones and at most
+         MAX_EXPLAIN_EPOCHS of them. A claim covers the epochs from
+         user_token_claimed_epoch + 1, the amounts add up to it up to the rounding,
+         which the claim does once per piece of the user polyline
+    @param _user User wallet
+    @param _token Reward token, ZERO_ADDRESS for the native coin
+    @param _from_epoch First epoch
+    @param _to_epoch Epoch after the last one
+    @return Rewards, areas and the user amount of every epoch
+    """
+    ve: address = self.voting_escrow
+    max_epoch: uint256 = VotingEscrow(ve).epoch()
+    to_epoch: uint256 = min(_to_epoch, max_epoch)  # the current epoch is not closed
+    result: DynArray[ClaimEpoch, MAX_EXPLAIN_EPOCHS] = []
+    point: Point = VotingEscrow(ve).point_history(_from_epoch)
+    for _epoch in range(_from_epoch, _from_epoch + MAX_EXPLAIN_EPOCHS):
+        if _epoch >= to_epoch:
+            break
+        next_point: Point = VotingEscrow(ve).point_history(_epoch + 1)
+        item: ClaimEpoch = empty(ClaimEpoch)
+        item.epoch = _epoch
+        item.ts0 = point.ts
+        item.ts1 = next_point.ts
+        item.rewards = VotingEscrow(ve).epoch_token_rewards(_epoch, _token)
+        item.supply_area = VotingEscrow(ve).epoch_supply_area(_epoch)
+        if item.ts0 == item.ts1 and item.rewards != 0:
+            # the rewards of a zero length epoch are shared over the time till
+            # the next recorded one, as in VotingEscrow._pendingRewardPoint
+            end_epoch: uint256 = self._find_epoch(item.ts0) + 1
+            if end_epoch <= max_epoch:
+                item.ts1 = VotingEscrow(ve).point_history(end_epoch).ts
+                item.supply_area = VotingEscrow(ve).supply_area_cumulative(end_epoch) - VotingEscrow(ve).supply_area_cumulative(_epoch)
+        if item.rewards != 0 and item.supply_area != 0:
+            item.user_area = self._user_area(_user, item.ts0, item.ts1)
+            # the same rate as in the reward index
+            item.amount = item.rewards * REWARD_MULTIPLIER / item.supply_area * item.user_area / REWARD_MULTIPLIER
+        result.append(item)
+        point = next_point
+    return result
+
+
+@external
+@view
+def balances_of(_users: DynArray[address, MAX_USERS], _t: uint256) -> DynArray[uint256, MAX_USERS]:
+    """
+    @notice VotingEscrow.balanceOf of every user at the time `_t`
+    """
+    ve: address = self.voting_escrow
+    result: DynArray[uint256, MAX_USERS] = []
+    for user in _users:
+        result.append(VotingEscrow(ve).balanceOf(user, _t))
+    return result
+
+
+@external
+@view
+def balances_of_at(_users: DynArray[address, MAX_USERS], _block: uint256) -> DynArray[uint256, MAX_USERS]:
+    """
+    @notice VotingEscrow.balanceOfAt of every user at the block `_block`
+    @dev The time of the block is interpolated once for all the users, as in VotingEscrow._block_time
+    """
+    assert _block <= block.number
+    ve: address = self.voting_escrow
+
+    # Binary search - as in VotingEscrow.find_block_epoch
+    max_epoch: uint256 = VotingEscrow(ve).epoch()
+    _min: uint256 = 0
+    _max: uint256 = max_epoch
+    for i in range(128):  # Will be always enough for 128-bit numbers
+        if _min >= _max:
+            break
+        _mid: uint256 = (_min + _max + 1) / 2
+        if VotingEscrow(ve).point_history(_mid).blk <= _block:
+            _min = _mid
+        else:
+            _max = _mid - 1
+    point_0: Point = VotingEscrow(ve).point_history(_min)
+    d_block: uint256 = block.number - point_0.blk
+    d_t: uint256 = block.timestamp - point_0.ts
+    if _min < max_epoch:
+        point_1: Point = VotingEscrow(ve).point_history(_min + 1)
+        d_block = point_1.blk - point_0.blk
+        d_t = point_1.ts - point_0.ts
+    block_time: uint256 = point_0.ts
+    if d_block != 0:
+        block_time += d_t * (_block - point_0.blk) / d_block
+
+    result: DynArray[uint256, MAX_USERS] = []
+    for user in _users:
+        # Binary search - as in VotingEscrow._searchForUserEpoch
+        _min = 0
+        _max = VotingEscrow(ve).user_point_epoch(user)
+        for i in range(128):  # Will be always enough for 128-bit numbers
+            if _min >= _max:
+                break
+            _mid: uint256 = (_min + _max + 1) / 2
+            if VotingEscrow(ve).user_point_history(user, _mid).blk <= _block:
+                _min = _mid
+            else:
+                _max = _mid - 1
+        upoint: Point = VotingEscrow(ve).user_point_history(user, _min)
+        upoint.bias -= upoint.slope * convert(block_time - upoint.ts, int128)
+        result.append(convert(max(upoint.bias, 0), uint256))
+    return result
+
+
+@external
+@view
+def locked_many(_users: DynArray[address, MAX_USERS]) -> DynArray[UserLock, MAX_USERS]:
+    """
+    @notice Lock and number of checkpoints of every user
+    """
+    ve: address = self.voting_escrow
+    result: DynArray[UserLock, MAX_USERS] = []
+    for user in _users:
+        _locked: LockedBalance = VotingEscrow(ve).locked(user)
+        result.append(UserLock({
+            amount: _locked.amount, end: _locked.end, user_point_epoch: VotingEscrow(ve).user_point_epoch(user)
+        }))
+    return result
+
+
+@external
+@view
+def claimable_many(
+        _users: DynArray[address, MAX_USERS], _tokens: DynArray[address, MAX_TOKENS]
+) -> DynArray[DynArray[uint256, MAX_TOKENS], MAX_USERS]:
+    """
+    @notice VotingEscrow.user_token_claimable_rewards of every user in every token
+    @dev One VotingEscrow.users_token_claimable_rewards call per token, which
+         prepares the reward index of the token once for all the users
+    @return result[i][k] is claimable by `_users[i]` in `_tokens[k]`
+    """
+    ve: address = self.voting_escrow
+    per_token: DynArray[DynArray[uint256, MAX_USERS], MAX_TOKENS] = []
+    for _token in _tokens:
+        per_token.append(VotingEscrow(ve).users_token_claimable_rewards(_users, _token))
+    result: DynArray[DynArray[uint256, MAX_TOKENS], MAX_USERS] = []
+    for i in range(MAX_USERS):
+        if i >= len(_users):
+            break
+        amounts: DynArray[uint256, MAX_TOKENS] = []
+        for k in range(MAX_TOKENS):
+            if k >= len(_tokens):
+                break
+            amounts.append(per_token[k][i])
+        result.append(amounts)
+    return result
+
+
+@external
+@view
+def point_history_range(_start: uint256, _count: uint256) -> DynArray[Point, MAX_RANGE]:
+    """
+    @notice VotingEscrow.point_history of the epochs [_start, _start + _count)
+    @dev Stops at the current epoch and after MAX_RANGE points, continue from
+         _start + len(result)
+    """
+    ve: address = self.voting_escrow
+    end: uint256 = min(_start + min(_count, MAX_RANGE), VotingEscrow(ve).epoch() + 1)
+    result: DynArray[Point, MAX_RANGE] = []
+    for _epoch in range(_start, _start + MAX_RANGE):
+        if _epoch >= end:
+            break
+        result.append(VotingEscrow(ve).point_history(_epoch))
+    return result
+
+
+@external
+@view
+def user_point_history_range(_addr: address, _start: uint256, _count: uint256) -> DynArray[Point, MAX_RANGE]:
+    """
+    @notice VotingEscrow.user_point_history of `_addr` for the user epochs [_start, _start + _count)
+    @dev Stops at user_point_epoch and after MAX_RANGE points, continue from
+         _start + len(result)
+    """
+    ve: address = self.voting_escrow
+    end: uint256 = min(_start + min(_count, MAX_RANGE), VotingEscrow(ve).user_point_epoch(_addr) + 1)
+    result: DynArray[Point, MAX_RANGE] = []
+    for _idx in range(_start, _start + MAX_RANGE):
+        if _idx >= end:
+            break
+        result.append(VotingEscrow(ve).user_point_history(_addr, _idx))
+    return result
+
+
+@external
+@view
+def slope_changes_range(_t0: uint256, _t1: uint256) -> DynArray[SlopeChange, MAX_RANGE]:
+    """
+    @notice Scheduled slope changes at the times after `_t0` up to `_t1`
+    @dev Stops after MAX_RANGE of them, continue from the time of the last one.
+         The times come from VotingEscrow.next_slope_change, which finds the slope
+         changes after any gap up to block.timestamp + MAXTIME
+    """
+    ve: address = self.voting_escrow
+    result: DynArray[SlopeChange, MAX_RANGE] = []
+    t: uint256 = _t0
+    for i in range(MAX_RANGE):
+        t = VotingEscrow(ve).next_slope_change(t)
+        if t == 0 or t > _t1:
+            break
+        result.append(SlopeChange({ts: t, slope: VotingEscrow(ve).slope_changes(t)}))
+    return result
+
+
+@internal
+@view
+def _supply_area_until(_t: uint256) -> uint256:
+    """
+    @notice Twice the area under the total supply from the first point till `_t`
+    @dev The cumulative area of the last point before `_t` plus the linear pieces after it
+    """
+    ve: address = self.voting_escrow
+    _min: uint256 = self._find_epoch(_t)
+    area: uint256 = VotingEscrow(ve).supply_area_cumulative(_min)
+    point: Point = VotingEscrow(ve).point_history(_min)
+    if point.ts >= _t:
+        return area  # before the first point
+    # the supply is linear until the next slope change, as in VotingEscrow.supply_at
+    for i in range(255):
+        t_i: uint256 = VotingEscrow(ve).next_slope_change(point.ts)
+        if t_i == 0 or t_i > _t:
+            t_i = _t
+        end_bias: int128 = point.bias - point.slope * convert(t_i - point.ts, int128)
+        if end_bias < 0:
+            # triangle: the supply reaches zero inside the piece
+            area += convert(point.bias, uint256) * convert(point.bias / point.slope, uint256)
+        else:
+            area += (t_i - point.ts) * convert(point.bias + end_bias, uint256)
+        if t_i == _t:
+            break
+        point.bias = max(end_bias, 0)
+        point.slope = max(point.slope + VotingEscrow(ve).slope_changes(t_i), 0)
+        point.ts = t_i
+    return area
+
+
+@external
+@view
+def average_total_supply(_t0: uint256, _t1: uint256) -> uint256:
+    """
+    @notice Average total supply over [_t0, _t1)
+    @dev Two binary searches over VotingEscrow.supply_area_cumulative instead of
+         a walk over the epochs, the future is extrapolated as VotingEscrow.totalSupply does
+    """
+    assert _t0 < _t1, "empty interval"
+    return (self._supply_area_until(_t1) - self._supply_area_until(_t0)) / (2 * (_t1 - _t0))
+
+
+@external
+@view
+def average_balance(_addr: address, _t0: uint256, _t1: uint256) -> uint256:
+    """
+    @notice Average balance of `_addr` over [_t0, _t1)
+    @dev Two binary searches over VotingEscrow.user_area_cumulative whatever the number
+         of user points in between
+    """
+    assert _t0 < _t1, "empty interval"
+    return self._user_area(_addr, _t0, _t1) / (2 * (_t1 - _t0))
@@ -0,0 +1,199 @@
+# @version 0.3.7
+"""
+@title Voting Escrow Merkle Rewards
+@license MIT
+@notice Rewards of the VotingEscrow lockers distributed by Merkle roots
+@dev An alternative to the on-chain reward index for pools where it is too
+     expensive: the shares of a period are computed off-chain from
+     user_point_history (scripts/stats/ve_merkle.py) and the VotingEscrow admin
+     posts their root together with the rewards. A claim is one proof per period
+     whatever the number of epochs in it. The leaves are
+     keccak256(index, user, amount), 32 bytes each, in a tree padded with zero
+     leaves to a power of two, the proof goes from the leaf to the root
+"""
+
+interface ERC20:
+    def balanceOf(account: address) -> uint256: view
+
+interface VotingEscrow:
+    def admin() -> address: view
+
+
+struct Claim:
+    period: uint256
+    index: uint256
+    user: address
+    amount: uint256
+    proof: DynArray[bytes32, MAX_PROOF_LENGTH]
+
+
+event RootPosted:
+    period: indexed(uint256)
+    token: indexed(address)
+    root: bytes32
+    amount: uint256
+
+event PeriodCancelled:
+    period: indexed(uint256)
+    to: address
+    amount: uint256
+
+event Claimed:
+    period: indexed(uint256)
+    user: indexed(address)
+    token: indexed(address)
+    index: uint256
+    amount: uint256
+
+
+MAX_PROOF_LENGTH: constant(uint256) = 20  # as the MerkleTree depth limit
+MAX_CLAIMS: constant(uint256) = 20  # claims in claim_many
+
+voting_escrow: public(address)
+period_count: public(uint256)
+period_root: public(HashMap[uint256, bytes32])
+period_token: public(HashMap[uint256, address])
+period_amount: public(HashMap[uint256, uint256])  # funded, the claims can't take more
+period_claimed: public(HashMap[uint256, uint256])
+claimed_bitmap: public(HashMap[uint256, HashMap[uint256, uint256]])  # period -> index / 256 -> bit index % 256
+
+
+@external
+def __init__(_voting_escrow: address):
+    """
+    @param _voting_escrow VotingEscrow whose admin posts the roots
+    """
+    self.voting_escrow = _voting_escrow
+
+
+# from https://ethereum.stackexchange.com/questions/84775/is-there-a-vyper-equivalent-to-openzeppelins-safeerc20-safetransfer
+@internal
+def safe_transfer(_token: address, _to: address, _value: uint256):
+    _response: Bytes[32] = raw_call(
+        _token,
+        concat(
+            method_id("transfer(address,uint256)"),
+            convert(_to, bytes32),
+            convert(_value, bytes32)
+        ),
+        max_outsize=32
+    )
+    if len(_response) > 0:
+        assert convert(_response, bool), "Transfer failed!"
+
+
+@internal
+def safe_transfer_from(_token: address, _from: address, _to: address, _value: uint256):
+    _response: Bytes[32] = raw_call(
+        _token,
+        concat(
+            method_id("transferFrom(address,address,uint256)"),
+            convert(_from, bytes32),
+            convert(_to, bytes32),
+            convert(_value, bytes32)
+        ),
+        max_outsize=32
+    )
+    if len(_response) > 0:
+        assert convert(_response, bool), "Transfer failed!"
+
+
+@external
+def post_root(_token: address, _root: bytes32, _amount: uint256) -> uint256:
+    """
+    @notice Open a period paying `_amount` of `_token` by the shares committed in `_root`
+    @dev The amount is transferred from the caller, the leaves must not add up to more
+    @return The period id
+    """
+    assert msg.sender == VotingEscrow(self.voting_escrow).admin(), "not admin"
+    assert _root != empty(bytes32), "empty root"
+    balance_before: uint256 = ERC20(_token).balanceOf(self)
+    self.safe_transfer_from(_token, msg.sender, self, _amount)
+    actual_amount: uint256 = ERC20(_token).balanceOf(self) - balance_before
+
+    period: uint256 = self.period_count
+    self.period_count = period + 1
+    self.period_root[period] = _root
+    self.period_token[period] = _token
+    self.period_amount[period] = actual_amount
+    log RootPosted(period, _token, _root, actual_amount)
+    return period
+
+
+@external
+def cancel_period(_period: uint256, _to: address):
+    """
+    @notice Close `_period`, e.g. posted with a wrong root, and send its unclaimed rewards to `_to`
+    """
+    assert msg.sender == VotingEscrow(self.voting_escrow).admin(), "not admin"
+    assert self.period_root[_period] != empty(bytes32), "no root"
+    amount: uint256 = self.period_amount[_period] - self.period_claimed[_period]
+    self.period_root[_period] = empty(bytes32)
+    self.period_amount[_period] = self.period_claimed[_period]
+    self.safe_transfer(self.period_token[_period], _to, amount)
+    log PeriodCancelled(_period, _to, amount)
+
+
+@external
+@view
+def is_claimed(_period: uint256, _index: uint256) -> bool:
+    return self.claimed_bitmap[_period][_index / 256] & 2 ** (_index % 256) != 0
+
+
+@internal
+@pure
+def _verify(_root: bytes32, _leaf: bytes32, _index: uint256, _proof: DynArray[bytes32, MAX_PROOF_LENGTH]) -> bool:
+    """
+    @dev The bits of `_index` tell on which side the nodes are, as in MerkleTree.get_proof.
+         The index must be below 2 ** len(_proof) so that every leaf has one bit
+    """
+    node: bytes32 = _leaf
+    index: uint256 = _index
+    for sibling in _proof:
+        if index % 2 == 0:
+            node = keccak256(concat(node, sibling))
+        else:
+            node = keccak256(concat(sibling, node))
+        index /= 2
+    return index == 0 and node == _root
+
+
+@internal
+def _claim(_claim: Claim):
+    root: bytes32 = self.period_root[_claim.period]
+    assert root != empty(bytes32), "no root"
+    word: uint256 = self.claimed_bitmap[_claim.period][_claim.index / 256]
+    bit: uint256 = 2 ** (_claim.index % 256)
+    assert word & bit == 0, "already claimed"
+    leaf: bytes32 = keccak256(concat(
+        convert(_claim.index, bytes32), convert(_claim.user, bytes32), convert(_claim.amount, bytes32)
+    ))
+    assert self._verify(root, leaf, _claim.index, _claim.proof), "invalid proof"
+
+    self.claimed_bitmap[_claim.period][_claim.index / 256] = word | bit
+    claimed: uint256 = self.period_claimed[_claim.period] + _claim.amount
+    assert claimed <= self.period_amount[_claim.period], "period overdrawn"
+    self.period_claimed[_claim.period] = claimed
+    _token: address = self.period_token[_claim.period]
+    self.safe_transfer(_token, _claim.user, _claim.amount)
+    log Claimed(_claim.period, _claim.user, _token, _claim.index, _claim.amount)
+
+
+@external
+def claim(_period: uint256, _index: uint256, _user: address, _amount: uint256, _proof: DynArray[bytes32, MAX_PROOF_LENGTH]):
+    """
+    @notice Claim the share of `_user` in `_period`
+    @dev Anyone may call it, the rewards are always sent to `_user`
+    @param _index Leaf index
+    @param _proof Sibling nodes from the leaf up to the root
+    """
+    self._claim(Claim({period: _period, index: _index, user: _user, amount: _amount, proof: _proof}))
+
+
+@external
+def claim_many(_claims: DynArray[Claim, MAX_CLAIMS]):
+    """
+    @notice Claim several periods or users at once
+    """
+    for c in _claims:
+        self._claim(c)
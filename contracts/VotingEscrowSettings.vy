@@ -1,8 +1,21 @@
 # @version 0.3.7
+"""
+@title Voting Escrow Settings
+@license MIT
+@notice Admin functions of VotingEscrow
+@dev Never called directly: VotingEscrow delegatecalls it from `__default__`,
+     so everything here runs in the VotingEscrow storage. The layout must match:
+     VotingEscrow starts with the nonreentrant lock (slot 0) and the storage*
+     mappings, having a @nonreentrant('lock') function here allocates the same slot 0.
+     The settings read by the user entry points are packed into `packed_settings`,
+     declared right after the storage* mappings in both contracts, the rest live
+     in the storage* mappings under their hashes.
+"""
 
 storageUInt256: HashMap[bytes32, uint256]
 storageAddress: HashMap[bytes32, address]
 storageBool: HashMap[bytes32, bool]
+packed_settings: uint256
 
 
 event TransferOwnership:
@@ -12,9 +25,45 @@ event TransferOwnership:
 event MinDelayBetweenManualCheckpointSet:
     value: uint256
 
+event IncreaseAmountDisabledSet:
+    value: bool
+
+event IncreaseUnlockTimeDisabledSet:
+    value: bool
+
+event CreateLockDisabledSet:
+    value: bool
+
+event WithdrawDisabledSet:
+    value: bool
+
+event MinStakeAmountSet:
+    value: uint256
+
+event MaxPoolMembersSet:
+    value: uint256
+
+event Emergency:
+    pass
+
 
 ADMIN_HASH: constant(bytes32) = keccak256("admin")
-MIN_DELAY_BETWEEN_MANUAL_CHECKPOINT_HASH: constant(bytes32) = keccak256("min_delay_between_manual_checkpoint")
+SMART_WALLET_CHECKER_HASH: constant(bytes32) = keccak256("smart_wallet_checker")
+
+# packed_settings fields as in VotingEscrow: a field of `size` values at `shift`
+INCREASE_AMOUNT_DISABLED_FLAG: constant(uint256) = 1
+INCREASE_UNLOCK_TIME_DISABLED_FLAG: constant(uint256) = 2
+CREATE_LOCK_DISABLED_FLAG: constant(uint256) = 4
+WITHDRAW_DISABLED_FLAG: constant(uint256) = 8
+EMERGENCY_FLAG: constant(uint256) = 16
+VERSION_SHIFT: constant(uint256) = 2 ** 8
+VERSION_SIZE: constant(uint256) = 2 ** 24
+MAX_POOL_MEMBERS_SHIFT: constant(uint256) = 2 ** 32
+MAX_POOL_MEMBERS_SIZE: constant(uint256) = 2 ** 32
+MIN_DELAY_SHIFT: constant(uint256) = 2 ** 64
+MIN_DELAY_SIZE: constant(uint256) = 2 ** 64
+MIN_STAKE_AMOUNT_SHIFT: constant(uint256) = 2 ** 128
+MIN_STAKE_AMOUNT_SIZE: constant(uint256) = 2 ** 128
 
 
 @internal
@@ -24,16 +73,41 @@ def _admin() -> address:
 
 
 @internal
-@view
-def min_delay_between_manual_checkpoint() -> uint256:
-    return self.storageUInt256[MIN_DELAY_BETWEEN_MANUAL_CHECKPOINT_HASH]
+@pure
+def _field(_settings: uint256, _shift: uint256, _size: uint256) -> uint256:
+    return _settings / _shift % _size
+
+
+@internal
+@pure
+def _with_field(_settings: uint256, _shift: uint256, _size: uint256, _value: uint256) -> uint256:
+    """
+    @notice `_settings` with the field at `_shift` replaced by `_value`
+    """
+    assert _value < _size, "out of range"
+    return _settings - self._field(_settings, _shift, _size) * _shift + _value * _shift
+
+
+@internal
+def _store_settings(_settings: uint256):
+    """
+    @notice Write the packed settings, every change bumps settings_version
+    """
+    version: uint256 = self._field(_settings, VERSION_SHIFT, VERSION_SIZE)
+    self.packed_settings = self._with_field(_settings, VERSION_SHIFT, VERSION_SIZE, (version + 1) % VERSION_SIZE)
+
+
+@internal
+def _set_field(_shift: uint256, _size: uint256, _value: uint256):
+    assert msg.sender == self._admin(), "not admin"
+    settings: uint256 = self.packed_settings
+    assert self._field(settings, _shift, _size) != _value, "not changed"
+    self._store_settings(self._with_field(settings, _shift, _size, _value))
 
 
 @external
 def set_min_delay_between_manual_checkpoint(_value: uint256):
-    assert msg.sender == self._admin(), "not admin"
-    assert self.min_delay_between_manual_checkpoint() != _value, "not changed"
-    self.storageUInt256[MIN_DELAY_BETWEEN_MANUAL_CHECKPOINT_HASH] = _value
+    self._set_field(MIN_DELAY_SHIFT, MIN_DELAY_SIZE, _value)
     log MinDelayBetweenManualCheckpointSet(_value)
 
 
@@ -46,4 +120,186 @@ def transfer_ownership(addr: address):
     assert msg.sender == self._admin(), "not admin"  # dev: admin only
     assert addr != ZERO_ADDRESS  # dev: admin not set
     self.storageAddress[ADMIN_HASH] = addr
-    log TransferOwnership(addr)
\ No newline at end of file
+    log TransferOwnership(addr)
+
+
+@external
+def set_smart_wallet_checker(addr: address):
+    """
+    @notice Apply setting external contract to check approved smart contract wallets
+    """
+    assert msg.sender == self._admin(), "not admin"
+    self.storageAddress[SMART_WALLET_CHECKER_HASH] = addr
+
+
+@external
+def enable_emergency():
+    self._set_field(EMERGENCY_FLAG, 2, 1)
+    log Emergency()
+
+
+@external
+def set_max_pool_members(_value: uint256):
+    self._set_field(MAX_POOL_MEMBERS_SHIFT, MAX_POOL_MEMBERS_SIZE, _value)
+    log MaxPoolMembersSet(_value)
+
+
+@external
+def set_min_stake_amount(_value: uint256):
+    self._set_field(MIN_STAKE_AMOUNT_SHIFT, MIN_STAKE_AMOUNT_SIZE, _value)
+    log MinStakeAmountSet(_value)
+
+
+@external
+def set_withdraw_disabled(_value: bool):
+    self._set_field(WITHDRAW_DISABLED_FLAG, 2, convert(_value, uint256))
+    log WithdrawDisabledSet(_value)
+
+
+@external
+def set_create_lock_disabled(_value: bool):
+    self._set_field(CREATE_LOCK_DISABLED_FLAG, 2, convert(_value, uint256))
+    log CreateLockDisabledSet(_value)
+
+
+@external
+def set_increase_amount_disabled(_value: bool):
+    self._set_field(INCREASE_AMOUNT_DISABLED_FLAG, 2, convert(_value, uint256))
+    log IncreaseAmountDisabledSet(_value)
+
+
+@external
+def set_increase_unlock_time_disabled(_value: bool):
+    self._set_field(INCREASE_UNLOCK_TIME_DISABLED_FLAG, 2, convert(_value, uint256))
+    log IncreaseUnlockTimeDisabledSet(_value)
+
+
+@internal
+def _set_settings(
+        _max_pool_members: uint256,
+        _min_stake_amount: uint256,
+        _min_delay_between_manual_checkpoint: uint256,
+        _increase_amount_disabled: bool,
+        _increase_unlock_time_disabled: bool,
+        _create_lock_disabled: bool,
+        _withdraw_disabled: bool,
+):
+    """
+    @notice Write all the packed settings at once and log the changed ones
+    """
+    assert msg.sender == self._admin(), "not admin"
+    old: uint256 = self.packed_settings
+    settings: uint256 = self._with_field(old, MAX_POOL_MEMBERS_SHIFT, MAX_POOL_MEMBERS_SIZE, _max_pool_members)
+    settings = self._with_field(settings, MIN_STAKE_AMOUNT_SHIFT, MIN_STAKE_AMOUNT_SIZE, _min_stake_amount)
+    settings = self._with_field(settings, MIN_DELAY_SHIFT, MIN_DELAY_SIZE, _min_delay_between_manual_checkpoint)
+    settings = self._with_field(settings, INCREASE_AMOUNT_DISABLED_FLAG, 2, convert(_increase_amount_disabled, uint256))
+    settings = self._with_field(settings, INCREASE_UNLOCK_TIME_DISABLED_FLAG, 2, convert(_increase_unlock_time_disabled, uint256))
+    settings = self._with_field(settings, CREATE_LOCK_DISABLED_FLAG, 2, convert(_create_lock_disabled, uint256))
+    settings = self._with_field(settings, WITHDRAW_DISABLED_FLAG, 2, convert(_withdraw_disabled, uint256))
+    if settings == old:
+        return
+    self._store_settings(settings)
+
+    if self._field(old, MAX_POOL_MEMBERS_SHIFT, MAX_POOL_MEMBERS_SIZE) != _max_pool_members:
+        log MaxPoolMembersSet(_max_pool_members)
+    if self._field(old, MIN_STAKE_AMOUNT_SHIFT, MIN_STAKE_AMOUNT_SIZE) != _min_stake_amount:
+        log MinStakeAmountSet(_min_stake_amount)
+    if self._field(old, MIN_DELAY_SHIFT, MIN_DELAY_SIZE) != _min_delay_between_manual_checkpoint:
+        log MinDelayBetweenManualCheckpointSet(_min_delay_between_manual_checkpoint)
+    if old & WITHDRAW_DISABLED_FLAG != settings & WITHDRAW_DISABLED_FLAG:
+        log WithdrawDisabledSet(_withdraw_disabled)
+    if old & CREATE_LOCK_DISABLED_FLAG != settings & CREATE_LOCK_DISABLED_FLAG:
+        log CreateLockDisabledSet(_create_lock_disabled)
+    if old & INCREASE_AMOUNT_DISABLED_FLAG != settings & INCREASE_AMOUNT_DISABLED_FLAG:
+        log IncreaseAmountDisabledSet(_increase_amount_disabled)
+    if old & INCREASE_UNLOCK_TIME_DISABLED_FLAG != settings & INCREASE_UNLOCK_TIME_DISABLED_FLAG:
+        log IncreaseUnlockTimeDisabledSet(_increase_unlock_time_disabled)
+
+
+@external
+def set_settings(
+        _max_pool_members: uint256,
+        _min_stake_amount: uint256,
+        _min_delay_between_manual_checkpoint: uint256,
+        _increase_amount_disabled: bool,
+        _increase_unlock_time_disabled: bool,
+        _create_lock_disabled: bool,
+        _withdraw_disabled: bool,
+):
+    """
+    @notice Set all the settings of the user entry points at once
+    @dev One delegatecall and one storage write for all of them, an event is logged
+         for every changed value. emergency is only switched by enable_emergency
+    """
+    self._set_settings(
+        _max_pool_members,
+        _min_stake_amount,
+        _min_delay_between_manual_checkpoint,
+        _increase_amount_disabled,
+        _increase_unlock_time_disabled,
+        _create_lock_disabled,
+        _withdraw_disabled,
+    )
+
+
+@internal
+def _set_paused(_value: bool):
+    settings: uint256 = self.packed_settings
+    self._set_settings(
+        self._field(settings, MAX_POOL_MEMBERS_SHIFT, MAX_POOL_MEMBERS_SIZE),
+        self._field(settings, MIN_STAKE_AMOUNT_SHIFT, MIN_STAKE_AMOUNT_SIZE),
+        self._field(settings, MIN_DELAY_SHIFT, MIN_DELAY_SIZE),
+        _value,
+        _value,
+        _value,
+        _value,
+    )
+
+
+@external
+def pause():
+    self._set_paused(True)
+
+
+@external
+def unpause():
+    self._set_paused(False)
+
+
+# from https://ethereum.stackexchange.com/questions/84775/is-there-a-vyper-equivalent-to-openzeppelins-safeerc20-safetransfer
+@internal
+def safe_transfer(_token: address, _to: address, _value: uint256):
+    _response: Bytes[32] = raw_call(
+        _token,
+        concat(
+            method_id("transfer(address,uint256)"),
+            convert(_to, bytes32),
+            convert(_value, bytes32)
+        ),
+        max_outsize=32
+    )
+    if len(_response) > 0:
+        assert convert(_response, bool), "Transfer failed!"
+
+
+@internal
+def _emergency_withdraw(_token: address, _amount: uint256, to: address):
+    if _token == ZERO_ADDRESS:
+        send(to, _amount)
+    else:
+        self.safe_transfer(_token, to, _amount)
+
+
+@external
+@nonreentrant('lock')
+def emergency_withdraw(_token: address, _amount: uint256, to: address):
+    assert msg.sender == self._admin()
+    self._emergency_withdraw(_token, _amount, to)
+
+
+@external
+@nonreentrant('lock')
+def emergency_withdraw_many(_tokens: address[30], _amounts: uint256[30], tos: address[30]):
+    assert msg.sender == self._admin()
+    for i in range(30):
+        self._emergency_withdraw(_tokens[i], _amounts[i], tos[i])
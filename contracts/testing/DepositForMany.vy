@@ -0,0 +1,32 @@
+# @version 0.3.7
+"""
+@notice Calls VotingEscrow.deposit_for many times in one transaction, so that
+        the user gets many checkpoints with the same timestamp
+@dev The tokens come from the user, who has to approve VotingEscrow
+"""
+
+interface VotingEscrow:
+    def deposit_for(_addr: address, _value: uint256): nonpayable
+    def receiveReward(_token: address, amount: uint256): nonpayable
+
+interface ERC20:
+    def approve(_spender: address, _value: uint256) -> bool: nonpayable
+
+
+@external
+def deposit_for_many(_voting_escrow: address, _addr: address, _value: uint256, _count: uint256):
+    for i in range(500):
+        if i >= _count:
+            break
+        VotingEscrow(_voting_escrow).deposit_for(_addr, _value)
+
+
+@external
+def receive_reward_and_deposit_for(_voting_escrow: address, _token: address, _amount: uint256, _addr: address, _value: uint256):
+    """
+    @notice Rewards and then a checkpoint of `_addr` with the same timestamp
+    @dev The reward tokens come from this contract, which has to hold them
+    """
+    ERC20(_token).approve(_voting_escrow, _amount)
+    VotingEscrow(_voting_escrow).receiveReward(_token, _amount)
+    VotingEscrow(_voting_escrow).deposit_for(_addr, _value)
@@ -0,0 +1,35 @@
+# @version 0.3.7
+"""
+@title Multicall
+@notice Minimal copy of MakerDAO's Multicall2.tryAggregate, several view
+        calls in one eth_call. The ABI is the same, so scripts/stats/multicall.py
+        reads through either one
+"""
+
+MAX_CALLS: constant(uint256) = 100
+MAX_CALLDATA: constant(uint256) = 260  # selector and 8 words
+MAX_RETURNDATA: constant(uint256) = 256
+
+
+struct Request:  # Multicall2.Call, `Call` is reserved in vyper
+    target: address
+    callData: Bytes[MAX_CALLDATA]
+
+struct Result:
+    success: bool
+    returnData: Bytes[MAX_RETURNDATA]
+
+
+@external
+@view
+def tryAggregate(requireSuccess: bool, calls: DynArray[Request, MAX_CALLS]) -> DynArray[Result, MAX_CALLS]:
+    results: DynArray[Result, MAX_CALLS] = []
+    for request in calls:
+        success: bool = False
+        response: Bytes[MAX_RETURNDATA] = b""
+        success, response = raw_call(
+            request.target, request.callData, max_outsize=MAX_RETURNDATA, is_static_call=True, revert_on_failure=False
+        )
+        assert success or not requireSuccess, "Multicall2 aggregate: call failed"
+        results.append(Result({success: success, returnData: response}))
+    return results
@@ -0,0 +1,74 @@
+# @version 0.3.7
+"""
+@title Voting Escrow Admin
+@notice Admin functions accepted by VotingEscrow, implemented by VotingEscrowSettings
+        and run by VotingEscrow.__default__ in the VotingEscrow storage
+"""
+
+@external
+def transfer_ownership(addr: address):
+    pass
+
+@external
+def set_smart_wallet_checker(addr: address):
+    pass
+
+@external
+def set_min_delay_between_manual_checkpoint(_value: uint256):
+    pass
+
+@external
+def set_max_pool_members(_value: uint256):
+    pass
+
+@external
+def set_min_stake_amount(_value: uint256):
+    pass
+
+@external
+def set_withdraw_disabled(_value: bool):
+    pass
+
+@external
+def set_create_lock_disabled(_value: bool):
+    pass
+
+@external
+def set_increase_amount_disabled(_value: bool):
+    pass
+
+@external
+def set_increase_unlock_time_disabled(_value: bool):
+    pass
+
+@external
+def set_settings(
+        _max_pool_members: uint256,
+        _min_stake_amount: uint256,
+        _min_delay_between_manual_checkpoint: uint256,
+        _increase_amount_disabled: bool,
+        _increase_unlock_time_disabled: bool,
+        _create_lock_disabled: bool,
+        _withdraw_disabled: bool,
+):
+    pass
+
+@external
+def pause():
+    pass
+
+@external
+def unpause():
+    pass
+
+@external
+def enable_emergency():
+    pass
+
+@external
+def emergency_withdraw(_token: address, _amount: uint256, to: address):
+    pass
+
+@external
+def emergency_withdraw_many(_tokens: address[30], _amounts: uint256[30], tos: address[30]):
+    pass
@@ -38,7 +38,19 @@ def main():
         {"from": admin, "required_confs": REQUIRED_CONFS, 'gas_price': GAS_PRICE},
     )
 
+    voting_escrow_lens = VotingEscrowLens.deploy(
+        voting_escrow,
+        {"from": admin, "required_confs": REQUIRED_CONFS, 'gas_price': GAS_PRICE},
+    )
+
+    voting_escrow_merkle_rewards = VotingEscrowMerkleRewards.deploy(
+        voting_escrow,
+        {"from": admin, "required_confs": REQUIRED_CONFS, 'gas_price': GAS_PRICE},
+    )
+
     time.sleep(10)
     ERC20CRV.publish_source(token)
     VotingEscrowSettings.publish_source(settings)
     VotingEscrow.publish_source(voting_escrow)
+    VotingEscrowLens.publish_source(voting_escrow_lens)
+    VotingEscrowMerkleRewards.publish_source(voting_escrow_merkle_rewards)
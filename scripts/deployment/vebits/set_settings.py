@@ -0,0 +1,22 @@
+import os
+from brownie import *
+
+
+def main():
+    admin = accounts.load("brave_main", os.environ['BRAVE_MAIN_PASS'])
+    voting_escrow = Contract.from_abi("VotingEscrow", os.environ['VOTING_ESCROW_ADDRESS'], VotingEscrow.abi)
+    # the admin functions are run by VotingEscrow.__default__, they have their own ABI
+    voting_escrow_admin = interface.VotingEscrowAdmin(voting_escrow.address)
+
+    tx = voting_escrow_admin.set_settings(
+        int(os.environ.get('MAX_POOL_MEMBERS', voting_escrow.max_pool_members())),
+        int(os.environ.get('MIN_STAKE_AMOUNT', voting_escrow.min_stake_amount())),
+        int(os.environ.get('MIN_DELAY_BETWEEN_MANUAL_CHECKPOINT', voting_escrow.min_delay_between_manual_checkpoint())),
+        voting_escrow.increase_amount_disabled(),
+        voting_escrow.increase_unlock_time_disabled(),
+        voting_escrow.create_lock_disabled(),
+        voting_escrow.withdraw_disabled(),
+        {"from": admin, "required_confs": 2},
+    )
+    print(f"{tx.events=}")
+    print(f"{voting_escrow.settings_version()=}")
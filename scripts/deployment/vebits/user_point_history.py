@@ -8,12 +8,13 @@ def main():
     user1 = accounts.load('testacc0', '12341234')
     user2 = accounts.load('testacc1', '12341234')
 
-    voting_escrow = Contract.from_abi("VotingEscrow", os.environ['VOTING_ESCROW_ADDRESS'], VotingEscrow.abi)
+    voting_escrow_lens = Contract.from_abi(
+        "VotingEscrowLens", os.environ['VOTING_ESCROW_LENS_ADDRESS'], VotingEscrowLens.abi
+    )
 
     def print_user_points(user1name, user1):
         print(user1name)
-        for i in range(10):
-            user_point = voting_escrow.user_point_history(user1, i)
+        for user_point in voting_escrow_lens.user_point_history_range(user1, 0, 10):
             print(user_point)
 
     print_user_points('user1', user1)
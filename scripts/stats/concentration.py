@@ -0,0 +1,107 @@
+"""
+Concentration of the veCRV balances
+
+The metrics take an array of balances with one row per snapshot and one column
+per holder. Every row is sorted once and Gini, the Nakamoto coefficient and the
+top-k share come from its cumulative sums, so a snapshot of n holders costs
+O(n log n) and all the snapshots are done in one NumPy pass. Only the positive
+balances of a row count as holders, the columns can be every address that ever
+locked. A one dimensional array is a single snapshot and gives a scalar.
+
+`balance_matrix` builds the rows from the user points of a VotingEscrowModel
+replayed from the local event index (see ve_replay.py), no subgraph needed.
+
+    holders, balances = balance_matrix(model, times)
+    ginis = gini(balances)
+"""
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+TS_SHIFT = 2**34  # above any timestamp, to search (holder, ts) as one int64 key
+
+
+def _sorted_cumsum(balances) -> Tuple[np.ndarray, np.ndarray, bool]:
+    """Cumulative sums of the rows sorted ascending after a leading 0, and the holders per row"""
+    x = np.asarray(balances, dtype=np.float64)
+    single = x.ndim == 1
+    rows = np.atleast_2d(x)
+    if (rows < 0).any():
+        raise ValueError("negative balance")
+    rows = np.concatenate([np.zeros((len(rows), 1)), rows], axis=1)
+    return np.cumsum(np.sort(rows, axis=1), axis=1), (rows > 0).sum(axis=1), single
+
+
+def _result(values: np.ndarray, single: bool):
+    return values[0] if single else values
+
+
+def gini(balances):
+    """
+    Gini coefficient of the positive balances, nan without any
+    @dev G = (n + 1 - 2 * sum(cumsum) / total) / n over the ascending balances
+    """
+    cumsum, holders, single = _sorted_cumsum(balances)
+    total = cumsum[:, -1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        g = (holders + 1 - 2 * cumsum.sum(axis=1) / total) / holders
+    return _result(np.where(holders > 0, g, np.nan), single)
+
+
+def herfindahl(balances):
+    """Herfindahl-Hirschman index, the sum of the squared shares in (0, 1], nan without any balance"""
+    rows = np.atleast_2d(np.asarray(balances, dtype=np.float64))
+    total = rows.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hhi = (rows**2).sum(axis=1) / total**2
+    return _result(np.where(total > 0, hhi, np.nan), np.ndim(balances) == 1)
+
+
+def nakamoto(balances, threshold=0.5):
+    """Fewest holders whose balances add up to more than `threshold` of the total, 0 without any"""
+    cumsum, holders, single = _sorted_cumsum(balances)
+    total = cumsum[:, -1]
+    # the top k hold total - cumsum[-k - 1], which is above threshold * total from k on
+    k = (cumsum >= (1 - threshold) * total[:, None]).sum(axis=1)
+    return _result(np.where(holders > 0, k, 0), single)
+
+
+def top_k_share(balances, k: int):
+    """Share of the total held by the `k` largest balances, nan without any"""
+    cumsum, holders, single = _sorted_cumsum(balances)
+    total = cumsum[:, -1]
+    rest = cumsum[:, max(cumsum.shape[1] - 1 - k, 0)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = (total - rest) / total
+    return _result(np.where(holders > 0, share, np.nan), single)
+
+
+def balance_matrix(model, times: Sequence[int]) -> Tuple[List[str], np.ndarray]:
+    """
+    Balances of every holder of a VotingEscrowModel at `times`, as float64
+    @return The holders and an array of shape (len(times), len(holders))
+    """
+    holders = sorted(addr for addr, user_epoch in model.user_point_epoch.items() if user_epoch > 0)
+    keys, slopes, ends, firsts = [], [], [], []
+    for i, addr in enumerate(holders):
+        firsts.append(len(keys))
+        points = model.user_point_history[addr]
+        for user_epoch in range(1, model.user_point_epoch[addr] + 1):
+            p = points[user_epoch]
+            keys.append(i * TS_SHIFT + p.ts)
+            slopes.append(float(p.slope))
+            # the user points are slope * (end - ts), the lock end keeps the expired balances at exactly 0
+            ends.append(p.ts + (p.bias // p.slope if p.slope > 0 else 0))
+    keys = np.array(keys, dtype=np.int64)
+    slopes = np.array(slopes)
+    ends = np.array(ends, dtype=np.int64)
+    firsts = np.array(firsts, dtype=np.int64)
+
+    times = np.asarray(times, dtype=np.int64)
+    holder_keys = np.arange(len(holders), dtype=np.int64) * TS_SHIFT
+    # last point of every holder at or before every time
+    idx = np.searchsorted(keys, holder_keys[None, :] + times[:, None], side="right") - 1
+    started = idx >= firsts[None, :]
+    idx = np.maximum(idx, 0)
+    left = ends[idx] - times[:, None]
+    return holders, np.where(started & (left > 0), slopes[idx] * left, 0.0)
@@ -1,50 +1,56 @@
+import os
+from datetime import datetime
+
 import numpy as np
 import pylab
-import requests
 from brownie import web3
 
+from scripts.stats.concentration import balance_matrix, gini
+from scripts.stats.subgraph import SubgraphFetcher
+
 START_BLOCK = 10647813 + 86400
 graph_url = "https://api.thegraph.com/subgraphs/name/pengiundev/curve-votingescrow3"
-query = {
-    "query": """query ($block: Int!, $first: Int!, $skip: Int!) {\n  userBalances(orderBy: weight, orderDirection: desc, first: $first, skip: $skip, block: {number: $block}) {\n    id\n    startTx\n    user\n    CRVLocked\n lock_start\n    unlock_time\n    weight\n    __typename\n  }\n}\n""",  # noqa
-    "variables": {"block": None, "first": 1000, "skip": 0},
-}
+query = """query ($block: Int!, $first: Int!, $cursor: String!) {\n  userBalances(where: {id_gt: $cursor}, orderBy: id, first: $first, block: {number: $block}) {\n    id\n    startTx\n    user\n    CRVLocked\n lock_start\n    unlock_time\n    weight\n    __typename\n  }\n}\n"""  # noqa
 
 
-def gini(x):
-    # from https://stackoverflow.com/questions/39512260/calculating-gini-coefficient-in-python-numpy
-    # (Warning: This is a concise implementation, but it is O(n**2)
-    # in time and memory, where n = len(x).  *Don't* pass in huge
-    # samples!)
+def main():
+    if "VE_INDEX_DB" in os.environ:
+        # replayed from the local event index of VOTING_ESCROW_ADDRESS, see ve_replay.py
+        from brownie import VotingEscrow
 
-    # Mean absolute difference
-    mad = np.abs(np.subtract.outer(x, x)).mean()
-    # Relative mean absolute difference
-    rmad = mad / np.mean(x)
-    # Gini coefficient
-    g = 0.5 * rmad
-    return g
+        from scripts.stats.ve_indexer import VotingEscrowIndexer
+        from scripts.stats.ve_replay import replay
 
+        indexer = VotingEscrowIndexer(
+            web3,
+            os.environ["VOTING_ESCROW_ADDRESS"],
+            VotingEscrow.abi,
+            os.environ["VE_INDEX_DB"],
+            start_block=int(os.environ["START_BLOCK"]),
+        )
+        model, _ = replay(indexer)
+        times = np.linspace(indexer.block_timestamp(indexer.start_block), indexer.block_timestamp(indexer.last_block), 50)
+        _, balances = balance_matrix(model, times.astype(np.int64))
+        xs = [datetime.fromtimestamp(t) for t in times]
+        xlabel = "Date"
+    else:
+        current_block = web3.eth.blockNumber
+        xs = np.linspace(START_BLOCK, current_block, 50)
+        # paged by id, all the blocks at once, cached in SUBGRAPH_CACHE if set
+        fetcher = SubgraphFetcher(graph_url, cache_dir=os.environ.get("SUBGRAPH_CACHE"))
+        rows = fetcher.fetch(query, "userBalances", [int(block) for block in xs], cursor="id")
+        snapshots = [[int(u["weight"]) / 1e18 for u in users] for users in rows]
+        balances = np.zeros((len(snapshots), max(map(len, snapshots))))
+        for i, weights in enumerate(snapshots):
+            balances[i, : len(weights)] = weights
+        xlabel = "Block number"
 
-def main():
-    current_block = web3.eth.blockNumber
-    blocks = np.linspace(START_BLOCK, current_block, 50)
-    ginis = []
-    for block in blocks:
-        query["variables"]["block"] = int(block)
-        while True:
-            try:
-                resp = requests.post(graph_url, json=query).json()
-                weights = [int(u["weight"]) / 1e18 for u in resp["data"]["userBalances"]]
-            except KeyError:
-                print("Error")
-                continue
-            break
-        ginis.append(gini(weights))
-        print(block, ginis[-1])
-
-    pylab.plot(blocks, ginis)
+    ginis = gini(balances)
+    for x, g in zip(xs, ginis):
+        print(x, g)
+
+    pylab.plot(xs, ginis)
     pylab.title("Gini coefficient")
-    pylab.xlabel("Block number")
+    pylab.xlabel(xlabel)
     pylab.ylabel("veCRV Gini coefficient")
     pylab.show()
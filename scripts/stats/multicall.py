@@ -0,0 +1,98 @@
+"""
+Batched reads of view functions
+
+`BatchReader` sends many view calls in a few round trips. With a Multicall2
+contract each chunk is one eth_call of tryAggregate; without one, each chunk
+is one JSON-RPC batch request of eth_call. The chunks are sent concurrently
+and all read at the same block.
+
+    reader = BatchReader(web3, Contract.from_abi("Multicall2", MULTICALL2_MAINNET, MULTICALL2_ABI))
+    points = reader.read([(voting_escrow.point_history, i) for i in range(100)])
+
+Any brownie ContractCall can be batched, e.g. FeeDistributor.tokens_per_week or
+GaugeController.gauge_relative_weight. contracts/testing/Multicall.vy has the
+same ABI for local chains.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Sequence
+
+import requests
+from eth_utils import to_hex
+
+MULTICALL2_MAINNET = "0x5BA1e12693Dc8F9c48aAD8770482f4739bEeD696"
+MULTICALL2_ABI = [
+    {
+        "name": "tryAggregate",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [
+            {"name": "requireSuccess", "type": "bool"},
+            {
+                "name": "calls",
+                "type": "tuple[]",
+                "components": [{"name": "target", "type": "address"}, {"name": "callData", "type": "bytes"}],
+            },
+        ],
+        "outputs": [
+            {
+                "name": "returnData",
+                "type": "tuple[]",
+                "components": [{"name": "success", "type": "bool"}, {"name": "returnData", "type": "bytes"}],
+            }
+        ],
+    }
+]
+
+
+class BatchReader:
+    def __init__(self, web3, multicall=None, chunk_size=100, concurrency=4):
+        """
+        Args:
+            web3: Connected Web3 instance
+            multicall: Multicall2 contract, JSON-RPC batch requests are sent if None
+            chunk_size: Calls per round trip
+            concurrency: Round trips in flight
+        """
+        self.web3 = web3
+        self.multicall = multicall
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.round_trips = 0
+
+    def _read_multicall(self, chunk, block) -> List[Optional[str]]:
+        data = self.multicall.tryAggregate.encode_input(False, chunk)
+        output = self.web3.eth.call({"to": self.multicall.address, "data": data}, block)
+        results = self.multicall.tryAggregate.decode_output(to_hex(output))
+        return [to_hex(response) if success else None for success, response in results]
+
+    def _read_json_rpc_batch(self, chunk, block) -> List[Optional[str]]:
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": "eth_call", "params": [{"to": to, "data": data}, hex(block)]}
+            for i, (to, data) in enumerate(chunk)
+        ]
+        response = requests.post(self.web3.provider.endpoint_uri, json=payload, timeout=60)
+        response.raise_for_status()
+        replies = {reply["id"]: reply for reply in response.json()}
+        return [replies[i].get("result") for i in range(len(chunk))]  # no result on errors
+
+    def read(self, calls: Sequence[tuple], block=None, allow_failure=False) -> List[Any]:
+        """
+        Results of `calls`, each (method, *args) with a brownie ContractCall method
+        @param block Block number to read at, the latest one by default
+        @param allow_failure Return None for the calls that revert instead of raising
+        """
+        if block is None:
+            block = self.web3.eth.block_number
+        encoded = [(method._address, method.encode_input(*args)) for method, *args in calls]
+        chunks = [encoded[i : i + self.chunk_size] for i in range(0, len(encoded), self.chunk_size)]
+        read_chunk = self._read_json_rpc_batch if self.multicall is None else self._read_multicall
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            outputs = [output for chunk in executor.map(lambda c: read_chunk(c, block), chunks) for output in chunk]
+        self.round_trips += len(chunks)
+
+        results = []
+        for (method, *args), output in zip(calls, outputs):
+            if output is None and not allow_failure:
+                raise ValueError(f"{method._name}{tuple(args)} reverted")
+            results.append(None if output is None else method.decode_output(output))
+        return results
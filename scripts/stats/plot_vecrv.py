@@ -1,15 +1,39 @@
+import os
+
 import numpy as np
 import pylab
 from brownie import Contract, web3
 
+from scripts.stats.multicall import MULTICALL2_ABI, MULTICALL2_MAINNET, BatchReader
+
 START_BLOCK = 10647813
 
 
 def main():
-    vecrv = Contract("0x5f3b5DfEb7B28CDbD7FAba78963EE202a494e2A2")
-    current_block = web3.eth.blockNumber
-    blocks = np.linspace(START_BLOCK, current_block, 100)
-    powers = [vecrv.totalSupplyAt(int(block)) / 1e18 for block in blocks]
+    if "VE_INDEX_DB" in os.environ:
+        # replayed from the local event index of VOTING_ESCROW_ADDRESS, see ve_replay.py
+        from brownie import VotingEscrow
+
+        from scripts.stats.ve_indexer import VotingEscrowIndexer
+        from scripts.stats.ve_replay import replay
+
+        indexer = VotingEscrowIndexer(
+            web3,
+            os.environ["VOTING_ESCROW_ADDRESS"],
+            VotingEscrow.abi,
+            os.environ["VE_INDEX_DB"],
+            start_block=int(os.environ["START_BLOCK"]),
+        )
+        model, _ = replay(indexer)
+        points = [model.point_history[i] for i in range(1, model.epoch + 1)]
+        blocks = [p.blk for p in points]
+        powers = [p.bias / 1e18 for p in points]
+    else:
+        vecrv = Contract("0x5f3b5DfEb7B28CDbD7FAba78963EE202a494e2A2")
+        current_block = web3.eth.blockNumber
+        blocks = np.linspace(START_BLOCK, current_block, 100)
+        reader = BatchReader(web3, Contract.from_abi("Multicall2", MULTICALL2_MAINNET, MULTICALL2_ABI))
+        powers = [supply / 1e18 for supply in reader.read([(vecrv.totalSupplyAt, int(block)) for block in blocks])]
 
     pylab.plot(blocks, powers)
     pylab.xlabel("Block number")
@@ -2,9 +2,12 @@ from datetime import datetime
 from time import time
 
 import pylab  # Requires matplotlib
-from brownie import Contract
+from brownie import Contract, web3
+
+from scripts.stats.multicall import MULTICALL2_ABI, MULTICALL2_MAINNET, BatchReader
 
 WEEK = 86400 * 7
+WEEKS_PER_READ = 52
 
 
 def main():
@@ -13,14 +16,18 @@ def main():
     t = int(time()) // WEEK * WEEK
     virtual_price = tri_pool.get_virtual_price() / 1e18
 
+    reader = BatchReader(web3, Contract.from_abi("Multicall2", MULTICALL2_MAINNET, MULTICALL2_ABI))
+
     output = []
-    while True:
-        fees = distributor.tokens_per_week(t)
-        if fees == 0 and len(output) > 0:
-            break
-        d = datetime.fromtimestamp(t)
-        output.append((d, fees))
-        t -= WEEK
+    done = False
+    while not done:
+        weeks = [t - i * WEEK for i in range(WEEKS_PER_READ)]
+        for week, fees in zip(weeks, reader.read([(distributor.tokens_per_week, week) for week in weeks])):
+            if fees == 0 and len(output) > 0:
+                done = True
+                break
+            output.append((datetime.fromtimestamp(week), fees))
+        t -= WEEKS_PER_READ * WEEK
     if output[0][1] == 0:
         output = output[1:]
     dates = []
@@ -0,0 +1,134 @@
+"""
+Paginated subgraph reads
+
+`SubgraphFetcher` reads every entity of a GraphQL query at many blocks
+concurrently with aiohttp. The query takes `$block` and `$first` and pages
+either with `$skip`, or, past the 5000 skip limit of The Graph, with a
+`$cursor` on the last entity (e.g. `where: {id_gt: $cursor}, orderBy: id`).
+At most `concurrency` requests are in flight. Transport failures, HTTP 5xx and
+429 are retried with exponential backoff. Other HTTP errors, GraphQL errors and
+responses which are not a GraphQL result raise SubgraphError at once, as a
+retry would get the same answer. The pages read at a fixed block are cached on
+disk under `cache_dir`, keyed by the query and its variables, so a rerun only
+reads what is missing.
+
+    fetcher = SubgraphFetcher(url, cache_dir="subgraph_cache")
+    snapshots = fetcher.fetch(query, "userBalances", blocks, cursor="id")
+"""
+import asyncio
+import hashlib
+import json
+import os
+from typing import List, Optional, Sequence
+
+import aiohttp
+
+THE_GRAPH_MAX_SKIP = 5000
+
+
+class SubgraphError(Exception):
+    pass
+
+
+class SubgraphFetcher:
+    def __init__(self, url, cache_dir=None, page_size=1000, concurrency=8, retries=5, backoff=1.0, timeout=60):
+        """
+        Args:
+            url: Subgraph GraphQL endpoint
+            cache_dir: Directory of the cached pages, nothing is cached if None
+            page_size: Entities per request, `$first`
+            concurrency: Requests in flight
+            retries: Retries of a transport failure, HTTP 5xx or 429 before raising SubgraphError
+            backoff: Seconds before the first retry, doubled on every next one
+            timeout: Seconds per request
+        """
+        self.url = url
+        self.cache_dir = cache_dir
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.requests = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, payload) -> Optional[str]:
+        if self.cache_dir is None or payload["variables"].get("block") is None:
+            return None  # the head moves, only fixed blocks are cached
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    async def _post(self, session, semaphore, payload) -> dict:
+        path = self._cache_path(payload)
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            async with semaphore:
+                self.requests += 1
+                try:
+                    async with session.post(self.url, json=payload) as response:
+                        if response.status == 429 or response.status >= 500:
+                            error = f"HTTP {response.status}"
+                            continue
+                        response.raise_for_status()
+                        body = await response.json(content_type=None)
+                except aiohttp.ClientResponseError as e:
+                    raise SubgraphError(f"{self.url} failed: HTTP {e.status} {e.message}") from e
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = repr(e)
+                    continue
+                except ValueError as e:
+                    raise SubgraphError(f"{self.url} returned invalid JSON: {e}") from e
+            if not isinstance(body, dict):
+                raise SubgraphError(f"{self.url} returned {type(body).__name__}, not a GraphQL result")
+            if body.get("errors"):
+                raise SubgraphError(f"{self.url} returned errors: {body['errors']}")
+            data = body.get("data")
+            if not isinstance(data, dict):
+                raise SubgraphError(f"{self.url} returned no data")
+            if path is not None:
+                with open(path + ".tmp", "w") as f:
+                    json.dump(data, f)
+                os.replace(path + ".tmp", path)
+            return data
+        raise SubgraphError(f"{self.url} failed {self.retries + 1} times, last error: {error}")
+
+    async def _fetch_all(self, session, semaphore, query, entity, block, cursor) -> List[dict]:
+        variables = {"block": block, "first": self.page_size}
+        if cursor is None:
+            variables["skip"] = 0
+        else:
+            variables["cursor"] = ""
+        rows = []
+        while True:
+            if cursor is None and variables["skip"] > THE_GRAPH_MAX_SKIP:
+                raise SubgraphError(f"more than {THE_GRAPH_MAX_SKIP} {entity}, page with a cursor")
+            page = (await self._post(session, semaphore, {"query": query, "variables": dict(variables)}))[entity]
+            rows += page
+            if len(page) < self.page_size:
+                return rows
+            if cursor is None:
+                variables["skip"] += len(page)
+            else:
+                variables["cursor"] = page[-1][cursor]
+
+    async def fetch_snapshots(self, query, entity, blocks: Sequence[Optional[int]], cursor=None) -> List[List[dict]]:
+        """
+        All the `entity` rows of `query` at each of `blocks`, None being the latest one
+        @param cursor Field of the entities passed back as `$cursor`, pages with `$skip` if None
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            return await asyncio.gather(
+                *[self._fetch_all(session, semaphore, query, entity, block, cursor) for block in blocks]
+            )
+
+    def fetch(self, query, entity, blocks: Sequence[Optional[int]], cursor=None) -> List[List[dict]]:
+        """Blocking `fetch_snapshots`"""
+        return asyncio.run(self.fetch_snapshots(query, entity, blocks, cursor))
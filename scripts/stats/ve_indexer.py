@@ -0,0 +1,193 @@
+"""
+Local event index of VotingEscrow
+
+`VotingEscrowIndexer` copies the Deposit, Withdraw, Supply, RewardReceived,
+RewardStreamReceived and RewardsClaimed logs into a SQLite database in
+block range batches, so the analytics and payout scripts can run against local
+data. Every batch is written in one transaction together with the last indexed
+block, so an interrupted run resumes where it stopped. The hashes of the blocks
+with logs and of the batch ends are kept: if one of them is no longer on the
+chain, everything above the last block that still is gets dropped and indexed
+again (reorg).
+
+    brownie run scripts/stats/ve_indexer.py --network $NETWORK
+
+indexes VOTING_ESCROW_ADDRESS from START_BLOCK (0 by default) into VE_INDEX_DB
+(ve_index.db by default) and keeps following the chain if POLL_INTERVAL is set.
+"""
+import os
+import sqlite3
+import time
+from typing import Iterator, Optional
+
+from eth_utils import event_abi_to_log_topic, to_checksum_address, to_hex
+from web3.exceptions import BlockNotFound
+
+# SQLite INTEGER is 64 bit, the amounts are kept as decimal TEXT
+SQL_TYPES = {"address": "TEXT", "int": "INTEGER", "amount": "TEXT"}
+EVENTS = {
+    "Deposit": {"provider": "address", "value": "amount", "locktime": "int", "type": "int", "ts": "int"},
+    "Withdraw": {"provider": "address", "value": "amount", "ts": "int"},
+    "Supply": {"prevSupply": "amount", "supply": "amount"},
+    "RewardReceived": {"token": "address", "amount": "amount", "actual_amount": "amount"},
+    "RewardStreamReceived": {
+        "token": "address", "amount": "amount", "actual_amount": "amount", "rate": "amount", "finish": "int"
+    },
+    "RewardsClaimed": {"user": "address", "token": "address", "user_claimed_epoch": "int", "amount": "amount"},
+}
+
+
+class VotingEscrowIndexer:
+    def __init__(self, web3, address, abi, db_path, start_block=0, batch_size=2000, confirmations=0):
+        """
+        Args:
+            web3: Connected Web3 instance
+            address: VotingEscrow address
+            abi: VotingEscrow ABI
+            db_path: SQLite database, created if missing
+            start_block: First block to index, e.g. the deployment block
+            batch_size: Blocks per eth_getLogs call
+            confirmations: Blocks behind the head left for the next run
+        """
+        self.web3 = web3
+        self.contract = web3.eth.contract(address=to_checksum_address(address), abi=abi)
+        self.topics = {
+            to_hex(event_abi_to_log_topic(e)): e["name"] for e in abi if e["type"] == "event" and e["name"] in EVENTS
+        }
+        self.start_block = start_block
+        self.batch_size = batch_size
+        self.confirmations = confirmations
+
+        self.db = sqlite3.connect(db_path)
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS blocks (number INTEGER PRIMARY KEY, hash TEXT NOT NULL, timestamp INTEGER NOT NULL)"
+            )
+            for name, columns in EVENTS.items():
+                fields = ", ".join(f"{column} {SQL_TYPES[kind]} NOT NULL" for column, kind in columns.items())
+                self.db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {name} (block_number INTEGER NOT NULL, log_index INTEGER NOT NULL, "
+                    f"tx_hash TEXT NOT NULL, {fields}, PRIMARY KEY (block_number, log_index))"
+                )
+            stored = self._meta("address")
+            if stored is None:
+                self._set_meta("address", self.contract.address)
+            elif stored != self.contract.address:
+                raise ValueError(f"{db_path} indexes {stored}")
+
+    def _meta(self, key) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def last_block(self) -> int:
+        """Last indexed block"""
+        value = self._meta("last_block")
+        return self.start_block - 1 if value is None else int(value)
+
+    def block_timestamp(self, number) -> int:
+        """Timestamp of an indexed block with logs, a batch end or the start block"""
+        return self.db.execute("SELECT timestamp FROM blocks WHERE number = ?", (number,)).fetchone()[0]
+
+    def _block_hash(self, number) -> Optional[str]:
+        try:
+            return to_hex(self.web3.eth.get_block(number)["hash"])
+        except BlockNotFound:
+            return None
+
+    def _rollback_reorg(self) -> None:
+        """Drops the rows above the last stored block which is still on the chain"""
+        last_valid = self.start_block - 1
+        for number, block_hash in self.db.execute("SELECT number, hash FROM blocks ORDER BY number DESC").fetchall():
+            if self._block_hash(number) == block_hash:
+                last_valid = number
+                break
+        if last_valid >= self.last_block:
+            return
+        with self.db:
+            for name in EVENTS:
+                self.db.execute(f"DELETE FROM {name} WHERE block_number > ?", (last_valid,))
+            self.db.execute("DELETE FROM blocks WHERE number > ?", (last_valid,))
+            self._set_meta("last_block", last_valid)
+
+    def _index_range(self, from_block, to_block) -> int:
+        logs = self.web3.eth.get_logs({
+            "address": self.contract.address,
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "topics": [list(self.topics)],
+        })
+        # the blocks of the logs are read by hash so that they are the ones the logs come from
+        blocks = {log["blockNumber"]: log["blockHash"] for log in logs}
+        blocks.setdefault(to_block, to_block)
+        if from_block == self.start_block:
+            blocks.setdefault(from_block, from_block)  # the deployment block, as point_history(0)
+        with self.db:
+            for number, block_id in blocks.items():
+                block = self.web3.eth.get_block(block_id)
+                self.db.execute(
+                    "INSERT OR REPLACE INTO blocks VALUES (?, ?, ?)", (number, to_hex(block["hash"]), block["timestamp"])
+                )
+            for log in logs:
+                name = self.topics[to_hex(log["topics"][0])]
+                args = self.contract.events[name]().processLog(log)["args"]
+                columns = EVENTS[name]
+                values = [str(args[c]) if kind == "amount" else args[c] for c, kind in columns.items()]
+                self.db.execute(
+                    f"INSERT OR REPLACE INTO {name} VALUES ({', '.join('?' * (len(columns) + 3))})",
+                    [log["blockNumber"], log["logIndex"], to_hex(log["transactionHash"])] + values,
+                )
+            self._set_meta("last_block", to_block)
+        return len(logs)
+
+    def sync(self, to_block=None) -> int:
+        """
+        Index the blocks after `last_block` up to `to_block`, at most the head less
+        `confirmations`, first dropping what a reorg replaced. Returns the number of new logs
+        """
+        self._rollback_reorg()
+        head = self.web3.eth.block_number - self.confirmations
+        to_block = head if to_block is None else min(to_block, head)
+        count = 0
+        while self.last_block < to_block:
+            from_block = self.last_block + 1
+            count += self._index_range(from_block, min(from_block + self.batch_size - 1, to_block))
+        return count
+
+    def events(self, name, from_block=0, to_block=None) -> Iterator[dict]:
+        """Indexed `name` logs in chain order with the timestamp of their block, the amounts as int"""
+        columns = EVENTS[name]
+        query = (
+            f"SELECT e.block_number, e.log_index, e.tx_hash, b.timestamp, {', '.join('e.' + c for c in columns)} "
+            f"FROM {name} e JOIN blocks b ON b.number = e.block_number "
+            "WHERE e.block_number >= ? AND e.block_number <= ? ORDER BY e.block_number, e.log_index"
+        )
+        to_block = self.last_block if to_block is None else to_block
+        for row in self.db.execute(query, (from_block, to_block)):
+            event = dict(zip(["block_number", "log_index", "tx_hash", "timestamp"], row[:4]))
+            for (column, kind), value in zip(columns.items(), row[4:]):
+                event[column] = int(value) if kind == "amount" else value
+            yield event
+
+
+def main():
+    from brownie import VotingEscrow, web3
+
+    indexer = VotingEscrowIndexer(
+        web3,
+        os.environ["VOTING_ESCROW_ADDRESS"],
+        VotingEscrow.abi,
+        os.environ.get("VE_INDEX_DB", "ve_index.db"),
+        start_block=int(os.environ.get("START_BLOCK", 0)),
+    )
+    poll_interval = os.environ.get("POLL_INTERVAL")
+    while True:
+        count = indexer.sync()
+        print(f"{count} logs, indexed till block {indexer.last_block}")
+        if not poll_interval:
+            break
+        time.sleep(float(poll_interval))
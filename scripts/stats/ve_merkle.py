@@ -0,0 +1,149 @@
+"""
+Merkle reward distribution for VotingEscrowMerkleRewards
+
+The shares of a period [t0, t1) are proportional to the area under every
+user's balance line, read from `user_point_history`. The leaves and the tree
+are built as in `scripts/burners/exit_polygon.py`: a zero padded tree of
+keccak256(left + right), the proof goes from the leaf to the root and the bits
+of the leaf index tell on which side the siblings are.
+
+    brownie run scripts/stats/ve_merkle.py --network $NETWORK
+
+builds the distribution of REWARD_AMOUNT over [PERIOD_START, PERIOD_END) and
+writes the root and the proofs to MERKLE_OUTPUT (merkle.json by default).
+"""
+import json
+import math
+import os
+from typing import Dict, List, Tuple
+
+from eth_utils import keccak, to_checksum_address, to_hex
+from hexbytes import HexBytes
+
+Point = Tuple[int, int, int]  # bias, slope, ts as in user_point_history
+
+
+def keccak256(value):
+    """Thin wrapper around keccak function."""
+    return HexBytes(keccak(value))
+
+
+def leaf(index: int, user: str, amount: int) -> bytes:
+    """keccak256(index, user, amount) as VotingEscrowMerkleRewards._claim, 32 bytes each"""
+    return keccak256(index.to_bytes(32, "big") + HexBytes(user).rjust(32, b"\0") + amount.to_bytes(32, "big"))
+
+
+class MerkleTree:
+    """Merkle tree of exit_polygon.MerkleTree, with the proofs by leaf index."""
+
+    def __init__(self, leaves: List[bytes]):
+        """Initialize and recursively build the Merkle tree.
+
+        Args:
+            leaves: Leaf hashes
+        """
+        assert len(leaves) >= 1, "Atleast 1 leaf is needed"
+        tree_depth = math.ceil(math.log(len(leaves), 2))
+        assert tree_depth <= 20, "Depth must be 20 layers or less"
+
+        self.leaves = leaves + [HexBytes(0) * 32] * (2 ** tree_depth - len(leaves))
+        self.layers = [self.leaves]
+        self.create_hashes(self.leaves)
+
+    @property
+    def root(self) -> bytes:
+        """Get the tree root."""
+        return self.layers[-1][0]
+
+    def create_hashes(self, nodes: List[bytes]) -> None:
+        """Recursively build the layers of the tree."""
+        if len(nodes) == 1:
+            return
+
+        tree_level = []
+        for i in range(0, len(nodes), 2):
+            left, right = nodes[i : i + 2]
+            tree_level.append(keccak256(left + right))
+        self.layers.append(tree_level)
+        self.create_hashes(tree_level)
+
+    def get_proof(self, index: int) -> List[bytes]:
+        """Generate a proof for the leaf at `index`."""
+        proof = []
+        for layer in self.layers[:-1]:
+            proof.append(layer[index ^ 1])
+            index //= 2
+        return proof
+
+
+def verify(root: bytes, leaf_hash: bytes, index: int, proof: List[bytes]) -> bool:
+    """The check of VotingEscrowMerkleRewards._verify"""
+    node = leaf_hash
+    for sibling in proof:
+        node = keccak256(node + sibling) if index % 2 == 0 else keccak256(sibling + node)
+        index //= 2
+    return index == 0 and node == root
+
+
+def user_area(points: List[Point], t0: int, t1: int) -> int:
+    """Twice the area under the balance line of `points` over [t0, t1], as VotingEscrowLens._user_area"""
+    area = 0
+    for i, (bias, slope, ts) in enumerate(points):
+        if bias <= 0:
+            continue
+        start = max(ts, t0)
+        end = t1
+        if i + 1 < len(points):
+            end = min(end, points[i + 1][2])
+        if slope > 0:
+            end = min(end, ts + bias // slope)  # lock end
+        if end <= start:
+            continue
+        b0 = bias - slope * (start - ts)
+        b1 = bias - slope * (end - ts)
+        area += (end - start) * (b0 + b1)
+    return area
+
+
+def period_shares(user_points: Dict[str, List[Point]], t0: int, t1: int, amount: int) -> Dict[str, int]:
+    """Split `amount` by the area under the user balances over [t0, t1), rounding down"""
+    areas = {user: user_area(points, t0, t1) for user, points in user_points.items()}
+    total = sum(areas.values())
+    if total == 0:
+        return {}
+    return {user: amount * area // total for user, area in areas.items() if amount * area // total > 0}
+
+
+def build_distribution(shares: Dict[str, int]) -> Tuple[bytes, Dict[str, dict]]:
+    """
+    Root and claims of `shares`, the users are ordered by address so that
+    the same shares always give the same root
+    """
+    users = sorted(shares, key=lambda user: int(user, 16))
+    tree = MerkleTree([leaf(index, user, shares[user]) for index, user in enumerate(users)])
+    claims = {
+        user: {"index": index, "amount": shares[user], "proof": [to_hex(p) for p in tree.get_proof(index)]}
+        for index, user in enumerate(users)
+    }
+    return tree.root, claims
+
+
+def fetch_user_points(voting_escrow, user) -> List[Point]:
+    """(bias, slope, ts) of every user_point_history entry of `user`"""
+    return [tuple(voting_escrow.user_point_history(user, i))[:3] for i in range(voting_escrow.user_point_epoch(user) + 1)]
+
+
+def main():
+    from brownie import Contract, VotingEscrow
+
+    voting_escrow = Contract.from_abi("VotingEscrow", os.environ["VOTING_ESCROW_ADDRESS"], VotingEscrow.abi)
+    t0 = int(os.environ["PERIOD_START"])
+    t1 = int(os.environ["PERIOD_END"])
+    amount = int(os.environ["REWARD_AMOUNT"])
+
+    users = {to_checksum_address(e["provider"]) for e in voting_escrow.events.get_sequence(0, event_type="Deposit")}
+    shares = period_shares({user: fetch_user_points(voting_escrow, user) for user in users}, t0, t1, amount)
+    root, claims = build_distribution(shares)
+    with open(os.environ.get("MERKLE_OUTPUT", "merkle.json"), "w") as f:
+        json.dump({"root": to_hex(root), "period_start": t0, "period_end": t1, "amount": amount, "claims": claims}, f, indent=2)
+    print(f"{len(claims)} users, root {to_hex(root)}, total {sum(shares.values())} of {amount}")
@@ -0,0 +1,641 @@
+"""
+Reference model of contracts/VotingEscrow.vy
+
+`VotingEscrowModel` replays lock and reward operations with the same integer
+arithmetic as the contract (point_history, epoch_supply_area, slope_changes,
+user_point_history and its cumulative area, the reward index and claims), so it can be used as the
+oracle for differential tests. Every operation takes the block timestamp and
+number it is executed at and raises `Revert` where the contract reverts.
+
+`total_supply_curve` and `daily_rewards` are vectorized NumPy paths for bulk
+what-if runs over thousands of locks and years of daily epochs.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from fractions import Fraction
+
+import numpy as np
+
+EPOCH_SECONDS = 24 * 3600
+MAXTIME = 4 * 365 * 86400
+MULTIPLIER = 10**18
+REWARD_MULTIPLIER = 10**36
+MAX_UINT256 = 2**256 - 1
+CURSOR_SHIFT = 2**128
+USER_POINTS_PER_CLAIM = 256  # _userRewards walks at most this many user point timestamps
+
+
+class Revert(Exception):
+    pass
+
+
+def _require(condition, reason):
+    if not condition:
+        raise Revert(reason)
+
+
+def _int_div(a, b):
+    # vyper int128 division truncates towards zero
+    q = abs(a) // abs(b)
+    return q if (a >= 0) == (b > 0) else -q
+
+
+@dataclass
+class Point:
+    bias: int = 0
+    slope: int = 0
+    ts: int = 0
+    blk: int = 0
+
+
+@dataclass
+class LockedBalance:
+    amount: int = 0
+    end: int = 0
+
+
+@dataclass
+class RewardPoint:
+    epoch: int = 0
+    ts0: int = 0
+    ts1: int = 0
+    rate: int = 0
+    acc: int = 0
+    acc_t: int = 0
+
+    def end(self):
+        return (
+            self.acc + self.rate * (self.ts1 - self.ts0),
+            self.acc_t + self.rate * (self.ts1 * self.ts1 - self.ts0 * self.ts0),
+        )
+
+
+@dataclass
+class RewardStream:
+    rate: int = 0  # amount * MULTIPLIER per second
+    finish: int = 0
+    updated: int = 0
+
+
+class VotingEscrowModel:
+    def __init__(self, ts, blk, max_pool_members=MAX_UINT256, min_stake_amount=0):
+        self.max_pool_members = max_pool_members
+        self.min_stake_amount = min_stake_amount
+        self.supply = 0
+        self.pool_members = 0
+        self.locked = defaultdict(LockedBalance)
+        self.epoch = 0
+        self.point_history = defaultdict(Point, {0: Point(ts=ts, blk=blk)})
+        self.epoch_supply_area = defaultdict(int)
+        self.supply_area_cumulative = defaultdict(int)  # epoch -> 2 * area under the total supply before its point
+        self.rewarded_epoch = 0
+        self.user_point_history = defaultdict(lambda: defaultdict(Point))
+        self.user_point_epoch = defaultdict(int)
+        self.user_area_cumulative = defaultdict(int)  # (user, user epoch) -> 2 * area under the balance before its point
+        self.slope_changes = defaultdict(int)
+
+        self.epoch_token_rewards = defaultdict(int)  # (epoch, token) -> amount
+        self.token_last_rewarded_epoch = defaultdict(int)
+        self.token_reward_history = defaultdict(lambda: [RewardPoint()])  # [0] is empty as in the contract
+        self.token_reward_stream = defaultdict(RewardStream)
+        self.user_token_claim_cursor = defaultdict(int)  # (user, token) -> packed cursor
+
+    # locks
+
+    def _checkpoint(self, addr, old_locked, new_locked, ts, blk):
+        u_old = Point()
+        u_new = Point()
+        old_dslope = 0
+        new_dslope = 0
+
+        if addr is not None:
+            if old_locked.end > ts and old_locked.amount > 0:
+                u_old.slope = _int_div(old_locked.amount, MAXTIME)
+                u_old.bias = u_old.slope * (old_locked.end - ts)
+            if new_locked.end > ts and new_locked.amount > 0:
+                u_new.slope = _int_div(new_locked.amount, MAXTIME)
+                u_new.bias = u_new.slope * (new_locked.end - ts)
+
+            old_dslope = self.slope_changes.get(old_locked.end, 0)
+            if new_locked.end != 0:
+                if new_locked.end == old_locked.end:
+                    new_dslope = old_dslope
+                else:
+                    new_dslope = self.slope_changes.get(new_locked.end, 0)
+
+        last_point = self._fill_history(ts, ts, blk)
+        _epoch = self.epoch
+
+        if addr is not None:
+            last_point.slope = max(last_point.slope + u_new.slope - u_old.slope, 0)
+            last_point.bias = max(last_point.bias + u_new.bias - u_old.bias, 0)
+
+        self.point_history[_epoch] = last_point
+
+        if addr is not None:
+            if old_locked.end > ts:
+                old_dslope += u_old.slope
+                if new_locked.end == old_locked.end:
+                    old_dslope -= u_new.slope
+                self._set_slope_change(old_locked.end, old_dslope)
+            if new_locked.end > ts and new_locked.end > old_locked.end:
+                new_dslope -= u_new.slope
+                self._set_slope_change(new_locked.end, new_dslope)
+
+            user_epoch = self.user_point_epoch[addr] + 1
+            u_prev = self.user_point_history[addr][user_epoch - 1]
+            dt = ts - u_prev.ts
+            if u_prev.slope > 0:
+                dt = min(dt, u_prev.bias // u_prev.slope)
+            self.user_area_cumulative[addr, user_epoch] = (
+                self.user_area_cumulative[addr, user_epoch - 1] + dt * (2 * u_prev.bias - u_prev.slope * dt)
+            )
+            self.user_point_epoch[addr] = user_epoch
+            u_new.ts = ts
+            u_new.blk = blk
+            self.user_point_history[addr][user_epoch] = u_new
+
+    def _fill_history(self, t, ts, blk):
+        """Records the global points of the days before `t` with a slope change or ending
+        the rewarded epoch, returns the point at `t`"""
+        _epoch = self.epoch
+        last_point = Point(ts=ts, blk=blk)
+        if _epoch > 0:
+            last_point = replace(self.point_history[_epoch])
+        last_checkpoint = last_point.ts
+        initial_last_point = replace(last_point)
+        block_slope = 0
+        if ts > last_point.ts:
+            block_slope = MULTIPLIER * (blk - last_point.blk) // (ts - last_point.ts)
+
+        rewarded_ts = self.point_history[self.rewarded_epoch].ts
+        for i in range(255):
+            t_i = (last_checkpoint // EPOCH_SECONDS + 1) * EPOCH_SECONDS
+            if last_checkpoint != rewarded_ts:
+                t_i = self.next_slope_change(last_checkpoint) or MAX_UINT256
+            d_slope = 0
+            if t_i > t:
+                t_i = t
+            else:
+                d_slope = self.slope_changes.get(t_i, 0)
+            end_bias = last_point.bias - last_point.slope * (t_i - last_checkpoint)
+            if end_bias < 0:
+                area = last_point.bias * _int_div(last_point.bias, last_point.slope)
+            else:
+                area = (t_i - last_checkpoint) * (last_point.bias + end_bias)
+            if area != 0:
+                self.epoch_supply_area[_epoch] = area
+            self.supply_area_cumulative[_epoch + 1] = self.supply_area_cumulative[_epoch] + area
+            last_point.bias = max(end_bias, 0)
+            last_point.slope = max(last_point.slope + d_slope, 0)
+            last_checkpoint = t_i
+            last_point.ts = t_i
+            last_point.blk = initial_last_point.blk + block_slope * (t_i - initial_last_point.ts) // MULTIPLIER
+            _epoch += 1
+            if t_i == t:
+                if t_i == ts:
+                    last_point.blk = blk
+                break
+            self.point_history[_epoch] = replace(last_point)
+
+        self.epoch = _epoch
+        return last_point
+
+    def checkpoint_until(self, t, ts, blk):
+        _epoch = self.epoch
+        last_ts = self.point_history[_epoch].ts
+        t = min(t, ts, (last_ts // EPOCH_SECONDS + 255) * EPOCH_SECONDS)
+        t = (t // EPOCH_SECONDS) * EPOCH_SECONDS
+        if _epoch == 0 or t <= last_ts:
+            return
+        self.point_history[self.epoch] = self._fill_history(t, ts, blk)
+
+    def checkpoint_up_to(self, max_days, ts, blk):
+        last_ts = self.point_history[self.epoch].ts
+        self.checkpoint_until((last_ts // EPOCH_SECONDS + min(max_days, 255)) * EPOCH_SECONDS, ts, blk)
+
+    def _set_slope_change(self, t, value):
+        # zero keys are dropped, as they are cleared in slope_changes_bitmap
+        if value:
+            self.slope_changes[t] = value
+        else:
+            self.slope_changes.pop(t, None)
+
+    def next_slope_change(self, t):
+        """First time after `t` with a scheduled slope change, 0 if there is none"""
+        day = (t // EPOCH_SECONDS + 1) * EPOCH_SECONDS
+        return min((k for k in self.slope_changes if k >= day), default=0)
+
+    def _deposit_for(self, addr, value, unlock_time, locked_balance, ts, blk):
+        old_locked = replace(locked_balance)
+        _locked = replace(locked_balance)
+        self.supply += value
+        _locked.amount += value
+        if unlock_time != 0:
+            _locked.end = unlock_time
+        self.locked[addr] = _locked
+        self._checkpoint(addr, old_locked, _locked, ts, blk)
+
+    def checkpoint(self, ts, blk):
+        self._checkpoint(None, LockedBalance(), LockedBalance(), ts, blk)
+
+    def deposit_for(self, addr, value, ts, blk):
+        _locked = self.locked[addr]
+        _require(value > 0, "zero stake not allowed")
+        _require(value >= self.min_stake_amount, "too small stake amount")
+        _require(_locked.amount > 0, "No existing lock found")
+        _require(_locked.end > ts, "Cannot add to expired lock. Withdraw")
+        self._deposit_for(addr, value, 0, _locked, ts, blk)
+
+    def create_lock(self, addr, value, unlock_time, ts, blk):
+        unlock_time = (unlock_time // EPOCH_SECONDS) * EPOCH_SECONDS
+        _locked = self.locked[addr]
+        _require(self.pool_members + 1 <= self.max_pool_members, "max_pool_members exceed")
+        _require(value > 0, "zero stake not allowed")
+        _require(value >= self.min_stake_amount, "too small stake amount")
+        _require(_locked.amount == 0, "Withdraw old tokens first")
+        _require(unlock_time > ts, "Can only lock until time in the future")
+        _require(unlock_time <= ts + MAXTIME, "Voting lock can be 4 years max")
+        self.pool_members += 1
+        self._deposit_for(addr, value, unlock_time, _locked, ts, blk)
+
+    def increase_amount(self, addr, value, ts, blk):
+        self.deposit_for(addr, value, ts, blk)
+
+    def increase_unlock_time(self, addr, unlock_time, ts, blk):
+        _locked = self.locked[addr]
+        unlock_time = (unlock_time // EPOCH_SECONDS) * EPOCH_SECONDS
+        _require(_locked.end > ts, "Lock expired")
+        _require(_locked.amount > 0, "Nothing is locked")
+        _require(unlock_time > _locked.end, "Can only increase lock duration")
+        _require(unlock_time <= ts + MAXTIME, "Voting lock can be 4 years max")
+        self._deposit_for(addr, 0, unlock_time, _locked, ts, blk)
+
+    def withdraw(self, addr, ts, blk):
+        """Returns the withdrawn amount"""
+        old_locked = replace(self.locked[addr])
+        _require(ts >= old_locked.end, "The lock didn't expire")
+        _require(self.pool_members > 0, "")  # pool_members underflow
+        self.locked[addr] = LockedBalance()
+        self.supply -= old_locked.amount
+        self._checkpoint(addr, old_locked, LockedBalance(), ts, blk)
+        self.pool_members -= 1
+        return old_locked.amount
+
+    # voting power
+
+    def balance_of(self, addr, t):
+        _epoch = self.user_point_epoch[addr]
+        if _epoch == 0:
+            return 0
+        point = self.user_point_history[addr][_epoch]
+        return max(point.bias - point.slope * (t - point.ts), 0)
+
+    def _supply_at(self, point, t):
+        last_point = replace(point)
+        for i in range(255):
+            t_i = self.next_slope_change(last_point.ts)
+            if t_i == 0 or t_i > t:
+                t_i = t
+            last_point.bias -= last_point.slope * (t_i - last_point.ts)
+            if t_i == t:
+                break
+            last_point.slope += self.slope_changes.get(t_i, 0)
+            last_point.ts = t_i
+        return max(last_point.bias, 0)
+
+    def total_supply(self, t):
+        return self._supply_at(self.point_history[self.epoch], t)
+
+    def _find_block_epoch(self, blk, max_epoch, field="blk"):
+        _min, _max = 0, max_epoch
+        while _min < _max:
+            _mid = (_min + _max + 1) // 2
+            if getattr(self.point_history[_mid], field) <= blk:
+                _min = _mid
+            else:
+                _max = _mid - 1
+        return _min
+
+    def balance_of_at(self, addr, blk, now_ts, now_blk):
+        _require(blk <= now_blk, "")
+        _min, _max = 0, self.user_point_epoch[addr]
+        while _min < _max:
+            _mid = (_min + _max + 1) // 2
+            if self.user_point_history[addr][_mid].blk <= blk:
+                _min = _mid
+            else:
+                _max = _mid - 1
+        upoint = self.user_point_history[addr][_min]
+
+        _epoch = self._find_block_epoch(blk, self.epoch)
+        point_0 = self.point_history[_epoch]
+        if _epoch < self.epoch:
+            point_1 = self.point_history[_epoch + 1]
+            d_block, d_t = point_1.blk - point_0.blk, point_1.ts - point_0.ts
+        else:
+            d_block, d_t = now_blk - point_0.blk, now_ts - point_0.ts
+        block_time = point_0.ts
+        if d_block != 0:
+            block_time += d_t * (blk - point_0.blk) // d_block
+        return max(upoint.bias - upoint.slope * (block_time - upoint.ts), 0)
+
+    def total_supply_at(self, blk, now_ts, now_blk):
+        _require(blk <= now_blk, "")
+        target_epoch = self._find_block_epoch(blk, self.epoch)
+        point = self.point_history[target_epoch]
+        dt = 0
+        if target_epoch < self.epoch:
+            point_next = self.point_history[target_epoch + 1]
+            if point.blk != point_next.blk:
+                dt = (blk - point.blk) * (point_next.ts - point.ts) // (point_next.blk - point.blk)
+        elif point.blk != now_blk:
+            dt = (blk - point.blk) * (now_ts - point.ts) // (now_blk - point.blk)
+        return self._supply_at(point, point.ts + dt)
+
+    def average_total_supply(self, epoch):
+        """Exact average total supply over a closed `epoch`"""
+        dt = self.point_history[epoch + 1].ts - self.point_history[epoch].ts
+        if dt == 0:
+            return Fraction(self.point_history[epoch].bias)
+        return Fraction(self.epoch_supply_area[epoch], 2 * dt)
+
+    def average_user_balance(self, addr, epoch):
+        """Exact average balance of `addr` over a closed `epoch`"""
+        t0 = self.point_history[epoch].ts
+        t1 = self.point_history[epoch + 1].ts
+        if t0 == t1:
+            return Fraction(self.balance_at(addr, t0))
+        area = 0
+        points = self.user_point_history[addr]
+        for user_epoch in range(1, self.user_point_epoch[addr] + 1):
+            point = points[user_epoch]
+            start = max(point.ts, t0)
+            end = t1
+            if user_epoch < self.user_point_epoch[addr]:
+                end = min(end, points[user_epoch + 1].ts)
+            if point.slope > 0:
+                end = min(end, point.ts + point.bias // point.slope)
+            if end <= start:
+                continue
+            b0 = point.bias - point.slope * (start - point.ts)
+            b1 = point.bias - point.slope * (end - point.ts)
+            area += (end - start) * (b0 + b1)
+        return Fraction(area, 2 * (t1 - t0))
+
+    def balance_at(self, addr, t):
+        """Balance of `addr` at any past `t` from its history"""
+        points = self.user_point_history[addr]
+        user_epoch = self.user_point_epoch[addr]
+        while user_epoch > 0 and points[user_epoch].ts > t:
+            user_epoch -= 1
+        if user_epoch == 0:
+            return 0
+        point = points[user_epoch]
+        return max(point.bias - point.slope * (t - point.ts), 0)
+
+    # rewards
+
+    def _pending_reward_point(self, token):
+        _epoch = self.token_last_rewarded_epoch[token]
+        ts0 = self.point_history[_epoch].ts
+        if ts0 == self.point_history[self.epoch].ts:
+            return None
+        history = self.token_reward_history[token]
+        last = history[-1]
+        if len(history) > 1 and last.epoch == _epoch:
+            return None
+        amount = self.epoch_token_rewards[(_epoch, token)]
+        end_epoch = self._find_block_epoch(ts0, self.epoch, "ts") + 1  # the next recorded time
+        stream = self.token_reward_stream[token]
+        t = min(stream.finish, self.point_history[self.epoch].ts)
+        if t > stream.updated:
+            # the stream released after the epoch is spread over all the epochs closed since then
+            amount += (t - stream.updated) * stream.rate // MULTIPLIER
+            if t > self.point_history[end_epoch].ts:
+                end_epoch = self.epoch
+        if amount == 0:
+            return None
+
+        rp = RewardPoint(epoch=_epoch, ts0=ts0, ts1=self.point_history[end_epoch].ts)
+        rp.acc, rp.acc_t = last.end()
+        area = self.supply_area_cumulative[end_epoch] - self.supply_area_cumulative[_epoch]
+        if area != 0:
+            rp.rate = amount * REWARD_MULTIPLIER // area
+        return rp
+
+    def _finalize_token_rewards(self, token):
+        rp = self._pending_reward_point(token)
+        if rp is not None:
+            self.token_reward_history[token].append(rp)
+            stream = self.token_reward_stream[token]
+            t = min(stream.finish, self.point_history[self.epoch].ts)
+            if t > stream.updated:
+                # the stream goes on in the current epoch
+                stream.updated = t
+                self.token_last_rewarded_epoch[token] = self.epoch
+
+    def _reward_integrals(self, token, t, pending):
+        rp = pending
+        if pending is None or pending.ts0 > t:
+            history = self.token_reward_history[token]
+            _min, _max = 0, len(history) - 1
+            while _min < _max:
+                _mid = (_min + _max + 1) // 2
+                if history[_mid].ts0 <= t:
+                    _min = _mid
+                else:
+                    _max = _mid - 1
+            rp = history[_min]
+        if t >= rp.ts1:
+            return rp.end()
+        return rp.acc + rp.rate * (t - rp.ts0), rp.acc_t + rp.rate * (t * t - rp.ts0 * rp.ts0)
+
+    def _search_user_epoch(self, addr, ts):
+        points = self.user_point_history[addr]
+        _min, _max = 0, self.user_point_epoch[addr]
+        if points[_max].ts < ts:
+            return _max
+        while _min < _max:
+            _mid = (_min + _max + 1) // 2
+            if points[_mid].ts <= ts:
+                _min = _mid
+            else:
+                _max = _mid - 1
+        return _min
+
+    def _user_rewards(self, addr, tokens, from_epochs, to_epoch, pendings, start_user_epoch):
+        n = len(tokens)
+        ts_to = self.point_history[to_epoch].ts
+        ts_from = [self.point_history[e].ts for e in from_epochs]
+        active = [k for k in range(n) if from_epochs[k] < to_epoch]
+        rewards = [0] * n
+        if not active:
+            return rewards, 0, to_epoch
+
+        points = self.user_point_history[addr]
+        max_user_epoch = self.user_point_epoch[addr]
+        user_epoch = start_user_epoch or self._search_user_epoch(addr, min(ts_from[k] for k in active))
+        prev = [None] * n  # (t, acc, acc_t) of the previous piece end
+        for i in range(USER_POINTS_PER_CLAIM):
+            if user_epoch > max_user_epoch:
+                break
+            upoint = points[user_epoch]
+            if upoint.ts > ts_to:
+                break
+            if user_epoch < max_user_epoch and points[user_epoch + 1].ts == upoint.ts:
+                # only the last of the points at the same time has a piece of nonzero length
+                user_epoch = self._search_user_epoch(addr, upoint.ts)
+                upoint = points[user_epoch]
+            user_epoch += 1
+            if upoint.bias <= 0:
+                continue
+
+            t1 = ts_to
+            if user_epoch <= max_user_epoch:
+                t1 = min(t1, points[user_epoch].ts)
+            if upoint.slope > 0:
+                t1 = min(t1, upoint.ts + upoint.bias // upoint.slope)  # lock end
+
+            for k in active:
+                t0 = max(upoint.ts, ts_from[k])
+                if t1 <= t0:
+                    continue
+                if prev[k] is not None and prev[k][0] == t0:
+                    acc0, acc_t0 = prev[k][1:]
+                else:
+                    acc0, acc_t0 = self._reward_integrals(tokens[k], t0, pendings[k])
+                acc1, acc_t1 = self._reward_integrals(tokens[k], t1, pendings[k])
+                prev[k] = (t1, acc1, acc_t1)
+
+                bias0 = upoint.bias - upoint.slope * (t0 - upoint.ts)
+                d_acc = acc1 - acc0
+                rewards[k] += (2 * bias0 * d_acc - upoint.slope * (acc_t1 - acc_t0 - 2 * t0 * d_acc)) // REWARD_MULTIPLIER
+
+        window_end = to_epoch
+        if user_epoch <= max_user_epoch and points[user_epoch].ts <= ts_to:
+            # the walk limit: the window ends at the first epoch at the time of the next user point
+            window_end = self._find_block_epoch(points[user_epoch].ts - 1, to_epoch, "ts") + 1
+        return rewards, user_epoch - 1, window_end
+
+    def _checkpoint_rewards(self, token, ts, blk):
+        p = self.point_history[self.epoch]
+        if not (p.ts <= ts < p.ts + EPOCH_SECONDS):
+            self.checkpoint(ts, blk)
+        if self.point_history[self.token_last_rewarded_epoch[token]].ts != self.point_history[self.epoch].ts:
+            self._finalize_token_rewards(token)
+            self.token_last_rewarded_epoch[token] = self.epoch
+            self.rewarded_epoch = self.epoch
+        _epoch = self.token_last_rewarded_epoch[token]  # kept while no time has passed since its start
+
+        stream = self.token_reward_stream[token]
+        t = min(ts, stream.finish)
+        if t > stream.updated:
+            self.epoch_token_rewards[(_epoch, token)] += (t - stream.updated) * stream.rate // MULTIPLIER
+            stream.updated = t
+        return _epoch
+
+    def receive_reward(self, token, amount, ts, blk):
+        _epoch = self._checkpoint_rewards(token, ts, blk)
+        self.epoch_token_rewards[(_epoch, token)] += amount
+
+    def receive_reward_stream(self, token, amount, duration, ts, blk):
+        _require(duration > 0, "zero duration")
+        stream = self.token_reward_stream[token]  # rate and finish are kept by the release
+        finish = max(stream.finish, ts + duration)
+        leftover = (stream.finish - ts) * stream.rate if stream.finish > ts else 0
+        rate = (amount * MULTIPLIER + leftover) // (finish - ts)
+        if stream.finish > ts:
+            _require(rate >= stream.rate, "stream rate decrease")
+        self._checkpoint_rewards(token, ts, blk)
+        self.token_reward_stream[token] = RewardStream(rate, finish, ts)
+
+    def checkpoint_reward_stream(self, token, ts, blk):
+        self._checkpoint_rewards(token, ts, blk)
+
+    def user_token_claimed_epoch(self, addr, token):
+        return self.user_token_claim_cursor[(addr, token)] % CURSOR_SHIFT
+
+    def claimable_rewards(self, addr, token):
+        cursor = self.user_token_claim_cursor[(addr, token)]
+        from_epoch = cursor % CURSOR_SHIFT + 1
+        if from_epoch >= self.epoch:
+            return 0
+        pending = self._pending_reward_point(token)
+        rewards, _, _ = self._user_rewards(addr, [token], [from_epoch], self.epoch, [pending], cursor // CURSOR_SHIFT)
+        return rewards[0]
+
+    def claim_rewards(self, addr, tokens, max_epochs=MAX_UINT256):
+        """Returns the claimed amount of every token in `tokens`"""
+        _require(len(set(tokens)) == len(tokens), "duplicate token")
+        to_epoch = self.epoch
+        from_epochs = []
+        start_user_epoch = MAX_UINT256
+        for token in tokens:
+            self._finalize_token_rewards(token)
+            cursor = self.user_token_claim_cursor[(addr, token)]
+            from_epoch = cursor % CURSOR_SHIFT + 1
+            from_epochs.append(from_epoch)
+            if from_epoch < to_epoch and to_epoch - from_epoch > max_epochs:
+                to_epoch = from_epoch + max_epochs
+            start_user_epoch = min(start_user_epoch, cursor // CURSOR_SHIFT)
+
+        rewards, user_epoch, to_epoch = self._user_rewards(
+            addr, tokens, from_epochs, to_epoch, [None] * len(tokens), start_user_epoch
+        )
+        for token, from_epoch in zip(tokens, from_epochs):
+            if from_epoch < to_epoch:
+                self.user_token_claim_cursor[(addr, token)] = to_epoch - 1 + CURSOR_SHIFT * user_epoch
+        return rewards
+
+
+# bulk what-if runs
+
+
+def total_supply_curve(amounts, starts, ends, ts):
+    """
+    Exact total supply at times `ts` of locks created at `starts` and never changed
+    @param amounts Locked amounts
+    @param starts Lock creation times
+    @param ends Unlock times, already rounded to EPOCH_SECONDS
+    @return Array of python ints, as totalSupply(t) would return
+    """
+    slopes = np.array([int(a) // MAXTIME for a in amounts], dtype=object)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    ts = np.asarray(ts, dtype=np.int64)
+
+    # a lock is active at t if start <= t < end, its balance is slope * (end - t)
+    def active_sums(times):
+        order = np.argsort(times, kind="stable")
+        slope_sum = np.concatenate([[0], np.cumsum(slopes[order])])
+        slope_end_sum = np.concatenate([[0], np.cumsum(slopes[order] * ends[order].astype(object))])
+        idx = np.searchsorted(times[order], ts, side="right")
+        return slope_sum[idx], slope_end_sum[idx]
+
+    started_slope, started_slope_end = active_sums(starts)
+    ended_slope, ended_slope_end = active_sums(ends)
+    return (started_slope_end - ended_slope_end) - ts.astype(object) * (started_slope - ended_slope)
+
+
+def daily_rewards(amounts, starts, ends, rewards, day0):
+    """
+    Approximate rewards of every lock when `rewards[d]` is spread over day `day0 + d`
+    @dev float64: for what-if runs, replay VotingEscrowModel for exact amounts
+    @return Array of the rewards per lock
+    """
+    slopes = np.array([int(a) // MAXTIME for a in amounts], dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    result = np.zeros(len(slopes))
+    for d, reward in enumerate(rewards):
+        t0 = (day0 + d) * EPOCH_SECONDS
+        t1 = t0 + EPOCH_SECONDS
+        lo = np.clip(starts, t0, t1)
+        hi = np.clip(ends, t0, t1)
+        # integral of slope * (end - t) over [lo, hi]
+        area = np.where(hi > lo, slopes * (hi - lo) * (2 * ends - lo - hi) / 2, 0.0)
+        total = area.sum()
+        if total > 0:
+            result += reward * area / total
+    return result
@@ -0,0 +1,163 @@
+"""
+Offline replay of VotingEscrow from the indexed events
+
+`replay` feeds the Deposit, Withdraw, reward and claim logs stored by
+ve_indexer.py into VotingEscrowModel in chain order. That rebuilds
+point_history, user_point_history, slope_changes and the reward index without
+reading the contract storage. The model then answers balanceOf, totalSupply,
+balanceOfAt, totalSupplyAt and the per epoch reward shares for any time, and
+every replayed claim is checked against the amount in its log.
+
+checkpoint(), checkpoint_until, checkpoint_up_to and checkpoint_reward_stream
+leave no log. The balances and the supply at a given time depend only on the
+locks, so they are always exact. Those calls do add global points, though, so
+point_history, the block based views and the epoch bounds are exact only when
+their (block, timestamp) are passed as `checkpoints`. `cross_check` compares
+a random sample of reads with the live contract.
+
+    brownie run scripts/stats/ve_replay.py --network $NETWORK
+
+syncs VE_INDEX_DB (see ve_indexer.py) from START_BLOCK, the deployment block,
+replays it and cross checks SAMPLE_SIZE (100 by default) random reads against
+VOTING_ESCROW_ADDRESS.
+"""
+import os
+import random
+from fractions import Fraction
+from typing import Dict, Iterable, List, Tuple
+
+from scripts.stats.ve_model import MAX_UINT256, MAXTIME, VotingEscrowModel
+
+# Deposit.type
+DEPOSIT_FOR_TYPE = 0
+CREATE_LOCK_TYPE = 1
+INCREASE_LOCK_AMOUNT = 2
+INCREASE_UNLOCK_TIME = 3
+
+REPLAYED_EVENTS = ("Deposit", "Withdraw", "RewardReceived", "RewardStreamReceived", "RewardsClaimed")
+
+
+def replay(indexer, checkpoints: Iterable[Tuple[int, int]] = (), to_block=None) -> Tuple[VotingEscrowModel, List[str]]:
+    """
+    Model of the contract after the indexed logs up to `to_block`
+    @param indexer VotingEscrowIndexer started at the deployment block, which gives point_history(0)
+    @param checkpoints (block number, timestamp) of the global checkpoints that left no log,
+           replayed before the logs of their block
+    @return The model and the claims whose replayed amount differs from the log
+    """
+    # the settings only reject transactions, the logged ones all went through
+    model = VotingEscrowModel(indexer.block_timestamp(indexer.start_block), indexer.start_block)
+    ops = [((blk, -1), "checkpoint", {"block_number": blk, "timestamp": ts}) for blk, ts in checkpoints]
+    for name in REPLAYED_EVENTS:
+        ops += [((e["block_number"], e["log_index"]), name, e) for e in indexer.events(name, to_block=to_block)]
+    ops.sort(key=lambda op: op[0])
+
+    mismatches = []
+    for _, name, e in ops:
+        blk = e["block_number"]
+        ts = e["timestamp"]
+        if name == "checkpoint":
+            model.checkpoint(ts, blk)
+        elif name == "Deposit":
+            if e["type"] == CREATE_LOCK_TYPE:
+                model.create_lock(e["provider"], e["value"], e["locktime"], ts, blk)
+            elif e["type"] == INCREASE_UNLOCK_TIME:
+                model.increase_unlock_time(e["provider"], e["locktime"], ts, blk)
+            else:  # DEPOSIT_FOR_TYPE, INCREASE_LOCK_AMOUNT
+                model.deposit_for(e["provider"], e["value"], ts, blk)
+        elif name == "Withdraw":
+            model.withdraw(e["provider"], ts, blk)
+        elif name == "RewardReceived":
+            model.receive_reward(e["token"], e["actual_amount"], ts, blk)
+        elif name == "RewardStreamReceived":
+            # the finish of the log is max(finish, ts + duration), which gives the same stream
+            model.receive_reward_stream(e["token"], e["actual_amount"], e["finish"] - ts, ts, blk)
+        else:  # RewardsClaimed
+            claimed_epoch = model.user_token_claimed_epoch(e["user"], e["token"])
+            max_epochs = MAX_UINT256
+            if e["user_claimed_epoch"] > claimed_epoch:
+                max_epochs = e["user_claimed_epoch"] - claimed_epoch
+            amount = model.claim_rewards(e["user"], [e["token"]], max_epochs)[0]
+            if amount != e["amount"]:
+                mismatches.append(f"claim of {e['user']} in {e['tx_hash']}: replay {amount} != log {e['amount']}")
+    return model, mismatches
+
+
+def total_supply_at_time(model: VotingEscrowModel, t: int) -> int:
+    """Total supply at any `t` after the deployment, from the last global point before it"""
+    _epoch = model.epoch
+    while _epoch > 0 and model.point_history[_epoch].ts > t:
+        _epoch -= 1
+    return model._supply_at(model.point_history[_epoch], t)
+
+
+def reward_shares(model: VotingEscrowModel, token, epoch: int) -> Dict[str, Fraction]:
+    """
+    Exact `token` rewards received in a closed `epoch` per user, split by the area under the
+    balances as the claims do, the stream released after the epoch is not included
+    """
+    rewards = model.epoch_token_rewards[(epoch, token)]
+    total = model.average_total_supply(epoch)
+    if rewards == 0 or total == 0:
+        return {}
+    shares = {user: rewards * model.average_user_balance(user, epoch) / total for user in model.user_point_epoch}
+    return {user: share for user, share in shares.items() if share > 0}
+
+
+def cross_check(model: VotingEscrowModel, voting_escrow, now_ts: int, now_blk: int, sample_size=100, seed=0) -> List[str]:
+    """
+    Compare `sample_size` random reads of every kind with `voting_escrow` at block `now_blk`,
+    the last replayed one, returns the mismatches
+    """
+    rng = random.Random(seed)
+    users = sorted(model.user_point_epoch)
+    mismatches = []
+
+    def check(call, local, *args):
+        remote = getattr(voting_escrow, call)(*args, block_identifier=now_blk)
+        if local != remote:
+            mismatches.append(f"{call}{args}: replay {local} != contract {remote}")
+
+    last_ts = model.point_history[model.epoch].ts
+    for _ in range(sample_size):
+        # balanceOf and totalSupply extrapolate the last point, as the contract does
+        t = rng.randint(last_ts, now_ts + MAXTIME)
+        check("totalSupply", model.total_supply(t), t)
+        blk = rng.randint(model.point_history[0].blk, now_blk)
+        check("totalSupplyAt", model.total_supply_at(blk, now_ts, now_blk), blk)
+        _epoch = rng.randint(0, model.epoch)
+        p = model.point_history[_epoch]
+        check("point_history", (p.bias, p.slope, p.ts, p.blk), _epoch)
+        if not users:
+            continue
+        user = rng.choice(users)
+        user_epoch = rng.randint(0, model.user_point_epoch[user])
+        p = model.user_point_history[user][user_epoch]
+        check("user_point_history", (p.bias, p.slope, p.ts, p.blk), user, user_epoch)
+        t = rng.randint(model.user_point_history[user][model.user_point_epoch[user]].ts, now_ts + MAXTIME)
+        check("balanceOf", model.balance_of(user, t), user, t)
+        check("balanceOfAt", model.balance_of_at(user, blk, now_ts, now_blk), user, blk)
+    return mismatches
+
+
+def main():
+    from brownie import Contract, VotingEscrow, web3
+
+    from scripts.stats.ve_indexer import VotingEscrowIndexer
+
+    voting_escrow = Contract.from_abi("VotingEscrow", os.environ["VOTING_ESCROW_ADDRESS"], VotingEscrow.abi)
+    start_block = int(os.environ["START_BLOCK"])
+    indexer = VotingEscrowIndexer(
+        web3, voting_escrow.address, VotingEscrow.abi, os.environ.get("VE_INDEX_DB", "ve_index.db"), start_block=start_block
+    )
+    indexer.sync()
+
+    model, mismatches = replay(indexer)
+    now_blk = indexer.last_block
+    now_ts = indexer.block_timestamp(now_blk)
+    mismatches += cross_check(model, voting_escrow, now_ts, now_blk, int(os.environ.get("SAMPLE_SIZE", 100)))
+    print(f"replayed till block {now_blk}: {model.epoch} epochs, {len(model.user_point_epoch)} users")
+    print(f"total supply {model.total_supply(now_ts)}")
+    for mismatch in mismatches:
+        print(mismatch)
+    print(f"{len(mismatches)} mismatches")
@@ -103,6 +103,16 @@ def voting_escrow(VotingEscrow, accounts, token):
     yield contract
 
 
+@pytest.fixture(scope="module")
+def voting_escrow_lens(VotingEscrowLens, accounts, voting_escrow):
+    yield VotingEscrowLens.deploy(voting_escrow, {"from": accounts[0]})
+
+
+@pytest.fixture(scope="module")
+def voting_escrow_merkle_rewards(VotingEscrowMerkleRewards, accounts, voting_escrow):
+    yield VotingEscrowMerkleRewards.deploy(voting_escrow, {"from": accounts[0]})
+
+
 @pytest.fixture(scope="module")
 def gauge_controller(GaugeController, accounts, token, voting_escrow):
     yield GaugeController.deploy(token, voting_escrow, {"from": accounts[0]})
@@ -301,6 +311,11 @@ def coin_c():
     yield ERC20("Coin C", "mWBTC", 8)
 
 
+@pytest.fixture(scope="module")
+def multicall(Multicall, accounts):
+    yield Multicall.deploy({"from": accounts[0]})
+
+
 @pytest.fixture(scope="module")
 def mock_lp_token(ERC20LP, accounts):  # Not using the actual Curve contract
     yield ERC20LP.deploy("Curve LP token", "usdCrv", 18, 10 ** 9, {"from": accounts[0]})
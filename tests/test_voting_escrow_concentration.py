@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from scripts.stats.concentration import balance_matrix, gini, herfindahl, nakamoto, top_k_share
+from scripts.stats.ve_model import EPOCH_SECONDS, VotingEscrowModel
+
+
+def test_metrics():
+    rng = np.random.default_rng(0)
+    balances = rng.pareto(1.5, (5, 200)) * (rng.random((5, 200)) < 0.7)
+    balances[4] = 0
+    ginis = gini(balances)
+    nakamotos = nakamoto(balances)
+    for row, g, k in zip(balances[:4], ginis, nakamotos):
+        x = row[row > 0]
+        assert g == pytest.approx(np.abs(np.subtract.outer(x, x)).mean() / x.mean() / 2)
+        top = np.cumsum(np.sort(x)[::-1])
+        assert k == np.argmax(top > top[-1] / 2) + 1
+    assert np.isnan(ginis[4]) and nakamotos[4] == 0
+    assert herfindahl(balances[0]) == pytest.approx((balances[0] ** 2).sum() / balances[0].sum() ** 2)
+    assert top_k_share(balances[0], 10) == pytest.approx(np.sort(balances[0])[-10:].sum() / balances[0].sum())
+
+    assert gini([0, 0, 5, 5]) == 0
+    assert nakamoto([1, 1]) == 2
+    assert top_k_share([1, 3], 5) == 1
+
+
+def test_balance_matrix():
+    users = [f"0x{i:040x}" for i in range(4)]
+    ts = 100 * EPOCH_SECONDS
+    model = VotingEscrowModel(ts, 1)
+    for i, user in enumerate(users):
+        model.create_lock(user, 10**21 * (i + 1), ts + (i + 2) * 10 * EPOCH_SECONDS, ts + i, 2 + i)
+    model.increase_unlock_time(users[0], ts + 50 * EPOCH_SECONDS, ts + 5 * EPOCH_SECONDS, 10)
+    model.withdraw(users[1], ts + 40 * EPOCH_SECONDS, 11)
+
+    times = [ts - 1] + list(range(ts, ts + 60 * EPOCH_SECONDS, EPOCH_SECONDS // 2))
+    holders, balances = balance_matrix(model, times)
+    assert holders == sorted(users)
+    for j, holder in enumerate(holders):
+        for i, t in enumerate(times):
+            assert balances[i, j] == pytest.approx(model.balance_at(holder, t), abs=0)
+    assert (balances[-1] == 0).all()  # every lock has expired
@@ -0,0 +1,167 @@
+from brownie import VotingEscrowSettings
+
+from .conftest import approx
+from .utils import *
+
+
+def _claim_gas_after_backlog(chain, accounts, token, voting_escrow, backlog):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    MAXTIME = voting_escrow.MAXTIME()
+    payer = accounts[0]
+    user1 = accounts[1]
+    user2 = accounts[2]
+    reward_amount = 10**18
+    deposit = 10**18
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for user in (user1, user2):
+        token.transfer(user, deposit)
+        token.approve(voting_escrow, deposit, {"from": user})
+        voting_escrow.create_lock(deposit, chain.time() + MAXTIME, {"from": user})
+
+    # every epoch is rewarded and closed, user1 never claims
+    for i in range(backlog):
+        voting_escrow.receiveReward(token, reward_amount, {"from": payer})
+        chain.sleep(EPOCH_SECONDS)
+        voting_escrow.checkpoint()
+    # another user claims first, so only user1 cost is measured
+    voting_escrow.claim_rewards(token, {"from": user2})
+
+    claimable = voting_escrow.user_token_claimable_rewards(user1, token)
+    tx = voting_escrow.claim_rewards(token, {"from": user1})
+    assert tx.events['UserRewardsClaimed']['amount'] == claimable
+    assert approx(claimable, backlog * reward_amount / 2, 1e-6)
+    return tx.gas_used
+
+
+def test_claim_rewards_gas_does_not_depend_on_backlog(chain, accounts, token, voting_escrow):
+    gas = {}
+    for backlog in [10, 100, 1000]:
+        chain.snapshot()
+        gas[backlog] = _claim_gas_after_backlog(chain, accounts, token, voting_escrow, backlog)
+        chain.revert()
+        print(f"claim_rewards after {backlog} rewarded epochs: {gas[backlog]} gas")
+
+    # O(log) binary search over the rewarded epochs only
+    assert gas[1000] < gas[10] * 1.1
+
+
+def test_claim_rewards_many_gas(chain, accounts, token, voting_escrow, ERC20CRV):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    MAXTIME = voting_escrow.MAXTIME()
+    payer = accounts[0]
+    user1 = accounts[1]
+    tokens = [token] + [ERC20CRV.deploy("Reward Token", "RWD", 18, {"from": payer}) for i in range(3)]
+
+    for t in tokens:
+        t.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    token.transfer(user1, 10**18)
+    token.approve(voting_escrow, 10**18, {"from": user1})
+    voting_escrow.create_lock(10**18, chain.time() + MAXTIME, {"from": user1})
+    for i in range(10):
+        for t in tokens:
+            voting_escrow.receiveReward(t, 10**18, {"from": payer})
+        chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint()
+
+    chain.snapshot()
+    gas_separate = sum(voting_escrow.claim_rewards(t, {"from": user1}).gas_used for t in tokens)
+    chain.revert()
+    gas_many = voting_escrow.claim_rewards_many(tokens, {"from": user1}).gas_used
+    print(f"claim_rewards x{len(tokens)}: {gas_separate} gas, claim_rewards_many: {gas_many} gas")
+
+    assert gas_many < gas_separate
+
+
+def test_claim_rewards_user_epoch_cursor(chain, accounts, token, voting_escrow):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    MAXTIME = voting_escrow.MAXTIME()
+    payer = accounts[0]
+    user1 = accounts[1]
+    user2 = accounts[2]
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for user in (user1, user2):
+        token.transfer(user, 10**20)
+        token.approve(voting_escrow, 2**256 - 1, {"from": user})
+        voting_escrow.create_lock(10**18, chain.time() + MAXTIME, {"from": user})
+    assert voting_escrow.user_token_epoch_cursor(user1, token) == 0
+
+    # many user checkpoints inside the claimed window
+    for i in range(30):
+        voting_escrow.receiveReward(token, 10**18, {"from": payer})
+        chain.sleep(EPOCH_SECONDS // 2)
+        voting_escrow.increase_amount(10**18, {"from": user1})
+        chain.sleep(EPOCH_SECONDS // 2)
+    voting_escrow.checkpoint()
+
+    tx_search = voting_escrow.claim_rewards(token, {"from": user1})
+    assert voting_escrow.user_token_epoch_cursor(user1, token) == voting_escrow.user_point_epoch(user1)
+    assert voting_escrow.user_token_claimed_epoch(user1, token) == voting_escrow.epoch() - 1
+
+    voting_escrow.receiveReward(token, 10**18, {"from": payer})
+    chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint()
+    tx_cursor = voting_escrow.claim_rewards(token, {"from": user1})
+    print(f"claim_rewards after 30 user checkpoints: {tx_search.gas_used} gas, next claim from the cursor: {tx_cursor.gas_used} gas")
+    assert tx_cursor.gas_used < tx_search.gas_used
+
+
+def test_checkpoint_gas_empty_days(chain, accounts, token, voting_escrow):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    MAXTIME = voting_escrow.MAXTIME()
+    user1 = accounts[1]
+    token.transfer(user1, 10**18)
+    token.approve(voting_escrow, 10**18, {"from": user1})
+    voting_escrow.create_lock(10**18, chain.time() + MAXTIME, {"from": user1})
+    epoch = voting_escrow.epoch()
+
+    gas = {}
+    for days in [1, 31]:
+        chain.snapshot()
+        chain.sleep(days * EPOCH_SECONDS)
+        gas[days] = voting_escrow.checkpoint().gas_used
+        # the days without slope changes and rewards are not recorded
+        assert voting_escrow.epoch() == epoch + 1
+        chain.revert()
+    print(f"checkpoint: {gas[1]} gas after 1 day, {gas[31]} gas after 31 days")
+
+    assert gas[31] - gas[1] < 5000
+
+
+def test_checkpoint_up_to_backfill(chain, accounts, token, voting_escrow):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    MAXTIME = voting_escrow.MAXTIME()
+    keeper = accounts[0]
+    user1 = accounts[1]
+    others = accounts[2:10]
+    VotingEscrowSettings.at(voting_escrow.address).set_max_pool_members(1 + len(others), {"from": keeper})
+    token.transfer(user1, 2 * 10**18)
+    token.approve(voting_escrow, 2 * 10**18, {"from": user1})
+    voting_escrow.create_lock(10**18, chain.time() + MAXTIME, {"from": user1})
+    # a lock ends every 10 days, these days are recorded in the history
+    for i, user in enumerate(others):
+        token.transfer(user, 10**18)
+        token.approve(voting_escrow, 10**18, {"from": user})
+        voting_escrow.create_lock(10**18, chain.time() + (i + 1) * 10 * EPOCH_SECONDS, {"from": user})
+    last_ts = voting_escrow.point_history(voting_escrow.epoch())[2]
+    chain.sleep(100 * EPOCH_SECONDS - chain.time() % EPOCH_SECONDS + 3600)
+    t_future = chain.time() + MAXTIME // 2
+
+    chain.snapshot()
+    gas_idle = voting_escrow.increase_amount(10**18, {"from": user1}).gas_used
+    supply = voting_escrow.totalSupply(t_future)
+    chain.revert()
+
+    voting_escrow.checkpoint_up_to(60, {"from": keeper})
+    assert voting_escrow.point_history(voting_escrow.epoch())[2] == (last_ts // EPOCH_SECONDS + 60) * EPOCH_SECONDS
+    voting_escrow.checkpoint_until(chain.time(), {"from": keeper})
+    epoch = voting_escrow.epoch()
+    VotingEscrowSettings.at(voting_escrow.address).set_min_delay_between_manual_checkpoint(3600, {"from": keeper})
+    voting_escrow.checkpoint_until(chain.time(), {"from": keeper})  # nothing left to fill, not delayed
+    assert voting_escrow.epoch() == epoch
+    gas_filled = voting_escrow.increase_amount(10**18, {"from": user1}).gas_used
+    print(f"increase_amount after 100 idle days: {gas_idle} gas, after the backfill: {gas_filled} gas")
+
+    assert voting_escrow.totalSupply(t_future) == supply
+    assert gas_filled < gas_idle / 3
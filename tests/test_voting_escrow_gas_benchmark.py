@@ -0,0 +1,132 @@
+"""
+Gas of the VotingEscrow entry points versus the history depth.
+
+Every scenario builds a history of `epochs` rewarded days, `user_checkpoints`
+increase_amount calls of every pool member and `pool_size` members, then samples each
+entry point several times. The min/median/p95/max table is printed (run with `-s`)
+and compared with tests/gas_baseline.json, a regression of any hot path fails,
+and so does a scenario or an entry point missing from the baseline. Without the
+baseline file the comparison is skipped.
+
+Write the baseline, then commit it:
+    GAS_BASELINE_UPDATE=1 brownie test tests/test_voting_escrow_gas_benchmark.py
+"""
+import json
+import math
+import os
+import statistics
+from pathlib import Path
+
+import pytest
+from brownie import VotingEscrowSettings
+
+BASELINE_PATH = Path(__file__).parent / "gas_baseline.json"
+GAS_TOLERANCE = 0.02  # allowed growth over the baseline
+SAMPLES = 5  # calls of every entry point per scenario
+DEPOSIT = 10**18
+REWARD = 10**18
+
+SCENARIOS = [
+    # epochs, user_checkpoints, pool_size
+    (10, 0, 3),
+    (100, 0, 3),
+    (365, 0, 3),
+    (100, 30, 3),
+    (100, 0, 30),
+]
+
+
+def gas_stats(samples):
+    samples = sorted(samples)
+    p95 = samples[math.ceil(0.95 * len(samples)) - 1]  # nearest rank
+    return {"min": samples[0], "median": int(statistics.median(samples)), "p95": p95, "max": samples[-1]}
+
+
+def print_gas_table(title, report):
+    print(f"\n{title}")
+    print(f'{"entry point":<20}{"min":>10}{"median":>10}{"p95":>10}{"max":>10}')
+    for entry_point, stats in report.items():
+        print(f'{entry_point:<20}' + "".join(f'{stats[k]:>10}' for k in ("min", "median", "p95", "max")))
+
+
+def check_baseline(scenario, report):
+    if not BASELINE_PATH.exists() and not os.environ.get("GAS_BASELINE_UPDATE"):
+        pytest.skip(f"{BASELINE_PATH.name} is missing, write it with GAS_BASELINE_UPDATE=1 to compare the gas")
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    if os.environ.get("GAS_BASELINE_UPDATE"):
+        baseline[scenario] = report
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        return
+
+    expected = baseline.get(scenario)
+    if expected is None:
+        pytest.fail(f"no gas baseline for {scenario} in {BASELINE_PATH.name}, write it with GAS_BASELINE_UPDATE=1")
+    missing = sorted(set(report) - set(expected))
+    assert not missing, f"no gas baseline for {', '.join(missing)} in {scenario}, write it with GAS_BASELINE_UPDATE=1"
+    regressions = [
+        f"{entry_point} {key}: {stats[key]} > {expected[entry_point][key]}"
+        for entry_point, stats in report.items()
+        for key in ("median", "p95", "max")
+        if stats[key] > expected[entry_point][key] * (1 + GAS_TOLERANCE)
+    ]
+    assert not regressions, f"gas regression in {scenario}:\n" + "\n".join(regressions)
+
+
+@pytest.mark.parametrize(
+    "epochs,user_checkpoints,pool_size",
+    SCENARIOS,
+    ids=[f"epochs={e}-checkpoints={c}-pool={p}" for e, c, p in SCENARIOS],
+)
+def test_gas_benchmark(chain, accounts, token, voting_escrow, epochs, user_checkpoints, pool_size):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    MAXTIME = voting_escrow.MAXTIME()
+    payer = accounts[0]
+    members = accounts[1:pool_size + 1]
+    newcomers = accounts[pool_size + 1:pool_size + 1 + SAMPLES]
+    gas = {k: [] for k in (
+        "create_lock", "increase_amount", "withdraw", "checkpoint", "receiveReward", "claim_rewards", "balanceOfAt",
+    )}
+
+    VotingEscrowSettings.at(voting_escrow.address).set_max_pool_members(pool_size + SAMPLES, {"from": payer})
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for user in members + newcomers:
+        token.transfer(user, DEPOSIT * (user_checkpoints + 2))
+        token.approve(voting_escrow, 2**256 - 1, {"from": user})
+    for user in members:
+        voting_escrow.create_lock(DEPOSIT, chain.time() + MAXTIME, {"from": user})
+
+    # history
+    blocks = []
+    checkpoint_epochs = {i * epochs // user_checkpoints for i in range(user_checkpoints)}
+    for i in range(epochs):
+        tx = voting_escrow.receiveReward(token, REWARD, {"from": payer})
+        blocks.append(tx.block_number)
+        if i in checkpoint_epochs:
+            for user in members:
+                voting_escrow.increase_amount(DEPOSIT, {"from": user})
+        chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint({"from": payer})
+
+    # measurements
+    for user in newcomers:
+        tx = voting_escrow.create_lock(DEPOSIT, chain.time() + 2 * EPOCH_SECONDS, {"from": user})
+        gas["create_lock"].append(tx.gas_used)
+    for user in members[:SAMPLES]:
+        gas["increase_amount"].append(voting_escrow.increase_amount(DEPOSIT, {"from": user}).gas_used)
+    for i in range(SAMPLES):
+        gas["receiveReward"].append(voting_escrow.receiveReward(token, REWARD, {"from": payer}).gas_used)
+    for user in members[:SAMPLES]:
+        for block in blocks[::max(len(blocks) // SAMPLES, 1)][:SAMPLES]:
+            gas["balanceOfAt"].append(voting_escrow.balanceOfAt.estimate_gas(user, block))
+    for i in range(SAMPLES):
+        chain.sleep(EPOCH_SECONDS)
+        gas["checkpoint"].append(voting_escrow.checkpoint({"from": payer}).gas_used)
+    for user in members[:SAMPLES]:
+        gas["claim_rewards"].append(voting_escrow.claim_rewards(token, {"from": user}).gas_used)
+    for user in newcomers:
+        gas["withdraw"].append(voting_escrow.withdraw({"from": user}).gas_used)
+
+    scenario = f"epochs={epochs}-checkpoints={user_checkpoints}-pool={pool_size}"
+    report = {entry_point: gas_stats(samples) for entry_point, samples in gas.items()}
+    print_gas_table(scenario, report)
+    check_baseline(scenario, report)
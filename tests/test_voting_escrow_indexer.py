@@ -0,0 +1,41 @@
+from brownie import VotingEscrow, web3
+
+from scripts.stats.ve_indexer import VotingEscrowIndexer
+
+
+def test_indexer(chain, accounts, token, voting_escrow, tmp_path):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    users = accounts[1:4]
+    db_path = tmp_path / "ve_index.db"
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for i, user in enumerate(users):
+        token.transfer(user, 10**18 * (i + 1))
+        token.approve(voting_escrow, 10**18 * (i + 1), {"from": user})
+        voting_escrow.create_lock(10**18 * (i + 1), chain.time() + 7 * EPOCH_SECONDS, {"from": user})
+    voting_escrow.receiveReward(token, 10**18, {"from": payer})
+
+    indexer = VotingEscrowIndexer(web3, voting_escrow.address, VotingEscrow.abi, db_path, batch_size=3)
+    assert indexer.sync() == 7  # 3 Deposit, 3 Supply and RewardReceived
+    assert indexer.last_block == chain.height
+    deposits = list(indexer.events("Deposit"))
+    assert [e["provider"] for e in deposits] == users
+    assert [e["value"] for e in deposits] == [10**18, 2 * 10**18, 3 * 10**18]
+    assert list(indexer.events("Supply"))[-1]["supply"] == 6 * 10**18
+    assert list(indexer.events("RewardReceived"))[0]["timestamp"] == chain[-1].timestamp
+
+    # a new run resumes from the last indexed block
+    chain.sleep(8 * EPOCH_SECONDS)
+    voting_escrow.withdraw({"from": users[0]})
+    indexer = VotingEscrowIndexer(web3, voting_escrow.address, VotingEscrow.abi, db_path, batch_size=3)
+    assert indexer.sync() == 2
+
+    # reorg: the last withdraw is replaced by another one at the same height
+    height = chain.height
+    chain.undo()
+    voting_escrow.withdraw({"from": users[1]})
+    assert chain.height == height
+    assert indexer.sync() == 2
+    assert [e["provider"] for e in indexer.events("Withdraw")] == [users[1]]
+    assert [e["supply"] for e in indexer.events("Supply")][-1] == 4 * 10**18
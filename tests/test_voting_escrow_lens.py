@@ -0,0 +1,192 @@
+import brownie
+
+
+def test_explain_claim(chain, accounts, token, voting_escrow, voting_escrow_lens):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    users = accounts[1:4]
+    reward_amount = 10**18
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for i, user in enumerate(users):
+        token.transfer(user, 10**18 * (i + 1))
+        token.approve(voting_escrow, 10**18 * (i + 1), {"from": user})
+        voting_escrow.create_lock(10**18 * (i + 1), chain.time() + (i + 2) * 3 * EPOCH_SECONDS, {"from": user})
+        chain.sleep(3600)
+    for day in range(7):
+        voting_escrow.receiveReward(token, reward_amount, {"from": payer})
+        chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint({"from": payer})
+
+    total = 0
+    for user in users:
+        from_epoch = voting_escrow.user_token_claimed_epoch(user, token) + 1
+        items = voting_escrow_lens.explain_claim(user, token, from_epoch, 2**256 - 1)
+        assert [item["epoch"] for item in items] == list(range(from_epoch, voting_escrow.epoch()))
+        for item in items:
+            assert item["rewards"] == voting_escrow.epoch_token_rewards(item["epoch"], token)
+            assert item["user_area"] <= item["supply_area"]
+        amount = sum(item["amount"] for item in items)
+        claimable = voting_escrow.user_token_claimable_rewards(user, token)
+        assert 0 <= claimable - amount <= len(items)  # rounding of the claim is per user polyline piece
+
+        tx = voting_escrow.claim_rewards(token, {"from": user})
+        assert tx.events["UserRewardsClaimed"]["amount"] == claimable
+        assert set(tx.events.keys()) == {"Transfer", "UserRewardsClaimed", "RewardsClaimed"}  # no diagnostics in claims
+        total += amount
+    assert 7 * reward_amount - 100 <= total <= 7 * reward_amount
+
+    assert voting_escrow_lens.explain_claim(users[0], token, 5, 3) == []
+
+
+def test_bulk_views(chain, accounts, token, voting_escrow, voting_escrow_lens, ERC20CRV):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    users = accounts[1:5]  # the last one has no lock
+    token2 = ERC20CRV.deploy("Reward Token", "RWD", 18, {"from": payer})
+    tokens = [token, token2]
+
+    for t in tokens:
+        t.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for i, user in enumerate(users[:3]):
+        token.transfer(user, 10**18 * (i + 1))
+        token.approve(voting_escrow, 10**18 * (i + 1), {"from": user})
+        voting_escrow.create_lock(10**18 * (i + 1), chain.time() + (i + 2) * 10 * EPOCH_SECONDS, {"from": user})
+    for day in range(5):
+        voting_escrow.receiveReward(token, 10**18, {"from": payer})
+        chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint({"from": payer})
+
+    t = chain[-1].timestamp
+    assert voting_escrow_lens.balances_of(users, t) == [voting_escrow.balanceOf(user, t) for user in users]
+    for block in (chain.height, chain.height - 3, chain.height - 7):
+        assert voting_escrow_lens.balances_of_at(users, block) == [voting_escrow.balanceOfAt(user, block) for user in users]
+    assert voting_escrow_lens.locked_many(users) == [
+        tuple(voting_escrow.locked(user)) + (voting_escrow.user_point_epoch(user),) for user in users
+    ]
+    claimable = voting_escrow_lens.claimable_many(users, tokens)
+    assert claimable == [[voting_escrow.user_token_claimable_rewards(user, t) for t in tokens] for user in users]
+    assert claimable[0][0] > 0 and claimable[0][1] == 0 and claimable[3] == [0, 0]
+    assert voting_escrow.users_token_claimable_rewards(users, token) == [amounts[0] for amounts in claimable]
+
+
+def test_history_ranges(chain, accounts, token, voting_escrow, voting_escrow_lens):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    users = accounts[1:4]
+    t_start = chain.time()
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for i, user in enumerate(users):
+        token.transfer(user, 3 * 10**18)
+        token.approve(voting_escrow, 3 * 10**18, {"from": user})
+        voting_escrow.create_lock(10**18, chain.time() + (i + 2) * 5 * EPOCH_SECONDS, {"from": user})
+        for k in range(2):
+            chain.sleep(EPOCH_SECONDS)
+            voting_escrow.increase_amount(10**18, {"from": user})
+    for day in range(20):
+        voting_escrow.receiveReward(token, 10**18, {"from": payer})
+        chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint({"from": payer})
+
+    epoch = voting_escrow.epoch()
+    points = [voting_escrow.point_history(i) for i in range(epoch + 1)]
+    assert voting_escrow_lens.point_history_range(0, epoch + 10) == points
+    assert voting_escrow_lens.point_history_range(3, 4) == points[3:7]
+    assert voting_escrow_lens.point_history_range(epoch + 1, 5) == []
+
+    user = users[1]
+    user_points = [voting_escrow.user_point_history(user, i) for i in range(voting_escrow.user_point_epoch(user) + 1)]
+    assert voting_escrow_lens.user_point_history_range(user, 0, 100) == user_points
+    assert voting_escrow_lens.user_point_history_range(user, 2, 1) == user_points[2:3]
+
+    schedule = []
+    key = voting_escrow.next_slope_change(t_start)
+    while key != 0:
+        schedule.append((key, voting_escrow.slope_changes(key)))
+        key = voting_escrow.next_slope_change(key)
+    assert len(schedule) == len(users)
+    assert voting_escrow_lens.slope_changes_range(t_start, 2**64) == schedule
+    assert voting_escrow_lens.slope_changes_range(schedule[0][0], schedule[1][0]) == schedule[1:2]
+
+
+def test_average_total_supply(chain, accounts, token, voting_escrow, voting_escrow_lens):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    users = accounts[1:4]
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for i, user in enumerate(users):
+        token.transfer(user, 10**18 * (i + 1))
+        token.approve(voting_escrow, 10**18 * (i + 1), {"from": user})
+        voting_escrow.create_lock(10**18 * (i + 1), chain.time() + (i + 1) * 7 * EPOCH_SECONDS, {"from": user})
+        chain.sleep(3600)
+    for day in range(10):
+        voting_escrow.receiveReward(token, 10**18, {"from": payer})
+        chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint({"from": payer})
+
+    epoch = voting_escrow.epoch()
+    ts = [voting_escrow.point_history(i)[2] for i in range(epoch + 1)]
+    for i in range(1, epoch):
+        assert voting_escrow.supply_area_cumulative(i + 1) == (
+            voting_escrow.supply_area_cumulative(i) + voting_escrow.epoch_supply_area(i)
+        )
+        if ts[i + 1] > ts[i]:
+            average = voting_escrow.epoch_supply_area(i) // (2 * (ts[i + 1] - ts[i]))
+            assert voting_escrow_lens.average_total_supply(ts[i], ts[i + 1]) == average
+    area = voting_escrow.supply_area_cumulative(epoch - 1) - voting_escrow.supply_area_cumulative(1)
+    assert voting_escrow_lens.average_total_supply(ts[1], ts[epoch - 1]) == area // (2 * (ts[epoch - 1] - ts[1]))
+
+    # ahead of the last point the supply is extrapolated through the slope changes
+    t0 = chain[-1].timestamp
+    t1 = t0 + 30 * EPOCH_SECONDS
+    times = [t0]
+    key = voting_escrow.next_slope_change(t0)
+    while key != 0 and key < t1:
+        times.append(key)
+        key = voting_escrow.next_slope_change(key)
+    times.append(t1)
+    area = sum(
+        (times[i + 1] - times[i]) * (voting_escrow.totalSupply(times[i]) + voting_escrow.totalSupply(times[i + 1]))
+        for i in range(len(times) - 1)
+    )
+    assert abs(voting_escrow_lens.average_total_supply(t0, t1) - area // (2 * (t1 - t0))) <= 1
+
+    with brownie.reverts("empty interval"):
+        voting_escrow_lens.average_total_supply(t0, t0)
+
+
+def test_average_balance(chain, accounts, token, voting_escrow, voting_escrow_lens):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    user = accounts[1]
+    token.transfer(user, 6 * 10**18)
+    token.approve(voting_escrow, 6 * 10**18, {"from": user})
+
+    t_start = chain.time()
+    voting_escrow.create_lock(10**18, t_start + 14 * EPOCH_SECONDS, {"from": user})
+    for day in range(5):
+        chain.sleep(EPOCH_SECONDS)
+        voting_escrow.increase_amount(10**18, {"from": user})
+    chain.sleep(20 * EPOCH_SECONDS)  # past the lock end
+    voting_escrow.withdraw({"from": user})
+    chain.mine()
+
+    # the balance is linear between the user points and stops at the lock end
+    points = [voting_escrow.user_point_history(user, i) for i in range(voting_escrow.user_point_epoch(user) + 1)]
+    area = 0
+    for i in range(1, len(points)):
+        bias, slope, ts, _ = points[i - 1]
+        dt = points[i][2] - ts
+        if slope > 0:
+            dt = min(dt, bias // slope)
+        area += dt * (2 * bias - slope * dt)
+        assert voting_escrow.user_area_cumulative(user, i) == area
+
+    t0 = points[1][2]
+    t1 = chain[-1].timestamp
+    assert voting_escrow_lens.average_balance(user, t0, t1) == area // (2 * (t1 - t0))
+    assert voting_escrow_lens.average_balance(user, t1, t1 + EPOCH_SECONDS) == 0
+
+    with brownie.reverts("empty interval"):
+        voting_escrow_lens.average_balance(user, t0, t0)
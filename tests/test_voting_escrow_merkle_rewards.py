@@ -0,0 +1,59 @@
+import brownie
+
+from scripts.stats.ve_merkle import build_distribution, period_shares
+
+
+def test_merkle_rewards(chain, accounts, token, voting_escrow, voting_escrow_merkle_rewards):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    admin = accounts[0]
+    users = accounts[1:4]
+    reward_amount = 10**21
+    merkle = voting_escrow_merkle_rewards
+
+    for i, user in enumerate(users):
+        token.transfer(user, 10**18 * (i + 1))
+        token.approve(voting_escrow, 10**18 * (i + 1), {"from": user})
+        voting_escrow.create_lock(10**18 * (i + 1), chain.time() + (i + 2) * 10 * EPOCH_SECONDS, {"from": user})
+    t0 = chain.time()
+    chain.sleep(30 * EPOCH_SECONDS)
+    t1 = chain.time()
+    voting_escrow.checkpoint()
+
+    user_points = {
+        user.address: [voting_escrow.user_point_history(user, i)[:3] for i in range(voting_escrow.user_point_epoch(user) + 1)]
+        for user in users
+    }
+    shares = period_shares(user_points, t0, t1, reward_amount)
+    assert reward_amount - len(users) <= sum(shares.values()) <= reward_amount
+    root, claims = build_distribution(shares)
+
+    token.approve(merkle, reward_amount, {"from": admin})
+    with brownie.reverts("not admin"):
+        merkle.post_root(token, root, reward_amount, {"from": users[0]})
+    period = merkle.post_root(token, root, reward_amount, {"from": admin}).return_value
+
+    claim = claims[users[1].address]
+    with brownie.reverts("invalid proof"):
+        merkle.claim(period, claim["index"], users[1], claim["amount"] + 1, claim["proof"], {"from": users[1]})
+    with brownie.reverts("invalid proof"):  # the same leaf at an aliased index
+        merkle.claim(period, claim["index"] + 4, users[1], claim["amount"], claim["proof"], {"from": users[1]})
+
+    # anyone may claim for the user
+    tx = merkle.claim(period, claim["index"], users[1], claim["amount"], claim["proof"], {"from": admin})
+    assert tx.events["Claimed"]["amount"] == claim["amount"]
+    assert token.balanceOf(users[1]) == claim["amount"]
+    assert merkle.is_claimed(period, claim["index"])
+    with brownie.reverts("already claimed"):
+        merkle.claim(period, claim["index"], users[1], claim["amount"], claim["proof"], {"from": users[1]})
+
+    others = [users[0].address, users[2].address]
+    merkle.claim_many(
+        [(period, claims[u]["index"], u, claims[u]["amount"], claims[u]["proof"]) for u in others], {"from": admin}
+    )
+    assert merkle.period_claimed(period) == sum(shares.values())
+
+    balance = token.balanceOf(admin)
+    merkle.cancel_period(period, admin, {"from": admin})
+    assert token.balanceOf(admin) - balance == reward_amount - sum(shares.values())
+    with brownie.reverts("no root"):
+        merkle.claim(period, claim["index"], users[1], claim["amount"], claim["proof"], {"from": users[1]})
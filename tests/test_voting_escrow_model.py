@@ -0,0 +1,129 @@
+import random
+
+import pytest
+from brownie.exceptions import VirtualMachineError
+
+from scripts.stats.ve_model import Revert, VotingEscrowModel
+
+
+def _apply(chain, contract_call, model_call):
+    """Run the same operation on the contract and on the model, both must revert or succeed"""
+    try:
+        tx = contract_call()
+    except VirtualMachineError:
+        with pytest.raises(Revert):
+            model_call(chain.time(), chain.height + 1)
+        return None
+    return tx, model_call(tx.timestamp, tx.block_number)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_model_matches_contract(chain, accounts, token, voting_escrow, ERC20CRV, seed):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    users = accounts[1:4]
+    token2 = ERC20CRV.deploy("Reward Token", "RWD", 18, {"from": payer})
+    tokens = [token, token2]
+    random.seed(seed)
+
+    _, _, ts, blk = voting_escrow.point_history(0)
+    model = VotingEscrowModel(ts, blk, voting_escrow.max_pool_members(), voting_escrow.min_stake_amount())
+    for t in tokens:
+        t.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for user in users:
+        token.transfer(user, 10**24)
+        token.approve(voting_escrow, 2**256 - 1, {"from": user})
+
+    for step in range(150):
+        chain.sleep(random.choice([0, 600, 3600, 6 * 3600, EPOCH_SECONDS, 3 * EPOCH_SECONDS, 20 * EPOCH_SECONDS]))
+        user = random.choice(users)
+        amount = random.randint(10**18, 10**21)
+        t = random.choice(tokens)
+        op = random.random()
+        if op < 0.15:
+            unlock_time = chain.time() + random.randint(0, 400) * EPOCH_SECONDS
+            _apply(
+                chain,
+                lambda: voting_escrow.create_lock(amount, unlock_time, {"from": user}),
+                lambda ts, blk: model.create_lock(user, amount, unlock_time, ts, blk),
+            )
+        elif op < 0.3:
+            _apply(
+                chain,
+                lambda: voting_escrow.increase_amount(amount, {"from": user}),
+                lambda ts, blk: model.increase_amount(user, amount, ts, blk),
+            )
+        elif op < 0.4:
+            unlock_time = chain.time() + random.randint(0, 500) * EPOCH_SECONDS
+            _apply(
+                chain,
+                lambda: voting_escrow.increase_unlock_time(unlock_time, {"from": user}),
+                lambda ts, blk: model.increase_unlock_time(user, unlock_time, ts, blk),
+            )
+        elif op < 0.5:
+            _apply(
+                chain,
+                lambda: voting_escrow.withdraw({"from": user}),
+                lambda ts, blk: model.withdraw(user, ts, blk),
+            )
+        elif op < 0.6:
+            _apply(
+                chain,
+                lambda: voting_escrow.receiveReward(t, amount, {"from": payer}),
+                lambda ts, blk: model.receive_reward(t, amount, ts, blk),
+            )
+        elif op < 0.65:
+            duration = random.choice([0, 3600, EPOCH_SECONDS, 7 * EPOCH_SECONDS])
+            _apply(
+                chain,
+                lambda: voting_escrow.receiveRewardStream(t, amount, duration, {"from": payer}),
+                lambda ts, blk: model.receive_reward_stream(t, amount, duration, ts, blk),
+            )
+        elif op < 0.7:
+            _apply(
+                chain,
+                lambda: voting_escrow.checkpoint({"from": payer}),
+                lambda ts, blk: model.checkpoint(ts, blk),
+            )
+        elif op < 0.8:
+            max_days = random.choice([0, 1, 5, 300])
+            _apply(
+                chain,
+                lambda: voting_escrow.checkpoint_up_to(max_days, {"from": payer}),
+                lambda ts, blk: model.checkpoint_up_to(max_days, ts, blk),
+            )
+        else:
+            assert voting_escrow.user_token_claimable_rewards(user, t) == model.claimable_rewards(user, t)
+            result = _apply(
+                chain,
+                lambda: voting_escrow.claim_rewards(t, {"from": user}),
+                lambda ts, blk: model.claim_rewards(user, [t]),
+            )
+            if result is not None:
+                tx, amounts = result
+                assert tx.events["UserRewardsClaimed"]["amount"] == amounts[0]
+
+    assert voting_escrow.epoch() == model.epoch
+    for _epoch in range(model.epoch + 1):
+        point = model.point_history[_epoch]
+        assert voting_escrow.point_history(_epoch) == (point.bias, point.slope, point.ts, point.blk)
+        assert voting_escrow.epoch_supply_area(_epoch) == model.epoch_supply_area[_epoch]
+        assert voting_escrow.supply_area_cumulative(_epoch) == model.supply_area_cumulative[_epoch]
+    for user in users:
+        assert voting_escrow.user_point_epoch(user) == model.user_point_epoch[user]
+        for user_epoch in range(model.user_point_epoch[user] + 1):
+            point = model.user_point_history[user][user_epoch]
+            assert voting_escrow.user_point_history(user, user_epoch) == (point.bias, point.slope, point.ts, point.blk)
+            assert voting_escrow.user_area_cumulative(user, user_epoch) == model.user_area_cumulative[user, user_epoch]
+        for t in tokens:
+            assert voting_escrow.user_token_claimable_rewards(user, t) == model.claimable_rewards(user, t)
+    key = model.next_slope_change(model.point_history[0].ts)
+    while key != 0:
+        assert voting_escrow.slope_changes(key) == model.slope_changes[key]
+        assert voting_escrow.next_slope_change(key) == model.next_slope_change(key)
+        key = model.next_slope_change(key)
+    for t in tokens:
+        stream = model.token_reward_stream[t]
+        assert voting_escrow.token_reward_stream(t) == (stream.rate, stream.finish, stream.updated)
+    t = chain[-1].timestamp
+    assert voting_escrow.totalSupply(t) == model.total_supply(t)
@@ -0,0 +1,42 @@
+import pytest
+from brownie import web3
+
+from scripts.stats.multicall import BatchReader
+
+
+@pytest.fixture(params=["multicall", "json_rpc_batch"])
+def reader(request, multicall):
+    yield BatchReader(web3, multicall if request.param == "multicall" else None, chunk_size=100)
+
+
+def test_batch_read(chain, accounts, token, voting_escrow, reader):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    users = accounts[1:4]
+    for i, user in enumerate(users):
+        token.transfer(user, 10**18 * (i + 1))
+        token.approve(voting_escrow, 10**18 * (i + 1), {"from": user})
+        voting_escrow.create_lock(10**18 * (i + 1), chain.time() + (i + 2) * EPOCH_SECONDS, {"from": user})
+        chain.sleep(EPOCH_SECONDS // 3)
+    voting_escrow.checkpoint()
+    block = chain.height
+
+    calls = [(voting_escrow.point_history, i) for i in range(voting_escrow.epoch() + 1)]
+    calls += [(voting_escrow.locked, user) for user in users]
+    calls += [(voting_escrow.balanceOfAt, user, block - i) for user in users for i in range(3)]
+    calls += [(voting_escrow.totalSupplyAt, block - i) for i in range(3)]
+    calls = (calls * 150)[:150]
+    assert reader.read(calls, block) == [method(*args) for method, *args in calls]
+    assert reader.round_trips == 2  # 150 reads in chunks of 100
+
+    # later blocks do not change the reads at `block`
+    chain.sleep(EPOCH_SECONDS)
+    voting_escrow.withdraw({"from": users[0]})
+    assert reader.read([(voting_escrow.locked, users[0])], block)[0][0] == 10**18
+    assert reader.read([(voting_escrow.locked, users[0])])[0][0] == 0
+
+
+def test_batch_read_failure(accounts, token, reader):
+    calls = [(token.balanceOf, accounts[0]), (token.transferFrom, accounts[1], accounts[2], 10**18)]
+    assert reader.read(calls, allow_failure=True) == [token.balanceOf(accounts[0]), None]
+    with pytest.raises(ValueError):
+        reader.read(calls)
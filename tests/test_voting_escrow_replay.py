@@ -0,0 +1,46 @@
+from brownie import VotingEscrow, web3
+
+from scripts.stats.ve_indexer import VotingEscrowIndexer
+from scripts.stats.ve_replay import cross_check, replay, reward_shares
+
+
+def test_replay(chain, accounts, token, voting_escrow, tmp_path):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    users = accounts[1:4]
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for i, user in enumerate(users):
+        token.transfer(user, 10**19)
+        token.approve(voting_escrow, 10**19, {"from": user})
+        voting_escrow.create_lock(10**18 * (i + 1), chain.time() + (i + 2) * 5 * EPOCH_SECONDS, {"from": user})
+    for day in range(12):
+        voting_escrow.receiveReward(token, 10**18, {"from": payer})
+        if day == 3:
+            voting_escrow.increase_amount(10**18, {"from": users[0]})
+        if day == 5:
+            voting_escrow.increase_unlock_time(chain.time() + 40 * EPOCH_SECONDS, {"from": users[1]})
+        if day == 8:
+            voting_escrow.claim_rewards(token, {"from": users[2]})
+        chain.sleep(EPOCH_SECONDS)
+    chain.sleep(30 * EPOCH_SECONDS)
+    voting_escrow.withdraw({"from": users[0]})
+    voting_escrow.claim_rewards_for(users, token, {"from": payer})
+
+    indexer = VotingEscrowIndexer(
+        web3, voting_escrow.address, VotingEscrow.abi, tmp_path / "ve_index.db", start_block=voting_escrow.tx.block_number
+    )
+    indexer.sync()
+    model, mismatches = replay(indexer)
+    assert mismatches == []  # every claim is replayed with the amount of its log
+    assert model.epoch == voting_escrow.epoch()
+    for i in range(model.epoch + 1):
+        point = model.point_history[i]
+        assert voting_escrow.point_history(i) == (point.bias, point.slope, point.ts, point.blk)
+    assert cross_check(model, voting_escrow, chain[-1].timestamp, chain.height, 20) == []
+
+    for epoch in range(1, model.epoch):
+        rewards = voting_escrow.epoch_token_rewards(epoch, token)
+        shares = reward_shares(model, token.address, epoch)
+        if shares:
+            assert rewards - len(shares) <= int(sum(shares.values())) <= rewards
@@ -1,6 +1,7 @@
 import time
 
 import brownie
+from brownie_tokens import ERC20
 
 from .utils import *
 
@@ -41,8 +42,78 @@ def test_receive_rewards(web3, chain, accounts, token, voting_escrow):
     voting_escrow.checkpoint({"from": payer})
     token.approve(voting_escrow, reward_amount)
     voting_escrow.receiveReward(token, reward_amount, {"from": payer})
-    assert voting_escrow.epoch() == 12
-    assert voting_escrow.epoch_token_rewards(12, token) == reward_amount
+    assert voting_escrow.epoch() == 3  # the end of the rewarded epoch 1 and now
+    assert voting_escrow.epoch_token_rewards(3, token) == reward_amount
+
+
+def test_epoch_supply_area(web3, chain, accounts, token, voting_escrow):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    user1 = accounts[1]
+    deposit = 10**18
+
+    token.transfer(user1, deposit)
+    token.approve(voting_escrow, deposit, {"from": user1})
+    voting_escrow.create_lock(deposit, chain.time() + 3 * EPOCH_SECONDS, {"from": user1})
+    epoch_after_lock = voting_escrow.epoch()
+
+    chain.sleep(5 * EPOCH_SECONDS)  # the lock expires inside the history
+    voting_escrow.checkpoint()
+
+    for _epoch in range(epoch_after_lock, voting_escrow.epoch()):
+        bias, slope, ts0, _ = voting_escrow.point_history(_epoch)
+        ts1 = voting_escrow.point_history(_epoch + 1)[2]
+        end_bias = bias - slope * (ts1 - ts0)
+        if end_bias < 0:
+            area = bias * (bias // slope)
+        else:
+            area = (ts1 - ts0) * (bias + end_bias)
+        assert voting_escrow.epoch_supply_area(_epoch) == area
+    assert voting_escrow.epoch_supply_area(epoch_after_lock) > 0
+    assert voting_escrow.epoch_supply_area(voting_escrow.epoch() - 1) == 0  # after the lock end
+    assert voting_escrow.epoch_supply_area(voting_escrow.epoch()) == 0  # still open
+
+
+def test_next_slope_change(web3, chain, accounts, token, voting_escrow):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    MAXTIME = voting_escrow.MAXTIME()
+    start = chain.time()
+    ends = [start + 7 * EPOCH_SECONDS, start + MAXTIME, start + 7 * EPOCH_SECONDS, start + 30 * EPOCH_SECONDS]
+
+    for user, end in zip(accounts[1:], ends):
+        token.transfer(user, 10**18)
+        token.approve(voting_escrow, 10**18, {"from": user})
+        voting_escrow.create_lock(10**18, end, {"from": user})
+    # user3 moves away from the last 30 days key, it must disappear
+    voting_escrow.increase_unlock_time(start + 60 * EPOCH_SECONDS, {"from": accounts[4]})
+
+    expected = sorted({end // EPOCH_SECONDS * EPOCH_SECONDS for end in ends[:3] + [start + 60 * EPOCH_SECONDS]})
+    keys = []
+    key = voting_escrow.next_slope_change(start)
+    while key != 0:
+        keys.append(key)
+        key = voting_escrow.next_slope_change(key)
+    assert keys == expected
+    assert voting_escrow.slope_changes((start + 30 * EPOCH_SECONDS) // EPOCH_SECONDS * EPOCH_SECONDS) == 0
+
+
+def test_next_slope_change_after_gap(web3, chain, accounts, token, voting_escrow):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    MAXTIME = voting_escrow.MAXTIME()
+    user1, user2 = accounts[1:3]
+    start = chain.time()
+
+    for user in (user1, user2):
+        token.transfer(user, 10**18)
+        token.approve(voting_escrow, 10**18, {"from": user})
+    voting_escrow.create_lock(10**18, start + 7 * EPOCH_SECONDS, {"from": user1})
+    # nothing scheduled for longer than MAXTIME: more bitmap words than a lock spans
+    chain.sleep(MAXTIME + 30 * EPOCH_SECONDS)
+    tx = voting_escrow.create_lock(10**18, chain.time() + MAXTIME, {"from": user2})
+
+    first = voting_escrow.next_slope_change(start)
+    assert first == (start + 7 * EPOCH_SECONDS) // EPOCH_SECONDS * EPOCH_SECONDS
+    assert voting_escrow.next_slope_change(first) == voting_escrow.locked__end(user2) > tx.timestamp
+    assert voting_escrow.next_slope_change(voting_escrow.locked__end(user2)) == 0
 
 
 def test_share_rewards_1user(web3, chain, accounts, token, voting_escrow):
@@ -90,10 +161,7 @@ def test_share_rewards_1user(web3, chain, accounts, token, voting_escrow):
 
     claimable = voting_escrow.user_token_claimable_rewards(user1, token)
     tx = voting_escrow.claim_rewards(token, {"from": user1})
-    print(f"{tx.events['_averageUserBlanaceOverEpochDebug']=}\n")
-    print(f"{tx.events['_averageUserBlanaceOverEpochDebugS']=}\n")
-    print(f"{tx.events['UserRewardsClaimedDebug']=}\n")
-    assert tx.events['UserRewardsClaimed']['amount'] == reward_amount
+    assert reward_amount - 1 <= tx.events['UserRewardsClaimed']['amount'] <= reward_amount  # rounded down
     assert tx.events['UserRewardsClaimed']['amount'] == claimable
     assert voting_escrow.user_token_claimed_epoch(user1, token) == 1
 
@@ -157,10 +225,7 @@ def test_share_rewards_1user_delay_after_initialization(web3, chain, accounts, t
 
     claimable = voting_escrow.user_token_claimable_rewards(user1, token)
     tx = voting_escrow.claim_rewards(token, {"from": user1})
-    print(f"{tx.events['_averageUserBlanaceOverEpochDebug']=}\n")
-    print(f"{tx.events['_averageUserBlanaceOverEpochDebugS']=}\n")
-    print(f"{tx.events['UserRewardsClaimedDebug']=}\n")
-    assert tx.events['UserRewardsClaimed']['amount'] == reward_amount
+    assert reward_amount - 1 <= tx.events['UserRewardsClaimed']['amount'] <= reward_amount  # rounded down
     assert tx.events['UserRewardsClaimed']['amount'] == claimable
     assert voting_escrow.user_token_claimed_epoch(user1, token) == 2
 
@@ -300,9 +365,6 @@ def test_share_rewards_2users_same_time_deposit(web3, chain, accounts, token, vo
 
     print(f'start claim user2')
     tx = voting_escrow.claim_rewards(token, {"from": user2})
-    print(f"{tx.events['_averageUserBlanaceOverEpochDebug']=}\n")
-    print(f"{tx.events['_averageUserBlanaceOverEpochDebugS']=}\n")
-    print(f"{tx.events['UserRewardsClaimedDebug']=}\n")
     assert tx.events['UserRewardsClaimed']['amount'] // 1000 == reward_amount * user2_share // 1000
     assert voting_escrow.user_token_claimed_epoch(user2, token) == 3
 
@@ -434,17 +496,11 @@ def test_share_rewards_2users_3h_deposit(web3, chain, accounts, token, voting_es
 
     pretty_events(chain, tx.txid)
 
-    # print(f"{tx.events['_averageUserBlanaceOverEpochDebug']=}\n")
-    # print(f"{tx.events['_averageUserBlanaceOverEpochDebugS']=}\n")
-    # print(f"{tx.events['UserRewardsClaimedDebug']=}\n")
     assert tx.events['UserRewardsClaimed']['amount'] // 1000 == int(reward_amount * user1_share)  // 1000
     assert voting_escrow.user_token_claimed_epoch(user1, token) == 4
 
     print(f'start claim user2')
     tx = voting_escrow.claim_rewards(token, {"from": user2})
-    print(f"{tx.events['_averageUserBlanaceOverEpochDebug']=}\n")
-    print(f"{tx.events['_averageUserBlanaceOverEpochDebugS']=}\n")
-    print(f"{tx.events['UserRewardsClaimedDebug']=}\n")
     assert tx.events['UserRewardsClaimed']['amount'] // 1000 == reward_amount * user2_share // 1000
     assert voting_escrow.user_token_claimed_epoch(user2, token) == 4
 
@@ -492,7 +548,7 @@ def test_share_1user_lock1year_after_10epochs_checkpoint(web3, chain, accounts,
     tx2 = voting_escrow.checkpoint()
 
     epoch_after = voting_escrow.epoch()
-    assert epoch_after == 12
+    assert epoch_after == 2  # the empty days are not recorded
 
     # number perfect user 1
     assert voting_escrow.locked(user1)[0] == user1_deposit_amount
@@ -556,7 +612,7 @@ def test_share_1user_lock3epochs_after_10epochs_checkpoint(web3, chain, accounts
     tx2 = voting_escrow.checkpoint()
 
     epoch_after = voting_escrow.epoch()
-    assert epoch_after == 12
+    assert epoch_after == 3  # only the day the lock ends is recorded
 
     # number perfect general state
     assert voting_escrow.point_history(epoch_after)[0] == 0
@@ -612,7 +668,7 @@ def test_share_rewards_2users_lock100epochs_10epochs_deposit(web3, chain, accoun
     token.approve(voting_escrow, user2_deposit_amount, {"from": user2})
     tx_lock_user2 = voting_escrow.create_lock(user2_deposit_amount, user2_deposit_till, {"from": user2})
     epoch_after_user2_lock = voting_escrow.epoch()
-    assert epoch_after_user2_lock == 12
+    assert epoch_after_user2_lock == 2  # the empty days are not recorded
     user2_deposit_at = tx_lock_user2.timestamp
 
     # number perfect user 1
@@ -646,17 +702,17 @@ def test_share_rewards_2users_lock100epochs_10epochs_deposit(web3, chain, accoun
 
     chain.sleep(sleep)
     voting_escrow.checkpoint()
-    assert voting_escrow.epoch() == 13
+    assert voting_escrow.epoch() == 3
 
     assert voting_escrow.epoch_token_rewards(2, token) == 0
     token.approve(voting_escrow, reward_amount)
     voting_escrow.receiveReward(token, reward_amount, {"from": payer})
-    assert voting_escrow.epoch() == 13
+    assert voting_escrow.epoch() == 3
     reward_epoch1 = voting_escrow.epoch()
 
     chain.sleep(sleep)
     voting_escrow.checkpoint()
-    assert voting_escrow.epoch() == 14
+    assert voting_escrow.epoch() == 4
 
 
     start_ts = voting_escrow.point_history(reward_epoch1)[2]
@@ -692,19 +748,13 @@ def test_share_rewards_2users_lock100epochs_10epochs_deposit(web3, chain, accoun
 
     pretty_events(chain, tx.txid)
 
-    # print(f"{tx.events['_averageUserBlanaceOverEpochDebug']=}\n")
-    # print(f"{tx.events['_averageUserBlanaceOverEpochDebugS']=}\n")
-    # print(f"{tx.events['UserRewardsClaimedDebug']=}\n")
     assert tx.events['UserRewardsClaimed']['amount'] // 1000 == int(reward_amount * user1_share)  // 1000
-    assert voting_escrow.user_token_claimed_epoch(user1, token) == 13
+    assert voting_escrow.user_token_claimed_epoch(user1, token) == 3
 
     print(f'start claim user2')
     tx = voting_escrow.claim_rewards(token, {"from": user2})
-    print(f"{tx.events['_averageUserBlanaceOverEpochDebug']=}\n")
-    print(f"{tx.events['_averageUserBlanaceOverEpochDebugS']=}\n")
-    print(f"{tx.events['UserRewardsClaimedDebug']=}\n")
     assert tx.events['UserRewardsClaimed']['amount'] // 1000 == reward_amount * user2_share // 1000
-    assert voting_escrow.user_token_claimed_epoch(user2, token) == 13
+    assert voting_escrow.user_token_claimed_epoch(user2, token) == 3
 
 
 def test_share_rewards_2users_lock3epochs_10epochs_deposit(web3, chain, accounts, token, voting_escrow):
@@ -754,7 +804,7 @@ def test_share_rewards_2users_lock3epochs_10epochs_deposit(web3, chain, accounts
     token.approve(voting_escrow, user2_deposit_amount, {"from": user2})
     tx_lock_user2 = voting_escrow.create_lock(user2_deposit_amount, user2_deposit_till, {"from": user2})
     epoch_after_user2_lock = voting_escrow.epoch()
-    assert epoch_after_user2_lock == 12
+    assert epoch_after_user2_lock == 3  # only the day the lock of user1 ends is recorded
     user2_deposit_at = tx_lock_user2.timestamp
 
     # number perfect user 1
@@ -792,17 +842,17 @@ def test_share_rewards_2users_lock3epochs_10epochs_deposit(web3, chain, accounts
 
     chain.sleep(sleep)
     voting_escrow.checkpoint()
-    assert voting_escrow.epoch() == 13
+    assert voting_escrow.epoch() == 4
 
     assert voting_escrow.epoch_token_rewards(2, token) == 0
     token.approve(voting_escrow, reward_amount)
     voting_escrow.receiveReward(token, reward_amount, {"from": payer})
-    assert voting_escrow.epoch() == 13
+    assert voting_escrow.epoch() == 4
     reward_epoch1 = voting_escrow.epoch()
 
     chain.sleep(sleep)
     voting_escrow.checkpoint()
-    assert voting_escrow.epoch() == 14
+    assert voting_escrow.epoch() == 5
 
 
     start_ts = voting_escrow.point_history(reward_epoch1)[2]
@@ -838,19 +888,43 @@ def test_share_rewards_2users_lock3epochs_10epochs_deposit(web3, chain, accounts
 
     pretty_events(chain, tx.txid)
 
-    # print(f"{tx.events['_averageUserBlanaceOverEpochDebug']=}\n")
-    # print(f"{tx.events['_averageUserBlanaceOverEpochDebugS']=}\n")
-    # print(f"{tx.events['UserRewardsClaimedDebug']=}\n")
     assert tx.events['UserRewardsClaimed']['amount'] // 1000 == int(reward_amount * user1_share)  // 1000
-    assert voting_escrow.user_token_claimed_epoch(user1, token) == 13
+    assert voting_escrow.user_token_claimed_epoch(user1, token) == 4
 
     print(f'start claim user2')
     tx = voting_escrow.claim_rewards(token, {"from": user2})
-    print(f"{tx.events['_averageUserBlanaceOverEpochDebug']=}\n")
-    print(f"{tx.events['_averageUserBlanaceOverEpochDebugS']=}\n")
-    print(f"{tx.events['UserRewardsClaimedDebug']=}\n")
     assert tx.events['UserRewardsClaimed']['amount'] // 1000 == reward_amount * user2_share // 1000
-    assert voting_escrow.user_token_claimed_epoch(user2, token) == 13
+    assert voting_escrow.user_token_claimed_epoch(user2, token) == 4
+
+
+def test_share_rewards_6_decimals(web3, chain, accounts, token, voting_escrow):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    users = accounts[1:4]
+    usdc = ERC20("USD Coin", "USDC", 6)
+    reward_amount = 10_000 * 10**6
+    deposit = 1_000_000 * 10**18
+
+    for user in users:
+        token.transfer(user, deposit)
+        token.approve(voting_escrow, deposit, {"from": user})
+        voting_escrow.create_lock(deposit, chain.time() + voting_escrow.MAXTIME(), {"from": user})
+    usdc._mint_for_testing(payer, reward_amount)
+    usdc.approve(voting_escrow, reward_amount, {"from": payer})
+    voting_escrow.receiveReward(usdc, reward_amount, {"from": payer})
+    rewarded_epoch = voting_escrow.epoch()
+    chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint()
+
+    # reward * 1e18 / area would round the rate down to 0
+    assert voting_escrow.epoch_supply_area(rewarded_epoch) > reward_amount * 10**18
+    claimed = []
+    for user in users:
+        tx = voting_escrow.claim_rewards(usdc, {"from": user})
+        claimed.append(tx.events["UserRewardsClaimed"]["amount"])
+        assert usdc.balanceOf(user) == claimed[-1]
+        assert claimed[-1] > reward_amount // 3 * 0.999  # the locks are a few seconds apart
+    assert reward_amount - len(users) <= sum(claimed) <= reward_amount  # a wei per user rounded down
 
 
 # def test_share_rewards_3users_after_12_months(web3, chain, accounts, token, voting_escrow):
@@ -948,3 +1022,323 @@ def test_share_rewards_2users_lock3epochs_10epochs_deposit(web3, chain, accounts
 #         tx = voting_escrow.claim_rewards(token, {"from": user3})
 #         acc3 += tx.events['UserRewardsClaimed']['amount']
 #     eq(acc3, acc_fee * 3 / 6)
+
+
+def test_claim_rewards_many(web3, chain, accounts, token, voting_escrow, ERC20CRV):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    user1 = accounts[1]
+    user2 = accounts[2]
+    reward_amount = 10**18
+    deposit = 10**18
+    token2 = ERC20CRV.deploy("Reward Token", "RWD", 18, {"from": payer})
+    tokens = [token, token2]
+
+    for t in tokens:
+        t.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for user, till in [(user1, 100), (user2, 30)]:
+        token.transfer(user, deposit)
+        token.approve(voting_escrow, deposit, {"from": user})
+        voting_escrow.create_lock(deposit, chain.time() + till * EPOCH_SECONDS, {"from": user})
+
+    for i in range(5):
+        for t in tokens:
+            voting_escrow.receiveReward(t, reward_amount, {"from": payer})
+        chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint()
+
+    claimable = [voting_escrow.user_token_claimable_rewards(user1, t) for t in tokens]
+    assert claimable[0] > 0
+    assert claimable[0] == claimable[1]
+
+    with brownie.reverts("duplicate token"):
+        voting_escrow.claim_rewards_many([token2, token2], {"from": user1})
+
+    tx = voting_escrow.claim_rewards_many(tokens, {"from": user1})
+    assert [e['amount'] for e in tx.events['UserRewardsClaimed']] == claimable
+    for t in tokens:
+        assert voting_escrow.user_token_claimed_epoch(user1, t) == voting_escrow.epoch() - 1
+        assert voting_escrow.user_token_claimable_rewards(user1, t) == 0
+
+    # the same as separate claims
+    tx = voting_escrow.claim_rewards(token2, {"from": user2})
+    tx_many = voting_escrow.claim_rewards_many([token], {"from": user2})
+    assert tx.events['UserRewardsClaimed']['amount'] == tx_many.events['UserRewardsClaimed']['amount']
+
+
+def test_claim_rewards_max_epochs(web3, chain, accounts, token, voting_escrow):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    user1 = accounts[1]
+    user2 = accounts[2]
+    reward_amount = 10**18
+    deposit = 10**18
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for user in (user1, user2):
+        token.transfer(user, deposit)
+        token.approve(voting_escrow, deposit, {"from": user})
+        voting_escrow.create_lock(deposit, chain.time() + 100 * EPOCH_SECONDS, {"from": user})
+
+    for i in range(10):
+        voting_escrow.receiveReward(token, reward_amount, {"from": payer})
+        chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint()
+
+    outstanding = voting_escrow.user_token_outstanding_epochs(user1, token)
+    assert outstanding == voting_escrow.epoch() - 1
+    claimable = voting_escrow.user_token_claimable_rewards(user1, token)
+
+    claimed = 0
+    while voting_escrow.user_token_outstanding_epochs(user1, token) > 0:
+        claimed_epoch = voting_escrow.user_token_claimed_epoch(user1, token)
+        tx = voting_escrow.claim_rewards(token, 3, {"from": user1})
+        assert voting_escrow.user_token_claimed_epoch(user1, token) == min(claimed_epoch + 3, voting_escrow.epoch() - 1)
+        claimed += tx.events['UserRewardsClaimed']['amount']
+        outstanding -= min(outstanding, 3)
+        assert voting_escrow.user_token_outstanding_epochs(user1, token) == outstanding
+
+    assert claimable - 100 <= claimed <= claimable  # rounding dust per chunk
+    assert voting_escrow.user_token_claimable_rewards(user1, token) == 0
+
+
+def test_claim_rewards_same_block_checkpoints(web3, chain, accounts, token, voting_escrow, DepositForMany):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    user1 = accounts[1]
+    griefer = accounts[2]
+    reward_amount = 10**18
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    token.transfer(user1, 300 * 10**18)
+    token.approve(voting_escrow, 2**256 - 1, {"from": user1})
+    voting_escrow.create_lock(10**18, chain.time() + 100 * EPOCH_SECONDS, {"from": user1})
+    voting_escrow.receiveReward(token, reward_amount, {"from": payer})
+    chain.sleep(EPOCH_SECONDS)
+
+    # anyone can deposit for user1 from its allowance: more user points at one time than a claim walks
+    many = DepositForMany.deploy({"from": griefer})
+    tx = many.deposit_for_many(voting_escrow, user1, 10**18, 257, {"from": griefer})
+    assert voting_escrow.user_point_epoch(user1) == 258
+    assert voting_escrow.user_point_history(user1, 2)[2] == voting_escrow.user_point_history(user1, 258)[2] == tx.timestamp
+    voting_escrow.receiveReward(token, reward_amount, {"from": payer})
+    chain.sleep(EPOCH_SECONDS)
+    voting_escrow.receiveReward(token, reward_amount, {"from": payer})
+    chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint()
+
+    claimable = voting_escrow.user_token_claimable_rewards(user1, token)
+    assert 3 * reward_amount - 3 <= claimable <= 3 * reward_amount  # the only locker
+    tx = voting_escrow.claim_rewards(token, 1, {"from": user1})
+    claimed = tx.events['UserRewardsClaimed']['amount']
+    assert voting_escrow.user_token_claimed_epoch(user1, token) == 1
+    tx = voting_escrow.claim_rewards(token, {"from": user1})
+    claimed += tx.events['UserRewardsClaimed']['amount']
+    assert claimable - 1 <= claimed <= claimable
+    assert voting_escrow.user_token_claimable_rewards(user1, token) == 0
+
+
+def test_rewards_then_checkpoint_same_time(web3, chain, accounts, token, voting_escrow, DepositForMany):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    user1 = accounts[1]
+    user2 = accounts[2]
+    reward_amount = 10**18
+
+    for user in (user1, user2):
+        token.transfer(user, 10 * 10**18)
+        token.approve(voting_escrow, 2**256 - 1, {"from": user})
+        voting_escrow.create_lock(10**18, chain.time() + 100 * EPOCH_SECONDS, {"from": user})
+    chain.sleep(EPOCH_SECONDS)
+
+    # the epoch recorded by the deposit has zero length, the rewards go on to be
+    # shared over the day after it, when user1 has twice the balance of user2
+    many = DepositForMany.deploy({"from": payer})
+    token.transfer(many, reward_amount, {"from": payer})
+    tx = many.receive_reward_and_deposit_for(voting_escrow, token, reward_amount, user1, 10**18, {"from": payer})
+    rewarded_epoch = voting_escrow.token_last_rewarded_epoch(token)
+    assert voting_escrow.epoch() == rewarded_epoch + 1
+    assert voting_escrow.point_history(rewarded_epoch)[2] == voting_escrow.point_history(rewarded_epoch + 1)[2] == tx.timestamp
+    chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint()
+
+    claimable1 = voting_escrow.user_token_claimable_rewards(user1, token)
+    claimable2 = voting_escrow.user_token_claimable_rewards(user2, token)
+    assert reward_amount - 10 <= claimable1 + claimable2 <= reward_amount
+    assert abs(claimable1 - 2 * claimable2) <= 10**9  # rounding of the slopes
+
+
+def test_claim_rewards_walk_limit(web3, chain, accounts, token, voting_escrow):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    user1 = accounts[1]
+    reward_amount = 10**18
+    days = 11
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    token.transfer(user1, 300 * 10**18)
+    token.approve(voting_escrow, 2**256 - 1, {"from": user1})
+    voting_escrow.create_lock(10**18, chain.time() + 100 * EPOCH_SECONDS, {"from": user1})
+    for day in range(days):
+        voting_escrow.receiveReward(token, reward_amount, {"from": payer})
+        for hour in range(24):  # more distinct times of user points than a claim walks
+            voting_escrow.deposit_for(user1, 10**18, {"from": user1})
+            chain.sleep(EPOCH_SECONDS // 24)
+    voting_escrow.checkpoint()
+    assert voting_escrow.user_point_epoch(user1) > 256
+
+    # the first claim stops at the walk limit and the second one goes on from there
+    tx = voting_escrow.claim_rewards(token, {"from": user1})
+    claimed = tx.events['UserRewardsClaimed']['amount']
+    assert 0 < voting_escrow.user_token_claimed_epoch(user1, token) < voting_escrow.epoch() - 1
+    assert 0 < voting_escrow.user_token_epoch_cursor(user1, token) <= 257
+    tx = voting_escrow.claim_rewards(token, {"from": user1})
+    claimed += tx.events['UserRewardsClaimed']['amount']
+    assert voting_escrow.user_token_outstanding_epochs(user1, token) == 0
+    assert days * reward_amount - 10 <= claimed <= days * reward_amount  # the only locker
+
+
+def test_claim_rewards_for(web3, chain, accounts, token, voting_escrow):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    keeper = accounts[4]
+    users = accounts[1:4]
+    reward_amount = 10**18
+    deposit = 10**18
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for i, user in enumerate(users):
+        token.transfer(user, deposit)
+        token.approve(voting_escrow, deposit, {"from": user})
+        voting_escrow.create_lock(deposit, chain.time() + (i + 1) * 30 * EPOCH_SECONDS, {"from": user})
+
+    for i in range(5):
+        voting_escrow.receiveReward(token, reward_amount, {"from": payer})
+        chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint()
+
+    claimable = [voting_escrow.user_token_claimable_rewards(user, token) for user in users]
+    balances = [token.balanceOf(user) for user in users]
+    keeper_balance = token.balanceOf(keeper)
+
+    tx = voting_escrow.claim_rewards_for(users, token, {"from": keeper})
+
+    assert [e['amount'] for e in tx.events['UserRewardsClaimed']] == claimable
+    assert [(e['user'], e['amount']) for e in tx.events['RewardsClaimed']] == list(zip(users, claimable))
+    for user, balance, amount in zip(users, balances, claimable):
+        assert token.balanceOf(user) == balance + amount
+        assert voting_escrow.user_token_claimed_epoch(user, token) == voting_escrow.epoch() - 1
+    assert token.balanceOf(keeper) == keeper_balance
+
+
+def test_claim_rewards_for_max_epochs(web3, chain, accounts, token, voting_escrow):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    keeper = accounts[4]
+    users = accounts[1:4]
+    reward_amount = 10**18
+    deposit = 10**18
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for i, user in enumerate(users):
+        token.transfer(user, deposit)
+        token.approve(voting_escrow, deposit, {"from": user})
+        voting_escrow.create_lock(deposit, chain.time() + (i + 1) * 30 * EPOCH_SECONDS, {"from": user})
+
+    for i in range(3):
+        voting_escrow.receiveReward(token, reward_amount, {"from": payer})
+        chain.sleep(EPOCH_SECONDS)
+    voting_escrow.claim_rewards(token, {"from": users[0]})
+    for i in range(3):
+        voting_escrow.receiveReward(token, reward_amount, {"from": payer})
+        chain.sleep(EPOCH_SECONDS)
+    voting_escrow.checkpoint()
+
+    claimable = [voting_escrow.user_token_claimable_rewards(user, token) for user in users]
+    claimed_epochs = [voting_escrow.user_token_claimed_epoch(user, token) for user in users]
+    assert claimed_epochs[0] > claimed_epochs[1] == claimed_epochs[2]
+
+    # every user gets its own window of at most 2 epochs
+    tx = voting_escrow.claim_rewards_for(users, token, 2, {"from": keeper})
+    claimed = [e['amount'] for e in tx.events['UserRewardsClaimed']]
+    for user, claimed_epoch in zip(users, claimed_epochs):
+        assert voting_escrow.user_token_claimed_epoch(user, token) == claimed_epoch + 2
+
+    tx = voting_escrow.claim_rewards_for(users, token, {"from": keeper})
+    for i, e in enumerate(tx.events['UserRewardsClaimed']):
+        claimed[i] += e['amount']
+        assert voting_escrow.user_token_claimed_epoch(users[i], token) == voting_escrow.epoch() - 1
+    for amount, total in zip(claimable, claimed):
+        assert amount - 1 <= total <= amount  # rounded down in every chunk
+
+
+def test_reward_stream(web3, chain, accounts, token, voting_escrow):
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    user1 = accounts[1]
+    user2 = accounts[2]
+    stream_amount = 7 * 10**18
+    deposit = 10**18
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for user in (user1, user2):
+        token.transfer(user, deposit)
+        token.approve(voting_escrow, deposit, {"from": user})
+        voting_escrow.create_lock(deposit, chain.time() + 100 * EPOCH_SECONDS, {"from": user})
+
+    with brownie.reverts("zero duration"):
+        voting_escrow.receiveRewardStream(token, stream_amount, 0, {"from": payer})
+    tx = voting_escrow.receiveRewardStream(token, stream_amount, 7 * EPOCH_SECONDS, {"from": payer})
+    rate, finish, updated = voting_escrow.token_reward_stream(token)
+    assert rate == stream_amount * 10**18 // (7 * EPOCH_SECONDS)
+    assert finish == tx.timestamp + 7 * EPOCH_SECONDS
+    assert updated == tx.timestamp
+
+    # a top up can't slow the stream down
+    with brownie.reverts("stream rate decrease"):
+        voting_escrow.receiveRewardStream(token, 1, 30 * EPOCH_SECONDS, {"from": payer})
+
+    for i in range(10):
+        chain.sleep(EPOCH_SECONDS)
+        voting_escrow.checkpoint_reward_stream(token, {"from": payer})
+    assert voting_escrow.token_reward_stream(token)[2] == finish
+    voting_escrow.checkpoint()
+
+    claimed = 0
+    for user in (user1, user2):
+        tx = voting_escrow.claim_rewards(token, {"from": user})
+        claimed += tx.events["UserRewardsClaimed"]["amount"]
+    assert stream_amount * (1 - 1e-10) <= claimed <= stream_amount  # rounding of the reward rate
+
+
+def test_reward_stream_late_lock(web3, chain, accounts, token, voting_escrow):
+    """
+    A lock made just before the stream is poked must not get the part
+    released before it
+    """
+    EPOCH_SECONDS = voting_escrow.EPOCH_SECONDS()
+    payer = accounts[0]
+    early = accounts[1]
+    late = accounts[2]
+
+    token.approve(voting_escrow, 2**256 - 1, {"from": payer})
+    for user, amount in ((early, 10**18), (late, 100 * 10**18)):
+        token.transfer(user, amount)
+        token.approve(voting_escrow, amount, {"from": user})
+    voting_escrow.create_lock(10**18, chain.time() + 100 * EPOCH_SECONDS, {"from": early})
+    tx = voting_escrow.receiveRewardStream(token, 7 * 10**18, 7 * EPOCH_SECONDS, {"from": payer})
+    rate = voting_escrow.token_reward_stream(token)[0]
+
+    chain.sleep(3 * EPOCH_SECONDS)
+    tx_late = voting_escrow.create_lock(100 * 10**18, chain.time() + 100 * EPOCH_SECONDS, {"from": late})
+    chain.sleep(60)
+    voting_escrow.checkpoint_reward_stream(token, {"from": payer})
+    chain.sleep(EPOCH_SECONDS)
+    tx_end = voting_escrow.checkpoint()
+
+    released_before = (tx_late.timestamp - tx.timestamp) * rate // 10**18
+    released_after = (tx_end.timestamp - tx_late.timestamp) * rate // 10**18
+    claimed_early = voting_escrow.claim_rewards(token, {"from": early}).events["UserRewardsClaimed"]["amount"]
+    claimed_late = voting_escrow.claim_rewards(token, {"from": late}).events["UserRewardsClaimed"]["amount"]
+    assert claimed_early >= released_before * (1 - 1e-10)
+    assert claimed_late <= released_after
@@ -0,0 +1,79 @@
+import brownie
+from brownie import ZERO_ADDRESS, VotingEscrowSettings, interface
+
+
+def test_set_settings(chain, accounts, token, voting_escrow):
+    admin = VotingEscrowSettings.at(voting_escrow.address)
+    assert voting_escrow.settings_version() == 0
+    assert voting_escrow.max_pool_members() == 3
+    assert voting_escrow.min_stake_amount() == 10**18
+
+    tx = admin.set_settings(7, 3 * 10**18, 60, False, True, False, True, {"from": accounts[0]})
+    assert voting_escrow.settings_version() == 1
+    assert voting_escrow.max_pool_members() == 7
+    assert voting_escrow.min_stake_amount() == 3 * 10**18
+    assert voting_escrow.min_delay_between_manual_checkpoint() == 60
+    assert not voting_escrow.increase_amount_disabled()
+    assert voting_escrow.increase_unlock_time_disabled()
+    assert not voting_escrow.create_lock_disabled()
+    assert voting_escrow.withdraw_disabled()
+    assert set(tx.events.keys()) == {
+        "MaxPoolMembersSet", "MinStakeAmountSet", "MinDelayBetweenManualCheckpointSet",
+        "IncreaseUnlockTimeDisabledSet", "WithdrawDisabledSet",
+    }
+
+    # nothing changed - nothing written
+    tx = admin.set_settings(7, 3 * 10**18, 60, False, True, False, True, {"from": accounts[0]})
+    assert len(tx.events) == 0
+    assert voting_escrow.settings_version() == 1
+
+    with brownie.reverts("out of range"):
+        admin.set_settings(2**32, 1, 1, False, False, False, False, {"from": accounts[0]})
+    with brownie.reverts("not admin"):
+        admin.set_settings(1, 1, 1, False, False, False, False, {"from": accounts[1]})
+    with brownie.reverts("not changed"):
+        admin.set_max_pool_members(7, {"from": accounts[0]})
+
+    admin.set_max_pool_members(8, {"from": accounts[0]})
+    assert voting_escrow.settings_version() == 2
+    assert voting_escrow.min_stake_amount() == 3 * 10**18
+
+
+def test_pause(chain, accounts, token, voting_escrow):
+    admin = VotingEscrowSettings.at(voting_escrow.address)
+    user = accounts[1]
+    token.transfer(user, 10**18)
+    token.approve(voting_escrow, 10**18, {"from": user})
+
+    admin.pause({"from": accounts[0]})
+    assert voting_escrow.create_lock_disabled() and voting_escrow.withdraw_disabled()
+    assert voting_escrow.max_pool_members() == 3  # the numeric settings are kept
+    with brownie.reverts("create lock disabled"):
+        voting_escrow.create_lock(10**18, chain.time() + 365 * 86400, {"from": user})
+
+    admin.unpause({"from": accounts[0]})
+    voting_escrow.create_lock(10**18, chain.time() + 365 * 86400, {"from": user})
+    assert voting_escrow.settings_version() == 2
+
+    admin.enable_emergency({"from": accounts[0]})
+    assert voting_escrow.emergency()
+    with brownie.reverts("not allowed in emergency"):
+        voting_escrow.increase_unlock_time(chain.time() + 2 * 365 * 86400, {"from": user})
+
+
+def test_admin_interface(accounts, token, voting_escrow):
+    admin = interface.VotingEscrowAdmin(voting_escrow.address)
+    recipients = accounts[1:4]
+    token.transfer(voting_escrow, 3)
+    balances = [token.balanceOf(user) for user in recipients]
+
+    tokens = [token] * 3 + [ZERO_ADDRESS] * 27
+    tos = list(recipients) + [ZERO_ADDRESS] * 27
+    with brownie.reverts():
+        admin.emergency_withdraw_many(tokens, [1] * 3 + [0] * 27, tos, {"from": accounts[1]})
+    admin.emergency_withdraw_many(tokens, [1] * 3 + [0] * 27, tos, {"from": accounts[0]})
+    assert [token.balanceOf(user) - balance for user, balance in zip(recipients, balances)] == [1, 1, 1]
+
+    # only the admin functions are run by __default__
+    with brownie.reverts("dev: unknown function"):
+        accounts[0].transfer(voting_escrow, 0, data="0x12345678")
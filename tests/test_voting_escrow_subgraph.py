@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from scripts.stats.subgraph import SubgraphError, SubgraphFetcher
+
+QUERY = "query ($block: Int!, $first: Int!, $cursor: String!) { userBalances(...) { id weight } }"
+
+
+async def _serve(handler):
+    async def handle(request):
+        return await handler(request)
+
+    app = web.Application()
+    app.router.add_post("/", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/"
+
+
+def _balances(block):
+    # the number of holders grows with the block
+    return [{"id": f"0x{i:040x}", "weight": str(i * block)} for i in range(block * 10)]
+
+
+class StandIn:
+    """userBalances subgraph that fails the first requests and counts the concurrent ones"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if self.failures > 0:
+                self.failures -= 1
+                return web.Response(status=503 if self.failures % 2 else 429)
+            variables = (await request.json())["variables"]
+            rows = _balances(variables["block"])
+            if "cursor" in variables:
+                rows = [row for row in rows if row["id"] > variables["cursor"]]
+            else:
+                rows = rows[variables["skip"] :]
+            return web.json_response({"data": {"userBalances": rows[: variables["first"]]}})
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.mark.parametrize("cursor", [None, "id"])
+def test_fetch_snapshots(tmp_path, cursor):
+    blocks = list(range(1, 31))
+
+    async def run():
+        stand_in = StandIn(failures=4)
+        runner, url = await _serve(stand_in)
+        try:
+            fetcher = SubgraphFetcher(url, tmp_path, page_size=40, concurrency=5, backoff=0.01)
+            snapshots = await fetcher.fetch_snapshots(QUERY, "userBalances", blocks, cursor)
+            assert snapshots == [_balances(block) for block in blocks]
+            assert stand_in.max_in_flight <= 5
+            pages = sum(len(_balances(block)) // 40 + 1 for block in blocks)
+            assert fetcher.requests == pages + 4  # every failure is retried
+
+            # the pages at these blocks are cached on disk
+            fetcher = SubgraphFetcher(url, tmp_path, page_size=40)
+            assert await fetcher.fetch_snapshots(QUERY, "userBalances", blocks, cursor) == snapshots
+            assert fetcher.requests == 0
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_retries_exhausted():
+    async def run():
+        runner, url = await _serve(StandIn(failures=10))
+        try:
+            fetcher = SubgraphFetcher(url, retries=2, backoff=0.01)
+            with pytest.raises(SubgraphError):
+                await fetcher.fetch_snapshots(QUERY, "userBalances", [1])
+            assert fetcher.requests == 3
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "response",
+    [
+        lambda: web.json_response({"errors": [{"message": "indexing error"}]}),
+        lambda: web.json_response({"data": None}),
+        lambda: web.json_response([{"userBalances": []}]),
+        lambda: web.Response(text="<html>gateway</html>"),
+        lambda: web.Response(status=400),
+    ],
+)
+def test_fails_fast(response):
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        return response()
+
+    async def run():
+        runner, url = await _serve(handler)
+        try:
+            fetcher = SubgraphFetcher(url, retries=2, backoff=0.01)
+            with pytest.raises(SubgraphError):
+                await fetcher.fetch_snapshots(QUERY, "userBalances", [1])
+            assert len(requests) == 1  # a retry would get the same answer
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
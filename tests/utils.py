@@ -1,3 +1,8 @@
+from brownie import web3
+
+from scripts.stats.multicall import BatchReader
+
+
 def pretty_events(chain, txid):
     tx = chain.get_transaction(txid)
     print(f'{txid} events:')
@@ -23,40 +28,54 @@ def pretty_point(_):
 
 
 def print_slope_changes(voting_escrow):
-    keys = set()
-    i = 0
-    while True:
-        key = voting_escrow.slope_changes_keys(i)
-        if key == 0:
-            break
-        keys.add(key)
-        i += 1
-    keys = list(sorted(keys))
+    # the keys come one by one from the per-day bitmap through next_slope_change,
+    # only the values can be read in a batch
+    keys = []
+    key = voting_escrow.next_slope_change(voting_escrow.point_history(0)[2])
+    while key != 0:
+        keys.append(key)
+        key = voting_escrow.next_slope_change(key)
+    values = BatchReader(web3).read([(voting_escrow.slope_changes, key) for key in keys])
     print(f'slope_changes = [')
-    for key in keys:
-        print(f'    slope_changes({key}) = {voting_escrow.slope_changes(key)}')
+    for key, value in zip(keys, values):
+        print(f'    slope_changes({key}) = {value}')
     print(f']')
 
 
 def print_state(prefix, voting_escrow, user1, user2):
-    print(f'>>>> print_state {prefix=} {voting_escrow.epoch()=} <<<<')
-    print(f'{voting_escrow.supply()=}')
-    print(f'voting_escrow.locked(user1)= amount:{voting_escrow.locked(user1)[0]}, end:{voting_escrow.locked(user1)[1]}')
-    print(f'voting_escrow.locked(user2)= amount:{voting_escrow.locked(user2)[0]}, end:{voting_escrow.locked(user2)[1]}')
-    print(f'{voting_escrow.epoch()=}')
-    for i in range(15):
-        _ = voting_escrow.point_history(i)
+    # one JSON-RPC batch per step instead of a request per read
+    reader = BatchReader(web3)
+    epoch, supply, locked1, locked2, user_epoch1, user_epoch2, *points = reader.read(
+        [
+            (voting_escrow.epoch,),
+            (voting_escrow.supply,),
+            (voting_escrow.locked, user1),
+            (voting_escrow.locked, user2),
+            (voting_escrow.user_point_epoch, user1),
+            (voting_escrow.user_point_epoch, user2),
+        ]
+        + [(voting_escrow.point_history, i) for i in range(15)]
+    )
+    user_points = reader.read(
+        [(voting_escrow.user_point_history, user1, i) for i in range(user_epoch1 + 2)]
+        + [(voting_escrow.user_point_history, user2, i) for i in range(user_epoch2 + 2)]
+    )
+
+    print(f'>>>> print_state {prefix=} voting_escrow.epoch()={epoch} <<<<')
+    print(f'voting_escrow.supply()={supply}')
+    print(f'voting_escrow.locked(user1)= amount:{locked1[0]}, end:{locked1[1]}')
+    print(f'voting_escrow.locked(user2)= amount:{locked2[0]}, end:{locked2[1]}')
+    print(f'voting_escrow.epoch()={epoch}')
+    for i, _ in enumerate(points):
         print(f'point_history({i}) = {pretty_point(_)}')
         if list(_) == [0, 0, 0, 0]:
             break
 
-    for i in range(voting_escrow.user_point_epoch(user1)+2):
-        _ = voting_escrow.user_point_history(user1, i)
-        print(f'user_point_history(user1, {i}) = {pretty_point(_)}')
+    for i in range(user_epoch1 + 2):
+        print(f'user_point_history(user1, {i}) = {pretty_point(user_points[i])}')
 
-    for i in range(voting_escrow.user_point_epoch(user2)+2):
-        _ = voting_escrow.user_point_history(user2, i)
-        print(f'user_point_history(user2, {i}) = {pretty_point(_)}')
+    for i in range(user_epoch2 + 2):
+        print(f'user_point_history(user2, {i}) = {pretty_point(user_points[user_epoch1 + 2 + i])}')
 
     print_slope_changes(voting_escrow)
     print('')